@@ -9,9 +9,13 @@ Tech Stack: Flask, Anthropic Claude API, Python 3.11
 
 import os
 import re
+import hmac
+import asyncio
 import uuid
 import json
+import time
 import logging
+import itertools
 from datetime import datetime
 from pathlib import Path
 
@@ -23,22 +27,60 @@ from flask_talisman import Talisman
 from dotenv import load_dotenv
 import anthropic
 import bleach
+import httpx
 
 # Import existing utilities (they work with Flask too!)
 from config.questions import get_pre_questionnaire, get_post_questionnaire
-from config.prompts import get_prompt
+from config.prompts import get_transition_result, get_system_blocks
+from config.performance import (
+    CONVERSATIONS_DIR, CONVERSATION_CACHE_SIZE, CONVERSATION_TTL_SECONDS, CONVERSATION_PURGE_INTERVAL,
+    ANTHROPIC_MAX_CONNECTIONS, ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+    CLAUDE_CONNECT_TIMEOUT, CLAUDE_FIRST_TOKEN_TIMEOUT, CLAUDE_IDLE_TIMEOUT,
+    CLAUDE_MAX_RETRIES, CLAUDE_RETRY_BASE_DELAY, CLAUDE_RETRY_MAX_DELAY, AUTO_CONTINUATION_MODE,
+    MAX_CACHE_BREAKPOINTS, CACHE_CHECKPOINT_TURNS,
+    CONTEXT_KEEP_TURNS, CONTEXT_MAX_TURNS, CONTEXT_SUMMARY_MODEL, CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_SUMMARY_WAIT, CHAT_MODEL, MODEL_ROUTES, SSE_COALESCE_WINDOW_MS, SSE_COALESCE_MAX_CHARS, SSE_HEARTBEAT_INTERVAL,
+    SSE_REPLAY_DB, SSE_REPLAY_TTL, SSE_RESUME_GRACE, SSE_REPLAY_POLL_INTERVAL, SSE_REPLAY_FLUSH_INTERVAL,
+    GUNICORN_TIMEOUT,
+    CLAUDE_MAX_CONCURRENT_STREAMS, CLAUDE_ADMISSION_QUEUE, CLAUDE_ADMISSION_MAX_WAIT,
+    CACHE_WARMER_ENABLED, CACHE_WARMER_INTERVAL, CACHE_WARMER_ACTIVE_WINDOW, CACHE_WARMER_DAILY_BUDGET,
+    CACHE_WARMER_CHECK_INTERVAL, CACHE_WARMER_DB
+)
 from config.security import (
-    get_security_config, RATE_LIMITS, CSP, FORCE_HTTPS,
+    get_security_config, RATE_LIMITS, RATE_LIMIT_STORAGE_URL, RATE_LIMIT_STRATEGY, RATE_LIMIT_ENABLED, CSP, FORCE_HTTPS,
     MAX_CHAT_MESSAGE_LENGTH, MIN_CHAT_MESSAGE_LENGTH,
     VALID_SCALE_VALUES, PRE_QUESTIONNAIRE_COUNT, POST_QUESTIONNAIRE_COUNT,
-    MAX_MESSAGES_PER_SESSION, GENERIC_API_ERROR_MESSAGE
+    MAX_MESSAGES_PER_SESSION, MAX_TOKENS_PER_MESSAGE, GENERIC_API_ERROR_MESSAGE, BUSY_API_ERROR_MESSAGE,
+    API_CIRCUIT_BREAKER_THRESHOLD, API_CIRCUIT_BREAKER_TIMEOUT
 )
 from utils.storage import (
     save_pre_questionnaire,
     save_post_questionnaire,
     mark_chat_complete,
-    get_session_status
+    get_session_status,
+    get_questionnaire_aggregates,
+    get_session_counts
+)
+from utils.conversation_store import ConversationStore, new_conversation
+from utils.claude_client import ModelClient, CallPolicy, summarize_usage
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.admission import AdmissionController, AdmissionRejected
+from utils.cache_warmer import CacheWarmer
+from utils.request_builder import RequestBuilderCache
+from utils.context_window import ContextWindow
+from utils.sse import TextFrameCoalescer, StreamedAnswer, ClientDisconnected, HEARTBEAT_FRAME, ASYNC_BODY_KEY
+from utils.sse_replay import (
+    ReplayBuffer, ReplayStream, parse_event_id, stream_opened_frame, valid_idempotency_key, LIVE
+)
+from utils.metrics import (
+    registry as metrics_registry, histogram_stats, CHAT_TIME_TO_FIRST_TOKEN, CHAT_STREAM_DURATION,
+    CHAT_TOKENS_PER_SECOND, CLAUDE_TOKENS, AUTO_CONTINUATIONS, STATE_TRANSITIONS,
+    CHAT_MODEL_TIME_TO_FIRST_TOKEN, CHAT_MODEL_STREAM_DURATION, CHAT_MAX_TOKENS_STOPS,
+    CLIENT_DISCONNECTS, CHAT_DUPLICATE_REQUESTS, CHAT_ADMISSION_WAIT, CHAT_ADMISSION_REJECTIONS,
+    RATE_LIMIT_REJECTIONS, STORAGE_WRITE_SECONDS
 )
+from utils.export import EXPORT_FORMATS, iter_export, gzip_chunks
+import utils.rate_limit_storage  # noqa: F401 - registers the sqlite:// limiter storage
 
 # Load environment variables
 load_dotenv()
@@ -62,19 +104,110 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Initialize Anthropic client
+# Timeouts and retries for every Claude call. The SDK's own retries are
+# disabled so a stream is never replayed after text reached the browser.
+call_policy = CallPolicy(
+    connect_timeout=CLAUDE_CONNECT_TIMEOUT,
+    first_token_timeout=CLAUDE_FIRST_TOKEN_TIMEOUT,
+    idle_timeout=CLAUDE_IDLE_TIMEOUT,
+    max_retries=CLAUDE_MAX_RETRIES,
+    retry_base_delay=CLAUDE_RETRY_BASE_DELAY,
+    retry_max_delay=CLAUDE_RETRY_MAX_DELAY
+)
+
+# One client per worker process, shared by all concurrent streams (thread- and
+# greenlet-safe). The pool is sized for gthread/gevent workers serving many streams.
 try:
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    client = anthropic.Anthropic(
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        max_retries=0,
+        timeout=call_policy.http_timeout(),
+        http_client=anthropic.DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                max_keepalive_connections=ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+    )
 except Exception as e:
-    print(f"ERROR: Failed to initialize Anthropic client: {e}")
+    # Without a client every chat request fails: Gunicorn workers refuse to
+    # boot (see gunicorn.conf.py) and /_health reports unhealthy
+    logger.error(f"Failed to initialize Anthropic client: {e!r}")
     client = None
 
+# All Claude calls go through model_client, guarded by one circuit breaker
+# per worker process
+model_client = ModelClient(
+    client,
+    breaker=CircuitBreaker(API_CIRCUIT_BREAKER_THRESHOLD, API_CIRCUIT_BREAKER_TIMEOUT),
+    policy=call_policy
+)
+
+
+def create_async_client():
+    """
+    AsyncAnthropic client for model_client.astream(), configured like the
+    blocking client. Created by asgi.py, whose chat streams run on the
+    worker's event loop; None if it cannot be created.
+    """
+    try:
+        return anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            max_retries=0,
+            timeout=call_policy.http_timeout(),
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=ANTHROPIC_MAX_CONNECTIONS,
+                    max_keepalive_connections=ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+        )
+    except Exception as e:
+        # Chat streams fall back to the blocking client in a thread
+        logger.error(f"Failed to initialize async Anthropic client: {e!r}")
+        return None
+
+
+# At most CLAUDE_MAX_CONCURRENT_STREAMS chat responses per worker stream from
+# Claude at once; a short FIFO queue absorbs bursts, beyond it requests get a 503
+admission = AdmissionController(CLAUDE_MAX_CONCURRENT_STREAMS, CLAUDE_ADMISSION_QUEUE)
+
 # Initialize security extensions
 csrf = CSRFProtect(app)
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=[RATE_LIMITS.get('chat', '20 per hour')],
-    storage_uri="memory://"
+    storage_uri=RATE_LIMIT_STORAGE_URL,
+    strategy=RATE_LIMIT_STRATEGY,
+    enabled=RATE_LIMIT_ENABLED
+)
+
+# Server-side conversation store (cookie only carries the session_id)
+conversation_store = ConversationStore(
+    CONVERSATIONS_DIR,
+    max_cached=CONVERSATION_CACHE_SIZE,
+    ttl_seconds=CONVERSATION_TTL_SECONDS,
+    purge_interval=CONVERSATION_PURGE_INTERVAL
+)
+
+# Incremental Claude request payloads with cache breakpoints, one per conversation
+request_builders = RequestBuilderCache(
+    max_size=CONVERSATION_CACHE_SIZE,
+    breakpoint_interval=CACHE_CHECKPOINT_TURNS * 2,
+    max_breakpoints=MAX_CACHE_BREAKPOINTS
+)
+
+# Frames of recent chat streams, so a dropped connection can resume on any worker
+replay_buffer = ReplayBuffer(SSE_REPLAY_DB, ttl_seconds=SSE_REPLAY_TTL, flush_interval=SSE_REPLAY_FLUSH_INTERVAL)
+
+# Bounded context: old turns are replaced by a running summary per conversation
+context_window = ContextWindow(
+    model_client,
+    keep_turns=CONTEXT_KEEP_TURNS,
+    max_turns=CONTEXT_MAX_TURNS,
+    model=CONTEXT_SUMMARY_MODEL,
+    max_tokens=CONTEXT_SUMMARY_MAX_TOKENS
 )
 
 # Initialize Talisman for security headers
@@ -90,9 +223,10 @@ talisman = Talisman(
 
 
 # ============================================================================
-# System prompt is loaded from config/prompts/system.md
+# System prompt is loaded from config/prompts/system.md + state.md
 # ============================================================================
-# get_prompt() imported from config.prompts - injects state and interaction_count
+# request_builders (utils/request_builder.py) sends system.md as the cached
+# prefix and appends the state block uncached to the latest user turn
 
 
 # ============================================================================
@@ -177,12 +311,13 @@ def validate_questionnaire_answers(answers, expected_count):
     return True, None
 
 
-def check_session_message_limit():
+def check_session_message_limit(conversation):
     """
     Check if the session has exceeded the message limit.
     Returns: (is_within_limit, error_message)
     """
-    message_count = len(session.get('messages', []))
+    # Tool result turns of auto-continuations are not chat messages
+    message_count = sum(1 for msg in conversation.get('messages', []) if 'tool_result' not in msg)
     if message_count >= MAX_MESSAGES_PER_SESSION * 2:  # *2 because includes both user and assistant
         logger.warning(f"Session {session.get('session_id')} exceeded message limit")
         return False, "Du hast die maximale Anzahl an Nachrichten für diese Session erreicht."
@@ -190,6 +325,26 @@ def check_session_message_limit():
     return True, None
 
 
+def check_admin_token():
+    """
+    Check the ADMIN_TOKEN (query parameter or Bearer header) for admin endpoints.
+    Returns: error response tuple, or None if authorized
+    """
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({'error': 'Admin access not configured'}), 403
+
+    provided_token = request.args.get('token')
+    auth_header = request.headers.get('Authorization', '')
+    if not provided_token and auth_header.startswith('Bearer '):
+        provided_token = auth_header[len('Bearer '):]
+    if not provided_token or not hmac.compare_digest(provided_token.encode(), admin_token.encode()):
+        logger.warning(f"Unauthorized admin access attempt from {request.remote_addr}")
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return None
+
+
 def validate_session_id(session_id):
     """
     Validate session ID format (UUID).
@@ -220,6 +375,7 @@ def handle_csrf_error(e):
 def handle_rate_limit(e):
     """Handle rate limit errors."""
     logger.warning(f"Rate limit exceeded: {request.remote_addr}")
+    RATE_LIMIT_REJECTIONS.inc(endpoint=request.endpoint or 'unknown')
     return jsonify({'error': 'Zu viele Anfragen. Bitte warte einen Moment und versuche es erneut.'}), 429
 
 
@@ -245,77 +401,162 @@ def get_or_create_session_id():
     """Get existing session ID or create new one."""
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
+    # Chat state lives in the conversation store; drop keys left by older cookies
+    for legacy_key in ('messages', 'current_state', 'interaction_count', 'session_completed'):
+        session.pop(legacy_key, None)
     return session['session_id']
 
 
-def initialize_chat_session():
-    """Initialize chat-related session variables."""
-    if 'messages' not in session:
-        session['messages'] = []
-    if 'current_state' not in session:
-        session['current_state'] = 'intake'
-    if 'interaction_count' not in session:
-        session['interaction_count'] = 0
-    if 'session_completed' not in session:
-        session['session_completed'] = False
+def load_conversation():
+    """Load the server-side conversation for the current session."""
+    return conversation_store.load(get_or_create_session_id())
+
+
+def save_conversation(conversation, session_id=None):
+    """Persist the conversation for the current (or given) session."""
+    with STORAGE_WRITE_SECONDS.time(operation='conversation'):
+        conversation_store.save(session_id or get_or_create_session_id(), conversation)
 
 
 def reset_chat_session():
     """Reset chat session to start fresh. Preserves session_id for questionnaire linking."""
-    session['messages'] = []
-    session['current_state'] = 'intake'
-    session['interaction_count'] = 0
-    session['session_completed'] = False
-    session.modified = True
+    conversation = new_conversation()
+    save_conversation(conversation)
+    return conversation
+
+
+def log_cache_usage(session_id, usage, state, label="Cache metrics"):
+    """Log per-turn prompt cache usage (cache reads vs. cache creation)."""
+    summary = summarize_usage(usage)
+    logger.info(
+        f"Session {session_id} - {label}: "
+        f"created={summary['cache_creation']}, "
+        f"read={summary['cache_read']}, "
+        f"input={summary['input']}, "
+        f"total_input={summary['total_input']}, "
+        f"hit_ratio={summary['cache_hit_ratio']:.2f}, "
+        f"state={state}"
+    )
+    for token_type in ('cache_creation', 'cache_read', 'input', 'output'):
+        CLAUDE_TOKENS.inc(summary[token_type], type=token_type, state=state)
+    return summary
+
+
+def model_route(state):
+    """Model, max_tokens and sampling parameters for a conversation state (see MODEL_ROUTES)."""
+    route = MODEL_ROUTES.get(state, {"model": CHAT_MODEL, "max_tokens": MAX_TOKENS_PER_MESSAGE})
+    params = {'model': route['model'], 'max_tokens': min(route['max_tokens'], MAX_TOKENS_PER_MESSAGE)}
+    if route.get('temperature') is not None:
+        params['temperature'] = route['temperature']
+    return params
+
+
+def cache_warm_request(state):
+    """Smallest request that reads the cached prefix (tools + system prompt) of a state's model."""
+    return {
+        'model': model_route(state)['model'],
+        'max_tokens': 1,
+        'tools': [TRANSITION_TOOL],
+        'system': get_system_blocks(),
+        'messages': [{'role': 'user', 'content': '.'}]
+    }
+
+
+# Optional: one worker keeps the cached prefix of every routed model alive
+# while chat traffic is active (off by default, daily token budget)
+cache_warmer = CacheWarmer(
+    model_client, cache_warm_request, MODEL_ROUTES,
+    db_path=CACHE_WARMER_DB,
+    lock_path=str(Path(CACHE_WARMER_DB).with_suffix('.lock')),
+    interval=CACHE_WARMER_INTERVAL,
+    active_window=CACHE_WARMER_ACTIVE_WINDOW,
+    daily_budget=CACHE_WARMER_DAILY_BUDGET,
+    check_interval=CACHE_WARMER_CHECK_INTERVAL,
+    enabled=CACHE_WARMER_ENABLED
+)
+
+
+def record_stream_metrics(state, call, route, duration, ttft, usage, stop_reason=None):
+    """Record latency and throughput of one Claude stream ("first" or "continuation")."""
+    model = route['model']
+    CHAT_STREAM_DURATION.observe(duration, state=state, call=call)
+    CHAT_MODEL_STREAM_DURATION.observe(duration, state=state, model=model)
+    if stop_reason == 'max_tokens':
+        # The routed cap is too tight for this state
+        CHAT_MAX_TOKENS_STOPS.inc(state=state, model=model)
+        logger.warning(f"Response in state {state} hit max_tokens={route['max_tokens']} ({model})")
+    if ttft is None:
+        return  # Tool-only response, no text was streamed
+    CHAT_TIME_TO_FIRST_TOKEN.observe(ttft, state=state, call=call)
+    CHAT_MODEL_TIME_TO_FIRST_TOKEN.observe(ttft, state=state, model=model)
+    if duration > ttft and usage['output']:
+        CHAT_TOKENS_PER_SECOND.observe(usage['output'] / (duration - ttft), state=state)
+
+
+def record_interrupted_answer(conversation, session_id, stage, partial_text):
+    """Keep the part of an answer that was generated before the client disconnected."""
+    CLIENT_DISCONNECTS.inc(stage=stage)
+    logger.info(
+        f"Session {session_id} - Client disconnected during {stage} response, "
+        f"upstream stream closed after {len(partial_text)} characters"
+    )
+    if stage != 'finishing' and partial_text.strip():
+        conversation['messages'].append({
+            'role': 'assistant',
+            'content': partial_text,
+            'interrupted': True
+        })
+        save_conversation(conversation, session_id)
+
+
+def replay_response(stream_id, after_seq, opened=False):
+    """SSE response with the buffered events of a stream after after_seq, then its live tail."""
+    frames = replay_buffer.tail(
+        stream_id, after_seq, GENERIC_API_ERROR_MESSAGE,
+        poll_interval=SSE_REPLAY_POLL_INTERVAL,
+        heartbeat_interval=SSE_HEARTBEAT_INTERVAL,
+        max_seconds=GUNICORN_TIMEOUT
+    )
+    if opened:
+        frames = itertools.chain([stream_opened_frame(stream_id)], frames)
+    return Response(stream_with_context(frames), mimetype='text/event-stream')
+
+
+def attach_to_stream(session_id, stream_id):
+    """Answers a duplicate /api/chat request with the stream of the original one."""
+    stream_info = replay_buffer.stream(stream_id) or {}
+    status = 'in_flight' if stream_info.get('status') == LIVE else 'completed'
+    CHAT_DUPLICATE_REQUESTS.inc(status=status)
+    logger.info(f"Duplicate chat request for session {session_id} attached to {status} stream {stream_id}")
+    return replay_response(stream_id, 0, opened=True)
 
 
-def get_ai_response(user_message):
+def get_ai_response(conversation, user_message):
     """
     Get AI response using Claude API with state machine logic (non-streaming version).
     Returns: (response_text, new_state or None)
     """
-    if not client:
+    if not model_client.available:
         return "Fehler: AI-Service nicht verfügbar. Bitte kontaktiere den Administrator.", None
 
-    # Get current state and build system prompt with prompt caching
-    current_state = session.get('current_state', 'intake')
-    interaction_count = session.get('interaction_count', 0)
-    system_prompt_text = get_prompt(current_state, interaction_count)
-
-    # Convert to array format with cache_control for prompt caching
-    system_prompt = [{
-        "type": "text",
-        "text": system_prompt_text,
-        "cache_control": {"type": "ephemeral"}
-    }]
-
-    # Build messages for API
-    messages = []
-    for msg in session.get('messages', []):
-        messages.append({
-            "role": msg['role'],
-            "content": msg['content']
-        })
-
-    # Add current user message
-    messages.append({
-        "role": "user",
-        "content": user_message
-    })
-
-    # Add cache_control to second-to-last message to cache conversation history
-    # This caches everything except the current user message
-    if len(messages) >= 2:
-        messages[-2]["cache_control"] = {"type": "ephemeral"}
+    # Get current state and build request (system prompt + messages with prompt caching)
+    current_state = conversation.get('current_state', 'intake')
+    interaction_count = conversation.get('interaction_count', 0)
+    session_id = session.get('session_id', 'unknown')
+    payload = request_builders.get(session_id).build(
+        context_window.request_messages(conversation) + [{'role': 'user', 'content': user_message}],
+        current_state,
+        interaction_count
+    )
 
     try:
         # Call Claude API with transition tool
-        response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=1024,
-            system=system_prompt,
-            messages=messages,
-            tools=[TRANSITION_TOOL]
+        route = model_route(current_state)
+        cache_warmer.record_use(route['model'])
+        response = model_client.create(
+            **route,
+            tools=[TRANSITION_TOOL],
+            **payload
         )
 
         # Extract text response
@@ -329,23 +570,12 @@ def get_ai_response(user_message):
                     new_state = block.input.get("state")
 
         # Log cache performance metrics
-        usage = response.usage
-        cache_creation = getattr(usage, 'cache_creation_input_tokens', 0)
-        cache_read = getattr(usage, 'cache_read_input_tokens', 0)
-        input_tokens = getattr(usage, 'input_tokens', 0)
-
-        session_id = session.get('session_id', 'unknown')
-        logger.info(
-            f"Session {session_id} - Cache metrics: "
-            f"created={cache_creation}, "
-            f"read={cache_read}, "
-            f"input={input_tokens}, "
-            f"total_input={cache_creation + cache_read + input_tokens}, "
-            f"state={current_state}"
-        )
+        log_cache_usage(session_id, response.usage, current_state)
 
         return ai_message, new_state
 
+    except CircuitOpenError:
+        return GENERIC_API_ERROR_MESSAGE, None
     except Exception as e:
         logger.error(f"Error in get_ai_response: {str(e)}")
         return f"Fehler bei der AI-Antwort: {str(e)}", None
@@ -418,20 +648,21 @@ def chat():
     session_id = get_or_create_session_id()
 
     # Reset chat session on each visit to start fresh
-    reset_chat_session()
+    conversation = reset_chat_session()
 
     # Add welcome message
     welcome_msg = "Hallo! Ich bin hier, um dir zu helfen, deine Prokrastination zu verstehen und zu überwinden. Erzähl mir: Welche Aufgabe schiebst du gerade vor dir her?"
-    session['messages'] = [{
+    conversation['messages'] = [{
         'role': 'assistant',
         'content': welcome_msg
     }]
+    save_conversation(conversation)
 
     return render_template(
         'chat.html',
-        messages=session.get('messages', []),
-        state=session.get('current_state', 'intake'),
-        session_completed=session.get('session_completed', False)
+        messages=conversation['messages'],
+        state=conversation['current_state'],
+        session_completed=conversation['session_completed']
     )
 
 
@@ -440,15 +671,26 @@ def chat():
 def chat_api():
     """Streaming chat endpoint using Server-Sent Events (SSE)."""
     session_id = get_or_create_session_id()
-    initialize_chat_session()
 
     # Validate session ID
     if not validate_session_id(session_id):
         logger.warning(f"Invalid session ID in chat: {session_id}")
         return jsonify({'error': 'Ungültige Session'}), 400
 
+    # Duplicate submit (double click, client retry): attach to the earlier
+    # request's stream instead of adding the message and calling Claude again
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None and not valid_idempotency_key(idempotency_key):
+        return jsonify({'error': 'Ungültiger Idempotency-Key'}), 400
+    if idempotency_key:
+        existing_stream = replay_buffer.find(session_id, idempotency_key)
+        if existing_stream:
+            return attach_to_stream(session_id, existing_stream)
+
+    conversation = load_conversation()
+
     # Check message limit
-    is_within_limit, limit_error = check_session_message_limit()
+    is_within_limit, limit_error = check_session_message_limit(conversation)
     if not is_within_limit:
         return jsonify({'error': limit_error}), 429
 
@@ -465,226 +707,414 @@ def chat_api():
         logger.warning(f"Invalid chat message: {validation_error}")
         return jsonify({'error': validation_error}), 400
 
+    # Fail fast while the Claude API is known to be down (before touching the history)
+    if model_client.breaker.is_open:
+        response = jsonify({'error': GENERIC_API_ERROR_MESSAGE})
+        response.headers['Retry-After'] = str(max(1, round(model_client.breaker.retry_after())))
+        return response, 503
+
+    # Take a Claude slot or a place in the wait queue; fail fast when the queue is full
+    try:
+        ticket = admission.enter()
+    except AdmissionRejected as e:
+        CHAT_ADMISSION_REJECTIONS.inc()
+        logger.warning(f"Chat request for session {session_id} rejected: {e}")
+        response = jsonify({'error': BUSY_API_ERROR_MESSAGE, 'retry_after': round(e.retry_after)})
+        response.headers['Retry-After'] = str(round(e.retry_after))
+        return response, 503
+
+    try:
+        # Claim the key before touching the history (a concurrent duplicate may have won)
+        stream_id, created = replay_buffer.open(session_id, idempotency_key)
+        if not created:
+            ticket.release()
+            return attach_to_stream(session_id, stream_id)
+        response = start_chat_stream(conversation, session_id, user_message, stream_id, ticket)
+    except BaseException:
+        ticket.release()
+        raise
+    # The slot is freed once the response is closed (finished, failed or abandoned)
+    response.call_on_close(ticket.release)
+    return response
+
+
+def transition_call(final_message):
+    """The transition_state tool call of a response, or None."""
+    for block in final_message.content:
+        if hasattr(block, 'type') and block.type == "tool_use" and block.name == "transition_state":
+            return block
+    return None
+
+
+def store_first_answer(conversation, session_id, current_state, answer, route):
+    """
+    Records the first answer of a chat turn: metrics, the history and a phase
+    change requested via the transition tool, then persists the conversation.
+
+    Returns:
+        str: New state, or None if the model did not call transition_state
+    """
+    final_message = answer.final_message
+
+    # Log cache performance metrics
+    usage = log_cache_usage(session_id, final_message.usage, current_state)
+    record_stream_metrics(
+        current_state, 'first', route, answer.duration, answer.first_token_time, usage, final_message.stop_reason
+    )
+
+    # Check for state transition via tool use
+    new_state = None
+    tool_call = transition_call(final_message)
+    if tool_call is not None:
+        new_state = tool_call.input.get("state")
+        logger.info(f"State transition via tool: {current_state} -> {new_state}")
+
+    use_tool_result = new_state and AUTO_CONTINUATION_MODE == 'tool_result'
+
+    # Store first AI response in session (only if non-empty)
+    # When the model only calls a tool without text, answer.text is empty
+    if use_tool_result:
+        # Keep the tool call and answer it, so the continuation request is
+        # the cached conversation plus one small uncached turn
+        conversation['messages'].append({
+            'role': 'assistant',
+            'content': answer.text,
+            'tool_use': {
+                'id': tool_call.id,
+                'name': tool_call.name,
+                'input': dict(tool_call.input)
+            }
+        })
+        conversation['messages'].append({
+            'role': 'user',
+            'content': '',
+            'tool_result': {
+                'tool_use_id': tool_call.id,
+                'content': get_transition_result(new_state)
+            }
+        })
+    elif answer.text.strip():
+        conversation['messages'].append({
+            'role': 'assistant',
+            'content': answer.text
+        })
+
+    # Handle state transition with auto-continuation
+    if new_state:
+        STATE_TRANSITIONS.inc(from_state=current_state, to_state=new_state)
+        # Update state
+        conversation['current_state'] = new_state
+        if new_state == 'strategies':
+            conversation['interaction_count'] = 0
+        elif new_state == 'completion':
+            conversation['session_completed'] = True
+            mark_chat_complete(session_id)
+
+    # Persist the first response before any continuation streams
+    save_conversation(conversation, session_id)
+    return new_state
+
+
+def store_continuation(conversation, session_id, new_state, answer, route):
+    """Records the auto-continuation answer in the new state: metrics and history."""
+    final_continuation = answer.final_message
+
+    # Log continuation cache metrics and latency (compare the two modes)
+    usage = log_cache_usage(
+        session_id, final_continuation.usage, new_state, label="Continuation cache metrics"
+    )
+    logger.info(
+        f"Continuation latency: mode={AUTO_CONTINUATION_MODE}, "
+        f"ttft_ms={(answer.first_token_time or answer.duration) * 1000:.0f}, "
+        f"duration_ms={answer.duration * 1000:.0f}, "
+        f"uncached_input={usage['input'] + usage['cache_creation']}, state={new_state}, "
+        f"model={route['model']}"
+    )
+    AUTO_CONTINUATIONS.inc(state=new_state)
+    record_stream_metrics(
+        new_state, 'continuation', route, answer.duration, answer.first_token_time, usage,
+        final_continuation.stop_reason
+    )
+
+    # Store continuation response in session (only if non-empty)
+    if answer.text.strip():
+        conversation['messages'].append({
+            'role': 'assistant',
+            'content': answer.text
+        })
+        save_conversation(conversation, session_id)
+
+
+def store_summary(conversation, session_id, summary):
+    """Stores a refreshed context summary; it is used from the next request on."""
+    if summary and summary['text']:
+        conversation['summary'] = summary
+        save_conversation(conversation, session_id)
+
+
+def chat_metadata(first, continuation, new_state):
+    """Final metadata event of a chat response."""
+    return {
+        'type': 'metadata',
+        'full_text': first.text + " " + continuation.text if continuation else first.text,
+        'new_state': new_state,
+        'session_completed': new_state == 'completion',
+        'auto_continued': bool(new_state)
+    }
+
+
+def error_frame(message):
+    return f"data: {json.dumps({'type': 'error', 'message': message})}\n\n"
+
+
+def start_chat_stream(conversation, session_id, user_message, stream_id, ticket):
+    """
+    Adds the user message to the history and returns the SSE response that answers it.
+
+    Under the ASGI bridge (asgi.py) with an AsyncAnthropic client, the answer
+    is produced by an async generator on the worker's event loop; otherwise by
+    a generator that holds the request thread. Both run the same steps.
+    """
     # Sanitize message
     user_message = sanitize_text(user_message.strip())
 
     # Add user message to history
-    session['messages'].append({
+    conversation['messages'].append({
         'role': 'user',
         'content': user_message
     })
-    session.modified = True  # Ensure Flask saves the modified session
 
     # Increment interaction count for strategies state
-    current_state = session.get('current_state', 'intake')
+    current_state = conversation.get('current_state', 'intake')
     if current_state == 'strategies':
-        session['interaction_count'] = session.get('interaction_count', 0) + 1
-        session.modified = True  # Ensure Flask saves the modified session
+        conversation['interaction_count'] = conversation.get('interaction_count', 0) + 1
+
+    save_conversation(conversation)
+    # Numbered, buffered frames: a dropped connection can resume via /api/chat/resume
+    replay = ReplayStream(replay_buffer, stream_id, request.environ, SSE_RESUME_GRACE)
+
+    def first_request():
+        """Request of the first answer; starts a summary refresh next to it if the window is full."""
+        # Build request incrementally (system prompt + summary + recent messages)
+        request_builder = request_builders.get(session_id)
+        payload = request_builder.build(
+            context_window.request_messages(conversation),
+            current_state,
+            conversation.get('interaction_count', 0)
+        )
+        summary_job = None
+        if context_window.needs_refresh(conversation):
+            summary_job = context_window.start_refresh(conversation, session_id)
+        return request_builder, payload, summary_job
+
+    def continuation_request(request_builder, new_state, summary_job):
+        """Request of the continuation in the new state ("tool_result" answers the tool call,
+        "rebuild" re-sends the history ending in the first response)."""
+        # Phase change: fold the finished phase into the summary during the continuation
+        if summary_job is None and context_window.needs_refresh(conversation):
+            summary_job = context_window.start_refresh(conversation, session_id)
+        logger.info(
+            f"Auto-continuation: Generating response in new state '{new_state}' "
+            f"(mode={AUTO_CONTINUATION_MODE})"
+        )
+        payload = request_builder.build(
+            context_window.request_messages(conversation),
+            new_state,
+            conversation.get('interaction_count', 0)
+        )
+        return payload, summary_job
+
+    def stream_params(state, payload):
+        route = model_route(state)
+        cache_warmer.record_use(route['model'])
+        return route, {**route, 'tools': [TRANSITION_TOOL], **payload}
+
+    def new_frames():
+        # Deltas that arrive close together are merged into one SSE frame
+        return TextFrameCoalescer(SSE_COALESCE_WINDOW_MS / 1000, SSE_COALESCE_MAX_CHARS)
 
     def generate():
         """Generator function for SSE stream."""
+        # Progress, so a disconnect can close the right upstream call and keep the partial answer
+        stage = 'first'
+        upstream = first = continuation = None
         try:
-            if not client:
+            if not model_client.available:
                 logger.error("Anthropic client not available")
-                yield f"data: {json.dumps({'type': 'error', 'message': GENERIC_API_ERROR_MESSAGE})}\n\n"
+                yield error_frame(GENERIC_API_ERROR_MESSAGE)
                 return
 
-            # Build system prompt with prompt caching
-            interaction_count = session.get('interaction_count', 0)
-            system_prompt_text = get_prompt(current_state, interaction_count)
-
-            # Convert to array format with cache_control for prompt caching
-            system_prompt = [{
-                "type": "text",
-                "text": system_prompt_text,
-                "cache_control": {"type": "ephemeral"}
-            }]
-
-            # Build messages for API (with content as array for caching support)
-            session_messages = session.get('messages', [])
-            messages = []
-            for idx, msg in enumerate(session_messages):
-                # Convert content to array format required for prompt caching
-                message = {
-                    "role": msg['role'],
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": msg['content']
-                        }
-                    ]
-                }
-
-                # Add cache_control to second-to-last message's content block
-                # This caches conversation history (everything except current user message)
-                if len(session_messages) >= 2 and idx == len(session_messages) - 2:
-                    message["content"][0]["cache_control"] = {"type": "ephemeral"}
-
-                messages.append(message)
+            # Queued behind other responses: report the position until a slot is free
+            if not ticket.admitted:
+                outcome = 'left'
+                try:
+                    for position in ticket.positions(CLAUDE_ADMISSION_MAX_WAIT, SSE_HEARTBEAT_INTERVAL):
+                        yield f"data: {json.dumps({'type': 'queue', 'position': position})}\n\n"
+                        if replay.abandoned():
+                            raise ClientDisconnected()
+                    outcome = 'admitted' if ticket.admitted else 'timed_out'
+                finally:
+                    CHAT_ADMISSION_WAIT.observe(ticket.waited, outcome=outcome)
+                if not ticket.admitted:
+                    ticket.release()
+                    logger.warning(f"Chat request for session {session_id} timed out in the admission queue")
+                    yield error_frame(BUSY_API_ERROR_MESSAGE)
+                    return
+
+            request_builder, request_payload, summary_job = first_request()
 
             # Stream from Claude API with transition tool
-            full_response = ""
-            with client.messages.stream(
-                model="claude-sonnet-4-5-20250929",
-                max_tokens=1024,
-                system=system_prompt,
-                messages=messages,
-                tools=[TRANSITION_TOOL]
-            ) as stream:
-                for text in stream.text_stream:
-                    full_response += text
-                    # Send each chunk as SSE (tool calls don't appear here)
-                    yield f"data: {json.dumps({'text': text})}\n\n"
-
-                # Get final message and usage metrics
-                final_message = stream.get_final_message()
-                usage = final_message.usage
-
-                # Log cache performance metrics
-                cache_creation = getattr(usage, 'cache_creation_input_tokens', 0)
-                cache_read = getattr(usage, 'cache_read_input_tokens', 0)
-                input_tokens = getattr(usage, 'input_tokens', 0)
-
-                logger.info(
-                    f"Session {session_id} - Cache metrics: "
-                    f"created={cache_creation}, "
-                    f"read={cache_read}, "
-                    f"input={input_tokens}, "
-                    f"total_input={cache_creation + cache_read + input_tokens}, "
-                    f"state={current_state}"
-                )
+            frames = new_frames()
+            route, params = stream_params(current_state, request_payload)
+            upstream = first = StreamedAnswer(model_client.stream(**params), frames)
+            yield from first
 
-            # Check for state transition via tool use
-            new_state = None
-            for block in final_message.content:
-                if hasattr(block, 'type') and block.type == "tool_use":
-                    if block.name == "transition_state":
-                        new_state = block.input.get("state")
-                        logger.info(f"State transition via tool: {current_state} -> {new_state}")
-                        break
-
-            # Store first AI response in session (only if non-empty)
-            # When the model only calls a tool without text, full_response is empty
-            if full_response.strip():
-                session['messages'].append({
-                    'role': 'assistant',
-                    'content': full_response
-                })
-                session.modified = True
-
-            # Handle state transition with auto-continuation
-            if new_state:
-                # Update state
-                session['current_state'] = new_state
-                if new_state == 'strategies':
-                    session['interaction_count'] = 0
-                elif new_state == 'completion':
-                    session['session_completed'] = True
-                    mark_chat_complete(session_id)
+            new_state = store_first_answer(conversation, session_id, current_state, first, route)
 
-                session.modified = True
+            if new_state:
+                stage = 'continuation'
+                # Don't pay for a continuation nobody will read
+                yield HEARTBEAT_FRAME
+                if replay.abandoned():
+                    raise ClientDisconnected()
 
                 # AUTO-CONTINUATION: Generate second response in new state
-                logger.info(f"Auto-continuation: Generating response in new state '{new_state}'")
-
-                # Build new system prompt for the transitioned state
-                interaction_count = session.get('interaction_count', 0)
-                new_system_prompt_text = get_prompt(new_state, interaction_count)
-
-                # Convert to array format with cache_control
-                new_system_prompt = [{
-                    "type": "text",
-                    "text": new_system_prompt_text,
-                    "cache_control": {"type": "ephemeral"}
-                }]
-
-                # Build messages including the first response (with content as array for caching)
-                continuation_session_messages = session.get('messages', [])
-                # Filter out any empty messages to prevent API errors
-                continuation_session_messages = [m for m in continuation_session_messages if m.get('content', '').strip()]
-                continuation_messages = []
-                for idx, msg in enumerate(continuation_session_messages):
-                    # Convert content to array format required for prompt caching
-                    message = {
-                        "role": msg['role'],
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": msg['content']
-                            }
-                        ]
-                    }
-
-                    # Add cache_control to second-to-last message's content block
-                    if len(continuation_session_messages) >= 2 and idx == len(continuation_session_messages) - 2:
-                        message["content"][0]["cache_control"] = {"type": "ephemeral"}
-
-                    continuation_messages.append(message)
-
-                # Stream second response (continuation in new state)
-                continuation_response = ""
-                with client.messages.stream(
-                    model="claude-sonnet-4-5-20250929",
-                    max_tokens=1024,
-                    system=new_system_prompt,
-                    messages=continuation_messages,
-                    tools=[TRANSITION_TOOL]
-                ) as stream:
-                    for text in stream.text_stream:
-                        continuation_response += text
-                        # Send continuation chunks as SSE
-                        yield f"data: {json.dumps({'text': text})}\n\n"
-
-                    # Get usage metrics for continuation
-                    final_continuation = stream.get_final_message()
-                    continuation_usage = final_continuation.usage
-
-                    # Log continuation cache metrics
-                    logger.info(
-                        f"Session {session_id} - Continuation cache metrics: "
-                        f"created={getattr(continuation_usage, 'cache_creation_input_tokens', 0)}, "
-                        f"read={getattr(continuation_usage, 'cache_read_input_tokens', 0)}, "
-                        f"input={getattr(continuation_usage, 'input_tokens', 0)}, "
-                        f"state={new_state}"
-                    )
-
-                # Store continuation response in session (only if non-empty)
-                if continuation_response.strip():
-                    session['messages'].append({
-                        'role': 'assistant',
-                        'content': continuation_response
-                    })
-                    session.modified = True
-
-                # Prepare final metadata (after continuation)
-                metadata = {
-                    'type': 'metadata',
-                    'full_text': full_response + " " + continuation_response,
-                    'new_state': new_state,
-                    'session_completed': new_state == 'completion',
-                    'auto_continued': True
-                }
-
-            else:
-                # No transition - prepare metadata normally
-                metadata = {
-                    'type': 'metadata',
-                    'full_text': full_response,
-                    'new_state': None,
-                    'session_completed': False,
-                    'auto_continued': False
-                }
+                continuation_payload, summary_job = continuation_request(request_builder, new_state, summary_job)
+                continuation_route, params = stream_params(new_state, continuation_payload)
+                upstream = continuation = StreamedAnswer(model_client.stream(**params), frames)
+                yield from continuation
+                store_continuation(conversation, session_id, new_state, continuation, continuation_route)
+
+            # Store the refreshed summary; it is used from the next request on.
+            # Heartbeats while waiting notice a client that has already left.
+            stage = 'finishing'
+            if summary_job is not None:
+                wait_until = time.monotonic() + CONTEXT_SUMMARY_WAIT
+                while not summary_job.done() and time.monotonic() < wait_until:
+                    summary_job.result(timeout=min(SSE_HEARTBEAT_INTERVAL, wait_until - time.monotonic()))
+                    if not summary_job.done():
+                        yield HEARTBEAT_FRAME
+                store_summary(conversation, session_id, summary_job.result(timeout=0))
 
             # Send final metadata
-            yield f"data: {json.dumps(metadata)}\n\n"
+            yield f"data: {json.dumps(chat_metadata(first, continuation, new_state))}\n\n"
             yield f"data: [DONE]\n\n"
 
+        except (GeneratorExit, ClientDisconnected):
+            # Client went away and did not resume within SSE_RESUME_GRACE: stop the
+            # upstream stream so no more tokens are billed, and keep what was generated
+            if upstream is not None:
+                upstream.close()
+            partial = {'first': first, 'continuation': continuation}.get(stage)
+            record_interrupted_answer(conversation, session_id, stage, partial.text if partial else "")
+        except CircuitOpenError as e:
+            logger.warning(f"Chat API call rejected for session {session_id}: {e}")
+            yield error_frame(GENERIC_API_ERROR_MESSAGE)
         except Exception as e:
             logger.error(f"Chat API error for session {session_id}: {str(e)}")
-            error_data = {'type': 'error', 'message': GENERIC_API_ERROR_MESSAGE}
-            yield f"data: {json.dumps(error_data)}\n\n"
+            yield error_frame(GENERIC_API_ERROR_MESSAGE)
+
+    async def agenerate():
+        """generate() on the event loop: Claude is streamed through AsyncAnthropic and
+        blocking storage calls run in a thread, so waiting holds no thread."""
+        stage = 'first'
+        upstream = first = continuation = None
+        try:
+            # Queued behind other responses: report the position until a slot is free
+            if not ticket.admitted:
+                outcome = 'left'
+                try:
+                    async for position in ticket.apositions(CLAUDE_ADMISSION_MAX_WAIT, SSE_HEARTBEAT_INTERVAL):
+                        yield f"data: {json.dumps({'type': 'queue', 'position': position})}\n\n"
+                        if await asyncio.to_thread(replay.abandoned):
+                            raise ClientDisconnected()
+                    outcome = 'admitted' if ticket.admitted else 'timed_out'
+                finally:
+                    CHAT_ADMISSION_WAIT.observe(ticket.waited, outcome=outcome)
+                if not ticket.admitted:
+                    ticket.release()
+                    logger.warning(f"Chat request for session {session_id} timed out in the admission queue")
+                    yield error_frame(BUSY_API_ERROR_MESSAGE)
+                    return
+
+            request_builder, request_payload, summary_job = first_request()
+
+            frames = new_frames()
+            route, params = stream_params(current_state, request_payload)
+            upstream = first = StreamedAnswer(model_client.astream(**params), frames)
+            async for frame in first:
+                yield frame
+
+            new_state = await asyncio.to_thread(
+                store_first_answer, conversation, session_id, current_state, first, route
+            )
+
+            if new_state:
+                stage = 'continuation'
+                yield HEARTBEAT_FRAME
+                if await asyncio.to_thread(replay.abandoned):
+                    raise ClientDisconnected()
+
+                continuation_payload, summary_job = continuation_request(request_builder, new_state, summary_job)
+                continuation_route, params = stream_params(new_state, continuation_payload)
+                upstream = continuation = StreamedAnswer(model_client.astream(**params), frames)
+                async for frame in continuation:
+                    yield frame
+                await asyncio.to_thread(
+                    store_continuation, conversation, session_id, new_state, continuation, continuation_route
+                )
+
+            stage = 'finishing'
+            if summary_job is not None:
+                wait_until = time.monotonic() + CONTEXT_SUMMARY_WAIT
+                while not summary_job.done() and time.monotonic() < wait_until:
+                    if not await summary_job.wait(min(SSE_HEARTBEAT_INTERVAL, wait_until - time.monotonic())):
+                        yield HEARTBEAT_FRAME
+                await asyncio.to_thread(store_summary, conversation, session_id, summary_job.result(timeout=0))
+
+            yield f"data: {json.dumps(chat_metadata(first, continuation, new_state))}\n\n"
+            yield f"data: [DONE]\n\n"
+
+        except (GeneratorExit, ClientDisconnected):
+            if upstream is not None:
+                await upstream.aclose()
+            partial = {'first': first, 'continuation': continuation}.get(stage)
+            await asyncio.to_thread(
+                record_interrupted_answer, conversation, session_id, stage, partial.text if partial else ""
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"Chat API call rejected for session {session_id}: {e}")
+            yield error_frame(GENERIC_API_ERROR_MESSAGE)
+        except Exception as e:
+            logger.error(f"Chat API error for session {session_id}: {str(e)}")
+            yield error_frame(GENERIC_API_ERROR_MESSAGE)
+
+    if ASYNC_BODY_KEY in request.environ and model_client.async_available:
+        # The bridge sends the frames from the event loop; the WSGI body stays empty
+        request.environ[ASYNC_BODY_KEY] = replay.apump(agenerate())
+        return Response(mimetype='text/event-stream')
+    return Response(stream_with_context(replay.pump(generate())), mimetype='text/event-stream')
+
+
+@app.route('/api/chat/resume', methods=['GET'])
+@limiter.limit(RATE_LIMITS['resume'])
+def chat_resume():
+    """Resumes a dropped chat stream after the Last-Event-ID it received (no new Claude call)."""
+    session_id = get_or_create_session_id()
+
+    # EventSource sends the header; fetch-based clients may use the query parameter
+    event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    if event_id is None:
+        return jsonify({'error': 'Ungültige Event-ID'}), 400
+    stream_id, last_seq = event_id
+
+    stream_info = replay_buffer.stream(stream_id)
+    if stream_info is None or stream_info['session_id'] != session_id:
+        return jsonify({'error': 'Stream nicht gefunden'}), 404
+
+    logger.info(f"Resuming stream {stream_id} for session {session_id} after event {last_seq}")
+    return replay_response(stream_id, last_seq)
 
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 
 @app.route('/api/update-state', methods=['POST'])
@@ -692,13 +1122,14 @@ def chat_api():
 def update_state():
     """Update chat state after transition detected by client."""
     session_id = get_or_create_session_id()
-    initialize_chat_session()
 
     # Validate session ID
     if not validate_session_id(session_id):
         logger.warning(f"Invalid session ID in state update: {session_id}")
         return jsonify({'error': 'Ungültige Session'}), 400
 
+    conversation = load_conversation()
+
     data = request.json
     if not data:
         return jsonify({'error': 'Keine Daten empfangen'}), 400
@@ -712,14 +1143,14 @@ def update_state():
         return jsonify({'error': 'Ungültiger Zustand'}), 400
 
     # Update state
-    session['current_state'] = new_state
+    conversation['current_state'] = new_state
     if new_state == 'strategies':
-        session['interaction_count'] = 0
+        conversation['interaction_count'] = 0
     elif new_state == 'completion':
-        session['session_completed'] = True
+        conversation['session_completed'] = True
         mark_chat_complete(session_id)
 
-    session.modified = True
+    save_conversation(conversation)
     logger.info(f"Session {session_id} state updated to {new_state}")
 
     return jsonify({
@@ -789,51 +1220,135 @@ def thank_you():
 @limiter.limit("10 per day")
 def download_data():
     """
-    Download all questionnaire data as JSON.
+    Download all questionnaire data, streamed one session at a time.
     Requires ADMIN_TOKEN for authentication.
 
-    Usage: /api/download-data?token=YOUR_ADMIN_TOKEN
+    Usage: /api/download-data?token=YOUR_ADMIN_TOKEN[&format=json|ndjson|csv][&gzip=1][&completed=1]
+    - json (default): array of session objects
+    - ndjson: one session object per line
+    - csv: one row per session, one column per pre/post question
     """
     # Check authentication
-    admin_token = os.getenv('ADMIN_TOKEN')
-    if not admin_token:
-        return jsonify({'error': 'Admin access not configured'}), 403
+    auth_error = check_admin_token()
+    if auth_error:
+        return auth_error
 
-    provided_token = request.args.get('token')
-    if not provided_token or provided_token != admin_token:
-        logger.warning(f"Unauthorized data download attempt from {request.remote_addr}")
-        return jsonify({'error': 'Unauthorized'}), 401
+    export_format = request.args.get('format', 'json')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+    completed_only = request.args.get('completed') in ('1', 'true')
 
-    try:
-        from utils.storage import get_all_session_data
-        sessions = get_all_session_data()
-
-        # Create response with JSON file download
-        response = Response(
-            json.dumps(sessions, indent=2, ensure_ascii=False),
-            mimetype='application/json',
-            headers={
-                'Content-Disposition': f'attachment; filename=questionnaire_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-            }
-        )
+    from utils.storage import iter_all_session_data
 
-        logger.info(f"Data download successful: {len(sessions)} sessions")
-        return response
+    def counted_sessions():
+        """Stream sessions from storage and log the total once the export is done."""
+        count = 0
+        try:
+            for session_data in iter_all_session_data(completed_only):
+                count += 1
+                yield session_data
+        except Exception as e:
+            # Headers are already sent; the truncated file is the only signal left
+            logger.error(f"Error downloading data after {count} sessions: {str(e)}")
+            raise
+        logger.info(f"Data download successful: {count} sessions ({export_format})")
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    body = iter_export(counted_sessions(), export_format)
+    filename = f'questionnaire_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    if use_gzip:
+        body = gzip_chunks(body)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    # Stream the file download (constant memory regardless of study size)
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
+
+@app.route('/api/admin/aggregates')
+@limiter.limit(RATE_LIMITS['admin'])
+def admin_aggregates():
+    """
+    Running pre/post questionnaire statistics (constant time, no session scan).
+    Requires ADMIN_TOKEN for authentication.
+
+    Usage: /api/admin/aggregates?token=YOUR_ADMIN_TOKEN
+    """
+    auth_error = check_admin_token()
+    if auth_error:
+        return auth_error
+
+    try:
+        counts = get_session_counts()
+        return jsonify({
+            'sessions': counts['total'],
+            'completed_sessions': counts['completed'],
+            'questions': get_questionnaire_aggregates()
+        })
     except Exception as e:
-        logger.error(f"Error downloading data: {str(e)}")
+        logger.error(f"Error reading aggregates: {str(e)}")
         return jsonify({'error': 'Error retrieving data'}), 500
 
 
+@app.route('/api/admin/routing')
+@limiter.limit(RATE_LIMITS['admin'])
+def admin_routing():
+    """
+    Model routing table with the observed latency per state and model (all
+    workers), for tuning MODEL_ROUTES. Requires ADMIN_TOKEN for authentication.
+
+    Usage: /api/admin/routing?token=YOUR_ADMIN_TOKEN
+    """
+    auth_error = check_admin_token()
+    if auth_error:
+        return auth_error
+
+    collected = metrics_registry.collect()
+    latency = {}
+    for metric, key in ((CHAT_MODEL_TIME_TO_FIRST_TOKEN, 'time_to_first_token'),
+                        (CHAT_MODEL_STREAM_DURATION, 'duration')):
+        family = collected.get(metric.name, {})
+        for (state, model), value in family.get('samples', []):
+            latency.setdefault(state, {}).setdefault(model, {})[key] = histogram_stats(family['buckets'], value)
+    for (state, model), value in collected.get(CHAT_MAX_TOKENS_STOPS.name, {}).get('samples', []):
+        latency.setdefault(state, {}).setdefault(model, {})['max_tokens_stops'] = value
+
+    return jsonify({
+        'routes': {state: model_route(state) for state in MODEL_ROUTES},
+        'latency': latency
+    })
+
+
+@app.route('/metrics')
+@limiter.limit(RATE_LIMITS['metrics'])
+def metrics():
+    """Prometheus text exposition of all workers' metrics (admin token)."""
+    auth_error = check_admin_token()
+    if auth_error:
+        return auth_error
+
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/_health')
 @limiter.limit(RATE_LIMITS['health_check'])
 def health_check():
-    """Health check endpoint for Railway monitoring."""
+    """Health check endpoint for Railway monitoring (503 without a Claude client)."""
+    healthy = model_client.available
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if healthy else 'unhealthy',
         'service': 'procrastination-agent',
-        'version': '3.0-flask-secured'
-    }), 200
+        'version': '3.0-flask-secured',
+        'claude_client': 'ok' if healthy else 'unavailable',
+        'claude_circuit': model_client.breaker.snapshot(),
+        'claude_admission': admission.snapshot(),
+        'prompt_cache_warmer': cache_warmer.snapshot()
+    }), 200 if healthy else 503
 
 
 # ============================================================================
@@ -0,0 +1,202 @@
+"""
+ASGI entry point for the Prokrastinations-Agent.
+
+Serves the Flask app (app_flask.py) under an ASGI server. Every route runs as
+WSGI in a thread pool, except the body of a chat stream: /api/chat finds
+ASYNC_BODY_KEY in the environ and hands back an async generator that streams
+from Claude through AsyncAnthropic on the worker's event loop, so an open
+chat stream holds no thread while it waits for tokens. Without the bridge
+(plain Gunicorn) the same route streams from a blocking generator.
+
+Usage: GUNICORN_WORKER_CLASS=uvicorn gunicorn asgi:app -c gunicorn.conf.py
+"""
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from config.performance import GUNICORN_THREADS
+from utils.sse import ASYNC_BODY_KEY, DISCONNECTED_KEY
+
+import app_flask
+
+# Chat streams use the async client; every other call keeps the blocking one
+app_flask.model_client.async_client = app_flask.create_async_client()
+
+
+class WSGIBridge:
+    """
+    ASGI application running a WSGI app. The request body is read before the
+    app is called; a response body is iterated in one executor thread, so
+    generators that keep a request context (stream_with_context) stay in it.
+    """
+
+    def __init__(self, wsgi_app, threads: int):
+        """
+        Args:
+            wsgi_app: WSGI application
+            threads: Executor threads for WSGI calls and blocking response bodies
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                async_client = app_flask.model_client.async_client
+                if async_client is not None:
+                    await async_client.close()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        # The body has been read: any further message is the disconnect
+        disconnected = asyncio.Event()
+
+        async def listen():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        listener = asyncio.ensure_future(listen())
+        environ = build_environ(scope, bytes(body))
+        environ[ASYNC_BODY_KEY] = None
+        environ[DISCONNECTED_KEY] = disconnected.is_set
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started['status'], started['headers'] = status, headers
+            return lambda data: None  # Legacy write() is not supported
+
+        def response_start(drop_length=False):
+            started['sent'] = True
+            headers = started['headers']
+            if drop_length:
+                # The WSGI body is empty; the async one has no known length
+                headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+            return {
+                'type': 'http.response.start',
+                'status': int(started['status'].split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            }
+
+        try:
+            iterable = await loop.run_in_executor(self.executor, self.wsgi_app, environ, start_response)
+            async_body = environ[ASYNC_BODY_KEY]
+            if async_body is None:
+                await loop.run_in_executor(
+                    self.executor, self._send_wsgi_body, iterable, response_start, send, loop, disconnected.is_set
+                )
+                return
+            try:
+                await send(response_start(drop_length=True))
+                await self._send_async_body(async_body, send, disconnected)
+            finally:
+                # Runs the response's close callbacks (e.g. releasing the admission ticket)
+                if hasattr(iterable, 'close'):
+                    await loop.run_in_executor(self.executor, iterable.close)
+        finally:
+            listener.cancel()
+
+    @staticmethod
+    def _send_wsgi_body(iterable, response_start, send, loop, disconnected):
+        """Iterates a WSGI body in this thread and sends it from the event loop."""
+        def send_now(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        try:
+            # Headers go out with the first chunk, so start_response may still change them
+            started = False
+            for chunk in iterable:
+                if not chunk:
+                    continue
+                if not started:
+                    send_now(response_start())
+                    started = True
+                send_now({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if disconnected():
+                    return  # Closing the iterable below ends the generator
+            if not started:
+                send_now(response_start())
+            send_now({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            pass  # Client gone
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    @staticmethod
+    async def _send_async_body(frames, send, disconnected: asyncio.Event):
+        """Sends an async generator of SSE frames until it ends or the client leaves."""
+        gone = asyncio.ensure_future(disconnected.wait())
+        try:
+            async for frame in frames:
+                await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+                if gone.done():
+                    return
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            pass
+        finally:
+            gone.cancel()
+            # On a disconnect the generator keeps producing into the replay buffer
+            await frames.aclose()
+
+
+def build_environ(scope, body: bytes):
+    """WSGI environ (PEP 3333) of an ASGI HTTP request."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+app = WSGIBridge(app_flask.app, GUNICORN_THREADS)
@@ -0,0 +1,499 @@
+"""
+Local stand-in for the Anthropic Messages API (load testing without API credits).
+
+Speaks enough of POST /v1/messages for the anthropic SDK: streaming responses
+as SSE (message_start, text deltas, transition_state tool_use blocks,
+message_delta with usage) and plain JSON responses for non-streaming calls.
+
+- Latency profiles: time-to-first-token and token rate per response
+- Scripted phase transitions: the model calls transition_state after a fixed
+  number of user turns per state (see DEFAULT_SCRIPT), counted per conversation
+  so summarized histories do not change the script (see PhaseTracker)
+- Usage with cache fields from a simulated prompt cache (ephemeral
+  breakpoints, 20-block lookback, 5 minute TTL)
+- Optional injected 529 "overloaded" errors and mid-stream stalls
+
+Response text and timing are deterministic for a given --seed and request body.
+
+Usage:
+    python -m benchmarks.fake_anthropic --port 8787 --profile realistic
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 gunicorn app_flask:app -c gunicorn.conf.py
+
+GET /_stats returns request and token counters as JSON.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+
+STATE_ORDER = ["intake", "hypotheses", "strategies", "completion"]
+
+# User turns spent in each state before the model calls transition_state
+DEFAULT_SCRIPT = {"intake": 3, "hypotheses": 2, "strategies": 3}
+
+PROFILES = {
+    # name: time-to-first-token (s), TTFT jitter (s), output tokens/s, output tokens
+    "instant": {"ttft": 0.0, "ttft_jitter": 0.0, "tokens_per_second": 0, "output_tokens": 40},
+    "fast": {"ttft": 0.05, "ttft_jitter": 0.02, "tokens_per_second": 400, "output_tokens": 60},
+    "realistic": {"ttft": 0.8, "ttft_jitter": 0.4, "tokens_per_second": 60, "output_tokens": 80},
+    "slow": {"ttft": 3.0, "ttft_jitter": 1.5, "tokens_per_second": 20, "output_tokens": 120},
+}
+
+WORDS = (
+    "Verstehe ich richtig dass die Aufgabe dich vor allem dann blockiert wenn "
+    "unklar ist wo du anfangen sollst Was passiert kurz bevor du sie verschiebst "
+    "Welche Gedanken gehen dir dabei durch den Kopf und wie fühlt sich das an"
+).split()
+
+CACHE_TTL_SECONDS = 300
+CACHE_LOOKBACK_BLOCKS = 20
+STATE_PATTERN = re.compile(r"<current_state>\s*(\w+)\s*</current_state>", re.IGNORECASE)
+
+
+def estimate_tokens(value) -> int:
+    """Rough token estimate (4 characters per token)."""
+    return max(1, len(json.dumps(value, ensure_ascii=False, sort_keys=True)) // 4)
+
+
+class PromptCacheSimulator:
+    """Prefix cache keyed by the hash of everything up to a cache breakpoint."""
+
+    def __init__(self):
+        self._entries: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def usage(self, body: Dict) -> Dict[str, int]:
+        blocks = []
+        for tool in body.get("tools") or []:
+            blocks.append(("tool", tool))
+        system = body.get("system") or []
+        if isinstance(system, str):
+            system = [{"type": "text", "text": system}]
+        blocks += [("system", block) for block in system]
+        for message in body.get("messages", []):
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            blocks += [(message["role"], block) for block in content]
+
+        digest = hashlib.sha256(body.get("model", "").encode())
+        keys, tokens, breakpoints = [], [], []
+        for index, (role, block) in enumerate(blocks):
+            clean = {k: v for k, v in block.items() if k != "cache_control"}
+            digest.update(json.dumps([role, clean], sort_keys=True, ensure_ascii=False).encode())
+            keys.append(digest.hexdigest())
+            tokens.append(estimate_tokens(clean))
+            if "cache_control" in block:
+                breakpoints.append(index)
+
+        now = time.monotonic()
+        with self._lock:
+            read_upto = -1
+            for index in breakpoints:
+                for candidate in range(index, max(-1, index - CACHE_LOOKBACK_BLOCKS - 1), -1):
+                    if self._entries.get(keys[candidate], 0) > now:
+                        read_upto = max(read_upto, candidate)
+                        break
+            for index in breakpoints:
+                self._entries[keys[index]] = now + CACHE_TTL_SECONDS
+            if len(self._entries) > 100000:
+                self._entries = {k: v for k, v in self._entries.items() if v > now}
+
+        write_upto = max(breakpoints) if breakpoints else -1
+        cache_read = sum(tokens[:read_upto + 1])
+        cache_creation = sum(tokens[read_upto + 1:write_upto + 1]) if write_upto > read_upto else 0
+        return {
+            "input_tokens": sum(tokens) - cache_read - cache_creation,
+            "cache_creation_input_tokens": cache_creation,
+            "cache_read_input_tokens": cache_read,
+        }
+
+
+def _blocks(message: Dict) -> List[Dict]:
+    content = message["content"]
+    return [{"type": "text", "text": content}] if isinstance(content, str) else content
+
+
+def _text(message: Dict) -> str:
+    """Text of a message without the dynamic state block."""
+    return " ".join(
+        block.get("text", "") for block in _blocks(message)
+        if block.get("type") == "text" and not STATE_PATTERN.search(block.get("text", ""))
+    ).strip()
+
+
+def _is_tool_result(message: Dict) -> bool:
+    return any(block.get("type") == "tool_result" for block in _blocks(message))
+
+
+def response_key(text: str, tool_use_id: Optional[str] = None) -> Optional[str]:
+    """
+    Identifies a generated response in later histories: by its text, or by
+    the tool_use id of a tool-only response ("rebuild" keeps only the text).
+    """
+    key = text.strip() or tool_use_id
+    return hashlib.sha256(key.encode()).hexdigest() if key else None
+
+
+def _message_key(message: Dict) -> Optional[str]:
+    tool_ids = [block["id"] for block in _blocks(message) if block.get("type") == "tool_use"]
+    return response_key(_text(message), tool_ids[0] if tool_ids else None)
+
+
+def _user_turns(messages: List[Dict]) -> int:
+    """User text turns in messages, not counting tool_results and the summary."""
+    return sum(
+        1 for message in messages
+        if message["role"] == "user" and not _is_tool_result(message)
+        and "<conversation_summary>" not in _text(message)
+    )
+
+
+def current_state(messages: List[Dict]) -> str:
+    """State from the <current_state> block of the latest user message."""
+    for message in reversed(messages):
+        if message["role"] != "user":
+            continue
+        content = message["content"]
+        text = content if isinstance(content, str) else " ".join(
+            block.get("text", "") for block in content if block.get("type") == "text"
+        )
+        match = STATE_PATTERN.search(text)
+        if match:
+            return match.group(1).lower()
+    return "intake"
+
+
+class PhaseTracker:
+    """
+    Scripted transitions from per-conversation turn counts.
+
+    Summaries fold older turns (and the tool_result of the last transition)
+    out of the request, so the turns spent in a state cannot be counted from
+    the history. Instead every generated response is remembered with the state
+    and turn count it leaves its conversation in; a request continues from the
+    newest remembered response in its history.
+    """
+
+    def __init__(self, script: Dict[str, int], max_entries: int = 100000):
+        self.script = script
+        self.max_entries = max_entries
+        self._after: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._transitioned: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, table: OrderedDict, key: str, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_entries:
+            table.popitem(last=False)
+
+    def _anchor(self, messages: List[Dict]) -> Tuple[int, Optional[str]]:
+        """Index and key of the newest remembered response (-1 if none)."""
+        with self._lock:
+            for index in range(len(messages) - 1, -1, -1):
+                if messages[index]["role"] == "assistant":
+                    key = _message_key(messages[index])
+                    if key in self._after:
+                        return index, key
+        return -1, None
+
+    def decide(self, body: Dict) -> Tuple[Optional[str], Optional[Tuple[str, int]]]:
+        """
+        Next state if the model should call transition_state now.
+
+        Returns:
+            (next state or None, (state, turns in state) after this response)
+        """
+        if not any(tool.get("name") == "transition_state" for tool in body.get("tools") or []):
+            return None, None
+        messages = body.get("messages", [])
+        state = current_state(messages)
+        if not messages or state not in self.script:
+            return None, (state, 0)
+        if messages[-1]["role"] == "assistant" or _is_tool_result(messages[-1]):
+            return None, (state, 0)  # Continuation right after a transition
+
+        index, key = self._anchor(messages)
+        turn_key = (key or "") + _text(messages[-1])
+        with self._lock:
+            if self._transitioned.get(turn_key) == state:
+                # "rebuild" after a tool-only response re-sends the same user turn
+                return None, (state, 0)
+            anchor_state, turns = self._after[key] if key else (state, 0)
+        if index < 0:
+            # No response of ours in the history (first turn, restarted fake): count from the start
+            turns = _user_turns(messages)
+            turns -= sum(self.script[s] for s in STATE_ORDER[:STATE_ORDER.index(state)] if s in self.script)
+        else:
+            turns = (turns if anchor_state == state else 0) + _user_turns(messages[index + 1:])
+
+        if turns >= self.script[state]:
+            next_state = STATE_ORDER[STATE_ORDER.index(state) + 1]
+            with self._lock:
+                self._put(self._transitioned, turn_key, next_state)
+            return next_state, (next_state, 0)
+        return None, (state, turns)
+
+    def remember(self, key: Optional[str], after: Optional[Tuple[str, int]]):
+        """Records the state a generated response leaves its conversation in."""
+        if key and after:
+            with self._lock:
+                self._put(self._after, key, after)
+
+
+class FakeAnthropic:
+    """Response generation shared by all request handler threads."""
+
+    def __init__(self, profile: str = "realistic", seed: int = 0, script: Optional[Dict[str, int]] = None,
+                 error_rate: float = 0.0, stall_rate: float = 0.0, stall_seconds: float = 30.0,
+                 chunk_tokens: int = 1, **overrides):
+        self.settings = {**PROFILES[profile], **{k: v for k, v in overrides.items() if v is not None}}
+        self.seed = seed
+        self.script = script or dict(DEFAULT_SCRIPT)
+        self.phases = PhaseTracker(self.script)
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.cache = PromptCacheSimulator()
+        self.stats = {"requests": 0, "streams": 0, "cancelled": 0, "errors": 0, "transitions": 0,
+                      "output_tokens": 0, "input_tokens": 0, "cache_read_input_tokens": 0,
+                      "cache_creation_input_tokens": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self.stats[key] += value
+
+    def plan(self, body: Dict) -> Dict:
+        """Decides everything about one response up front."""
+        raw = json.dumps(body, sort_keys=True, ensure_ascii=False).encode()
+        rng = random.Random(int.from_bytes(hashlib.sha256(raw).digest()[:8], "big") ^ self.seed)
+
+        settings = self.settings
+        max_tokens = int(body.get("max_tokens", 1024))
+        output_tokens = min(max_tokens, int(settings["output_tokens"]))
+        words = [WORDS[(rng.randrange(len(WORDS)) + i) % len(WORDS)] for i in range(output_tokens)]
+        next_state, after = self.phases.decide(body)
+        tool_only = next_state is not None and rng.random() < 0.3
+        text = "" if tool_only else " ".join(words) + "."
+        tool_use_id = f"toolu_{uuid.uuid4().hex[:24]}" if next_state else None
+        error = rng.random() < self.error_rate
+        if not error:
+            self.phases.remember(response_key(text, tool_use_id), after)
+        return {
+            "error": error,
+            "stall": rng.random() < self.stall_rate,
+            "ttft": max(0.0, settings["ttft"] + rng.uniform(-1, 1) * settings["ttft_jitter"]),
+            "tokens_per_second": settings["tokens_per_second"],
+            "text": text,
+            "output_tokens": 0 if tool_only else output_tokens,
+            "next_state": next_state,
+            "tool_use_id": tool_use_id,
+            "truncated": not tool_only and int(settings["output_tokens"]) > max_tokens,
+            "usage": self.cache.usage(body),
+        }
+
+    def message(self, body: Dict, plan: Dict) -> Dict:
+        """Complete Message object for non-streaming responses."""
+        content = []
+        if plan["text"]:
+            content.append({"type": "text", "text": plan["text"]})
+        if plan["next_state"]:
+            content.append({"type": "tool_use", "id": plan["tool_use_id"],
+                            "name": "transition_state", "input": {"state": plan["next_state"]}})
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake"),
+            "content": content,
+            "stop_reason": "max_tokens" if plan["truncated"] else "tool_use" if plan["next_state"] else "end_turn",
+            "stop_sequence": None,
+            "usage": {**plan["usage"], "output_tokens": plan["output_tokens"] + (10 if plan["next_state"] else 0)},
+        }
+
+    def record(self, plan: Dict, streamed: bool):
+        self._count(requests=1, streams=int(streamed), transitions=int(bool(plan["next_state"])),
+                    output_tokens=plan["output_tokens"], **plan["usage"])
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeAnthropic/1.0"
+
+    @property
+    def fake(self) -> FakeAnthropic:
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass  # Keep load tests quiet
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("request-id", f"req_{uuid.uuid4().hex[:24]}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.fake._lock:
+                return self._send_json(200, dict(self.fake.stats))
+        self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.startswith("/v1/messages"):
+            return self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "Not found"}})
+
+        plan = self.fake.plan(body)
+        if plan["error"]:
+            self.fake._count(requests=1, errors=1)
+            return self._send_json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+
+        time.sleep(plan["ttft"])
+        if not body.get("stream"):
+            self.fake.record(plan, streamed=False)
+            return self._send_json(200, self.fake.message(body, plan))
+
+        self.fake.record(plan, streamed=True)
+        try:
+            self._stream(body, plan)
+        except (BrokenPipeError, ConnectionResetError):
+            self.fake._count(cancelled=1)  # Client closed the stream early
+
+    # ------------------------------------------------------------------
+    # SSE streaming (chunked transfer encoding)
+    # ------------------------------------------------------------------
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _event(self, event_type: str, payload: Dict):
+        self._write_chunk(f"event: {event_type}\ndata: {json.dumps(payload)}\n\n".encode())
+
+    def _stream(self, body: Dict, plan: Dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("request-id", f"req_{uuid.uuid4().hex[:24]}")
+        self.end_headers()
+
+        message = self.fake.message(body, plan)
+        self._event("message_start", {"type": "message_start", "message": {
+            **message, "content": [], "stop_reason": None, "usage": {**plan["usage"], "output_tokens": 1}
+        }})
+        self._event("ping", {"type": "ping"})
+
+        interval = 1.0 / plan["tokens_per_second"] if plan["tokens_per_second"] else 0.0
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                self._event("content_block_start", {"type": "content_block_start", "index": index,
+                                                    "content_block": {"type": "text", "text": ""}})
+                words = block["text"].split(" ")
+                for start in range(0, len(words), self.fake.chunk_tokens):
+                    if plan["stall"] and start >= len(words) // 2:
+                        time.sleep(self.fake.stall_seconds)
+                        plan["stall"] = False
+                    chunk = " ".join(words[start:start + self.fake.chunk_tokens])
+                    text = chunk if start == 0 else " " + chunk
+                    self._event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                        "delta": {"type": "text_delta", "text": text}})
+                    if interval:
+                        time.sleep(interval * self.fake.chunk_tokens)
+            else:
+                self._event("content_block_start", {"type": "content_block_start", "index": index,
+                                                    "content_block": {**block, "input": {}}})
+                self._event("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                    "delta": {"type": "input_json_delta",
+                                                              "partial_json": json.dumps(block["input"])}})
+            self._event("content_block_stop", {"type": "content_block_stop", "index": index})
+
+        self._event("message_delta", {"type": "message_delta",
+                                      "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                      "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+        self._event("message_stop", {"type": "message_stop"})
+        self._write_chunk(b"")
+
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    """Threaded HTTP server; one thread per concurrent stream."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8787, **options):
+        self.fake = FakeAnthropic(**options)
+        super().__init__((host, port), Handler)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start_background(self) -> "FakeAnthropicServer":
+        """Serves from a daemon thread (for in-process benchmarks)."""
+        threading.Thread(target=self.serve_forever, name="fake-anthropic", daemon=True).start()
+        return self
+
+
+def parse_script(value: str) -> Dict[str, int]:
+    """Parses "intake=3,hypotheses=2,strategies=3"."""
+    script = {}
+    for item in value.split(","):
+        state, _, turns = item.partition("=")
+        script[state.strip()] = int(turns)
+    return script
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Anthropic Messages API for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--ttft", type=float, help="Override time-to-first-token (seconds)")
+    parser.add_argument("--ttft-jitter", type=float, help="Override TTFT jitter (seconds)")
+    parser.add_argument("--tokens-per-second", type=float, help="Override output token rate (0 = unthrottled)")
+    parser.add_argument("--output-tokens", type=int, help="Override output tokens per response")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="Tokens per text delta")
+    parser.add_argument("--script", type=parse_script, default=None,
+                        help="User turns per state before transition_state (default intake=3,hypotheses=2,strategies=3)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 529")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of streams that stall midway")
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(
+        args.host, args.port, profile=args.profile, seed=args.seed, script=args.script,
+        error_rate=args.error_rate, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+        chunk_tokens=args.chunk_tokens, ttft=args.ttft, ttft_jitter=args.ttft_jitter,
+        tokens_per_second=args.tokens_per_second, output_tokens=args.output_tokens
+    )
+    print(f"Fake Anthropic API on {server.base_url} (profile={args.profile})")
+    print(f"Point the app at it with ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
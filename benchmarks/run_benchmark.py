@@ -0,0 +1,414 @@
+"""
+End-to-end benchmark of concurrent participant journeys.
+
+For every worker configuration the harness starts the fake Messages API
+(benchmarks/fake_anthropic.py) and Gunicorn in a scratch directory, then drives
+complete journeys from concurrent client threads:
+
+    welcome -> pre-questionnaire -> /api/chat until completion
+    (with /api/update-state after each transition, like the browser) -> post-questionnaire
+
+Reported per configuration: sessions/sec, time-to-first-token percentiles,
+SSE throughput, storage write latency (from the app's metrics) and RSS per
+worker. Results are written as JSON so runs on different commits can be
+compared. RSS sampling reads /proc and therefore needs Linux.
+
+Usage:
+    python -m benchmarks.run_benchmark --worker-class sync gthread --workers 2 4 \\
+        --sessions 40 --concurrency 10 --profile fast --output results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import secrets
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_anthropic import PROFILES
+from config.security import PRE_QUESTIONNAIRE_COUNT, POST_QUESTIONNAIRE_COUNT
+from utils.metrics import MetricsRegistry, histogram_stats
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CSRF_PATTERN = re.compile(r'(?:name|id)="csrf_token" value="([^"]+)"')
+
+USER_MESSAGES = [
+    "Ich schiebe meine Bachelorarbeit seit Wochen vor mir her.",
+    "Wenn ich anfangen will, weiß ich nicht, wo ich beginnen soll.",
+    "Meistens lande ich dann auf dem Handy und fühle mich schlecht.",
+    "Ja, das klingt ziemlich zutreffend.",
+    "Vielleicht liegt es auch daran, dass ich Angst habe, es nicht gut genug zu machen.",
+    "Das könnte ich ausprobieren.",
+    "Ich glaube, kleine Schritte würden mir helfen.",
+    "Danke, das nehme ich mit.",
+]
+
+
+# ============================================================================
+# Statistics helpers
+# ============================================================================
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def histogram_summary(family: Dict) -> Dict:
+    """Count, mean and bucket-bound percentiles per label set of a merged histogram."""
+    return {
+        ",".join(labels): histogram_stats(family["buckets"], value)
+        for labels, value in family.get("samples", []) if value[2]
+    }
+
+
+# ============================================================================
+# Process management
+# ============================================================================
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def child_pids(parent: int) -> List[int]:
+    """Direct children of a process (the Gunicorn workers of the master)."""
+    pids = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # Fields after the parenthesised command name: state, ppid, ...
+        if int(stat.rsplit(")", 1)[1].split()[1]) == parent:
+            pids.append(int(entry.name))
+    return pids
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of all workers of a Gunicorn master until stopped."""
+
+    def __init__(self, master_pid: int, interval: float = 0.5):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak: Dict[int, float] = {}
+        self.last: Dict[int, float] = {}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            for pid in child_pids(self.master_pid):
+                value = rss_mb(pid)
+                if value is not None:
+                    self.last[pid] = value
+                    self.peak[pid] = max(value, self.peak.get(pid, 0.0))
+            self._done.wait(self.interval)
+
+    def stop(self) -> List[Dict]:
+        self._done.set()
+        self.join()
+        return [
+            {"pid": pid, "peak_mb": round(self.peak[pid], 1), "last_mb": round(self.last[pid], 1)}
+            for pid in sorted(self.peak)
+        ]
+
+
+# ============================================================================
+# Participant journey
+# ============================================================================
+
+class CookieCarrier:
+    """
+    Session cookie handling for plain-http runs. Talisman marks the session
+    cookie Secure; browsers still send it to localhost, httpx does not.
+    """
+
+    def __init__(self):
+        self.cookies = SimpleCookie()
+
+    def on_request(self, request: httpx.Request):
+        if self.cookies:
+            request.headers["Cookie"] = "; ".join(f"{k}={m.value}" for k, m in self.cookies.items())
+
+    def on_response(self, response: httpx.Response):
+        for header in response.headers.get_list("set-cookie"):
+            self.cookies.load(header)
+
+
+def csrf_token(html: str) -> str:
+    match = CSRF_PATTERN.search(html)
+    if not match:
+        raise RuntimeError("CSRF token not found in page")
+    return match.group(1)
+
+
+def chat_turn(client: httpx.Client, token: str, message: str) -> Dict:
+    """One /api/chat request; returns timings and the metadata frame."""
+    started = time.perf_counter()
+    ttft, frames, size, metadata = None, 0, 0, None
+    with client.stream("POST", "/api/chat", json={"message": message}, headers={"X-CSRFToken": token}) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/chat returned {response.status_code}")
+        for line in response.iter_lines():
+            if not line.startswith("data: "):
+                continue
+            frames += 1
+            size += len(line) + 2
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            parsed = json.loads(data)
+            if parsed.get("text") and ttft is None:
+                ttft = time.perf_counter() - started
+            elif parsed.get("type") == "metadata":
+                metadata = parsed
+            elif parsed.get("type") == "error":
+                raise RuntimeError(f"stream error: {parsed.get('message')}")
+    return {"ttft": ttft, "duration": time.perf_counter() - started, "frames": frames,
+            "bytes": size, "metadata": metadata or {}}
+
+
+def run_journey(base_url: str, index: int, max_turns: int) -> Dict:
+    """Complete participant journey; returns per-turn results."""
+    turns = []
+    cookies = CookieCarrier()
+    hooks = {"request": [cookies.on_request], "response": [cookies.on_response]}
+    with httpx.Client(base_url=base_url, timeout=120.0, event_hooks=hooks) as client:
+        client.get("/").raise_for_status()
+
+        token = csrf_token(client.get("/pre-questionnaire").text)
+        answers = {f"q{i}": 1 + (index + i) % 7 for i in range(1, PRE_QUESTIONNAIRE_COUNT + 1)}
+        client.post("/api/save-pre-questionnaire", json=answers, headers={"X-CSRFToken": token}).raise_for_status()
+
+        token = csrf_token(client.get("/chat").text)
+        completed = False
+        for turn in range(max_turns):
+            result = chat_turn(client, token, USER_MESSAGES[(index + turn) % len(USER_MESSAGES)])
+            turns.append(result)
+            new_state = result["metadata"].get("new_state")
+            if new_state:
+                client.post("/api/update-state", json={"new_state": new_state},
+                            headers={"X-CSRFToken": token}).raise_for_status()
+            if result["metadata"].get("session_completed") or new_state == "completion":
+                completed = True
+                break
+        if not completed:
+            raise RuntimeError(f"journey did not reach completion in {max_turns} turns")
+
+        token = csrf_token(client.get("/post-questionnaire").text)
+        answers = {f"q{i}": 1 + (index * 3 + i) % 7 for i in range(1, POST_QUESTIONNAIRE_COUNT + 1)}
+        client.post("/api/save-post-questionnaire", json=answers, headers={"X-CSRFToken": token}).raise_for_status()
+        client.get("/thank-you").raise_for_status()
+    return {"turns": turns}
+
+
+# ============================================================================
+# One configuration
+# ============================================================================
+
+class Stack:
+    """A running fake API + Gunicorn pair (see serve_stack)."""
+
+    def __init__(self, workdir: Path, base_url: str, api_url: str, master_pid: int):
+        self.workdir = workdir
+        self.base_url = base_url
+        self.api_url = api_url
+        self.master_pid = master_pid
+
+
+@contextmanager
+def serve_stack(worker_class: str, workers: int, fake_args: List[str], env: Optional[Dict] = None):
+    """
+    Starts the fake API and Gunicorn in a scratch directory and stops both on exit.
+    Workers flush their metrics when they exit, so read them after the block.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="bench-"))
+    api_port, app_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(REPO_ROOT),
+        "PORT": str(app_port),
+        "GUNICORN_WORKER_CLASS": worker_class,
+        "WEB_CONCURRENCY": str(workers),
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{api_port}",
+        "ANTHROPIC_API_KEY": "fake-key",
+        "SECRET_KEY": secrets.token_hex(32),
+        "ADMIN_TOKEN": secrets.token_hex(16),
+        "RATE_LIMIT_ENABLED": "false",
+        "METRICS_FLUSH_INTERVAL": "1",
+        **(env or {}),
+    }
+    fake_cmd = [sys.executable, "-m", "benchmarks.fake_anthropic", "--port", str(api_port), *fake_args]
+    # The uvicorn worker class serves the ASGI bridge around the same app
+    app_module = "asgi:app" if worker_class == "uvicorn" else "app_flask:app"
+    app_cmd = [sys.executable, "-m", "gunicorn", app_module, "-c", str(REPO_ROOT / "gunicorn.conf.py"),
+               "--bind", f"127.0.0.1:{app_port}", "--log-level", "warning"]
+
+    log = open(workdir / "server.log", "w")
+    fake = subprocess.Popen(fake_cmd, cwd=REPO_ROOT, env=env, stdout=log, stderr=log)
+    app = subprocess.Popen(app_cmd, cwd=workdir, env=env, stdout=log, stderr=log)
+    stack = Stack(workdir, f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{api_port}", app.pid)
+    try:
+        wait_for(f"{stack.api_url}/_stats")
+        wait_for(f"{stack.base_url}/_health")
+        yield stack
+    finally:
+        app.send_signal(signal.SIGTERM)
+        fake.send_signal(signal.SIGTERM)
+        app.wait(timeout=60)
+        fake.wait(timeout=10)
+        log.close()
+
+
+def run_configuration(args, worker_class: str, workers: int) -> Dict:
+    fake_args = ["--profile", args.profile, "--seed", str(args.seed)]
+    if args.script:
+        fake_args += ["--script", args.script]
+
+    with serve_stack(worker_class, workers, fake_args) as stack:
+        sampler = RssSampler(stack.master_pid)
+        sampler.start()
+        failures: List[str] = []
+        journeys: List[Dict] = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_journey, stack.base_url, i, args.max_turns) for i in range(args.sessions)]
+            for future in futures:
+                try:
+                    journeys.append(future.result())
+                except Exception as e:
+                    failures.append(f"{type(e).__name__}: {e}")
+        elapsed = time.perf_counter() - started
+        rss = sampler.stop()
+        fake_stats = httpx.get(f"{stack.api_url}/_stats").json()
+
+    # Workers flush their metrics on exit and the master archives them
+    metrics = MetricsRegistry(stack.workdir / "data" / "metrics").collect()
+    turns = [turn for journey in journeys for turn in journey["turns"]]
+    frames = sum(turn["frames"] for turn in turns)
+    size = sum(turn["bytes"] for turn in turns)
+    stream_seconds = sum(turn["duration"] for turn in turns)
+    return {
+        "worker_class": worker_class,
+        "workers": workers,
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "sessions_completed": len(journeys),
+        "sessions_failed": len(failures),
+        "errors": sorted(set(failures))[:10],
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(journeys) / elapsed, 3) if elapsed else None,
+        "chat_requests": len(turns),
+        "time_to_first_token_seconds": summarize([t["ttft"] for t in turns if t["ttft"] is not None]),
+        "chat_duration_seconds": summarize([t["duration"] for t in turns]),
+        "sse": {
+            "frames": frames,
+            "bytes": size,
+            "frames_per_response": round(frames / len(turns), 1) if turns else None,
+            "frames_per_second": round(frames / elapsed, 1) if elapsed else None,
+            "bytes_per_second": round(size / elapsed, 1) if elapsed else None,
+            "bytes_per_stream_second": round(size / stream_seconds, 1) if stream_seconds else None,
+        },
+        "storage_write_seconds": histogram_summary(metrics.get("storage_write_seconds", {})),
+        "rss_per_worker": rss,
+        "fake_api": fake_stats,
+        "workdir": str(stack.workdir),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of concurrent chat sessions")
+    parser.add_argument("--worker-class", nargs="+", default=["sync"], choices=["sync", "gthread", "gevent", "uvicorn"])
+    parser.add_argument("--workers", nargs="+", type=int, default=[2])
+    parser.add_argument("--sessions", type=int, default=20, help="Journeys per configuration")
+    parser.add_argument("--concurrency", type=int, default=5, help="Journeys in flight at once")
+    parser.add_argument("--max-turns", type=int, default=20, help="Chat turns before a journey counts as failed")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="Fake API latency profile")
+    parser.add_argument("--script", help="Fake API transition script, e.g. intake=3,hypotheses=2,strategies=3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "profile": args.profile,
+        "results": [],
+    }
+    for worker_class in args.worker_class:
+        for workers in args.workers:
+            print(f"Running {worker_class} x {workers} ...", file=sys.stderr)
+            report["results"].append(run_configuration(args, worker_class, workers))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark of SSE frame coalescing (SSE_COALESCE_WINDOW_MS) at high concurrency.
+
+Runs the same set of concurrent chat streams once per coalescing window and
+reports, per stream:
+- worker CPU time (utime + stime of all Gunicorn workers, from /proc)
+- SSE frames, i.e. WSGI writes; Gunicorn issues one sendall() per frame
+- TCP segments sent in the network namespace (/proc/net/snmp, includes the
+  fake API's traffic, which is identical for every window)
+- time-to-first-token and the mean gap between frames seen by the client
+- CPU of the per-frame write path (JSON + chunked sendall), measured in
+  isolation and multiplied by the frame count; end-to-end worker CPU is
+  dominated by parsing the upstream event stream and is noisy on one host
+
+Transitions are disabled so every stream is a single plain response.
+
+Usage:
+    python -m benchmarks.sse_coalescing --windows 0 16 24 32 --streams 100 --output sse.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from gunicorn import util as gunicorn_util
+
+from benchmarks.run_benchmark import (
+    CookieCarrier, child_pids, csrf_token, git_commit, serve_stack, summarize
+)
+from utils.sse import sse_event
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds(pid: int) -> float:
+    """utime + stime of a process (all threads)."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def tcp_out_segments() -> int:
+    lines = [line.split() for line in Path("/proc/net/snmp").read_text().splitlines() if line.startswith("Tcp:")]
+    return int(lines[1][lines[0].index("OutSegs")])
+
+
+def write_path_cpu_us(frames: int = 20000) -> float:
+    """Thread CPU per SSE frame for json.dumps + Gunicorn's chunked write to a socket."""
+    sender, receiver = socket.socketpair()
+    threading.Thread(target=lambda: [receiver.recv(1 << 20) for _ in iter(int, 1)], daemon=True).start()
+    started = time.thread_time()
+    for _ in range(frames):
+        gunicorn_util.write(sender, sse_event({"text": " Wort"}).encode(), True)
+    elapsed = time.thread_time() - started
+    sender.close()
+    return elapsed / frames * 1e6
+
+
+def open_session(base_url: str):
+    cookies = CookieCarrier()
+    client = httpx.Client(base_url=base_url, timeout=120.0,
+                          event_hooks={"request": [cookies.on_request], "response": [cookies.on_response]})
+    client.get("/").raise_for_status()
+    return client, csrf_token(client.get("/chat").text)
+
+
+def stream_once(client: httpx.Client, token: str, message: str) -> Dict:
+    started = time.perf_counter()
+    arrivals: List[float] = []
+    with client.stream("POST", "/api/chat", json={"message": message}, headers={"X-CSRFToken": token}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith('data: {"text"'):
+                arrivals.append(time.perf_counter() - started)
+    gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    return {"frames": len(arrivals), "ttft": arrivals[0] if arrivals else None,
+            "mean_gap": sum(gaps) / len(gaps) if gaps else None}
+
+
+def run_window(args, window_ms: float, frame_cpu_us: float) -> Dict:
+    fake_args = ["--profile", "fast", "--ttft", str(args.ttft), "--ttft-jitter", "0",
+                 "--tokens-per-second", str(args.tokens_per_second), "--output-tokens", str(args.output_tokens),
+                 "--script", "intake=1000000"]
+    env = {"SSE_COALESCE_WINDOW_MS": str(window_ms), "GUNICORN_THREADS": str(2 * args.streams)}
+    with serve_stack("gthread", args.workers, fake_args, env) as stack:
+        sessions = [open_session(stack.base_url) for _ in range(args.streams)]
+        workers = child_pids(stack.master_pid)
+        cpu_before = sum(cpu_seconds(pid) for pid in workers)
+        segments_before = tcp_out_segments()
+        started = time.perf_counter()
+
+        def run(session):
+            client, token = session
+            return [stream_once(client, token, f"Nachricht {turn}") for turn in range(args.turns)]
+
+        with ThreadPoolExecutor(max_workers=args.streams) as pool:
+            results = [r for per_session in pool.map(run, sessions) for r in per_session]
+        elapsed = time.perf_counter() - started
+        cpu = sum(cpu_seconds(pid) for pid in workers) - cpu_before
+        segments = tcp_out_segments() - segments_before
+        for client, _ in sessions:
+            client.close()
+
+    streams = len(results)
+    frames = sum(r["frames"] for r in results) / streams
+    return {
+        "window_ms": window_ms,
+        "streams": streams,
+        "elapsed_seconds": round(elapsed, 3),
+        "worker_cpu_ms_per_stream": round(cpu * 1000 / streams, 2),
+        "frames_per_stream": round(frames, 1),
+        "write_path_cpu_ms_per_stream": round(frames * frame_cpu_us / 1000, 3),
+        "tcp_segments_per_stream": round(segments / streams, 1),
+        "time_to_first_token_seconds": summarize([r["ttft"] for r in results if r["ttft"] is not None]),
+        "mean_frame_gap_ms": round(1000 * sum(r["mean_gap"] or 0 for r in results) / streams, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE frame coalescing benchmark")
+    parser.add_argument("--windows", nargs="+", type=float, default=[0, 16, 24, 32],
+                        help="SSE_COALESCE_WINDOW_MS values to compare (0 = one frame per delta)")
+    parser.add_argument("--streams", type=int, default=100, help="Concurrent streams")
+    parser.add_argument("--turns", type=int, default=3, help="Sequential streams per session")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    frame_cpu_us = write_path_cpu_us()
+    report = {"commit": git_commit(), "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "write_path_cpu_us_per_frame": round(frame_cpu_us, 2), "results": []}
+    for window in args.windows:
+        print(f"Window {window:g} ms ...", file=sys.stderr)
+        report["results"].append(run_window(args, window, frame_cpu_us))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Performance configuration for the Prokrastinations-Agent.
+Centralized settings for server-side state, serving mode and Claude API usage.
+"""
+
+import os
+
+from config.security import PERMANENT_SESSION_LIFETIME
+
+
+# ============================================================================
+# Conversation Store Configuration
+# ============================================================================
+
+# Chat history lives server-side; the session cookie only carries session_id
+CONVERSATIONS_DIR = os.getenv('CONVERSATIONS_DIR', 'data/conversations')
+CONVERSATION_CACHE_SIZE = int(os.getenv('CONVERSATION_CACHE_SIZE', '512'))  # Hot-tier entries per worker
+CONVERSATION_TTL_SECONDS = int(PERMANENT_SESSION_LIFETIME.total_seconds())  # Same lifetime as the cookie
+CONVERSATION_PURGE_INTERVAL = int(os.getenv('CONVERSATION_PURGE_INTERVAL', '600'))  # Seconds between purges of expired files
+
+
+# ============================================================================
+# Serving Mode Configuration (Gunicorn, see gunicorn.conf.py)
+# ============================================================================
+
+# Worker class:
+# - "sync"    -> one request per worker (each SSE stream pins a whole worker)
+# - "gthread" -> GUNICORN_THREADS concurrent requests (= open SSE streams) per worker
+# - "gevent"  -> cooperative, up to GUNICORN_WORKER_CONNECTIONS streams per worker; needs
+#                requirements-gevent.txt and an Anthropic/httpx stack that imports after
+#                monkey-patching (see README)
+# - "uvicorn" -> ASGI (gunicorn asgi:app), up to GUNICORN_WORKER_CONNECTIONS requests per
+#                worker; chat streams run on the event loop through AsyncAnthropic, the
+#                other routes in GUNICORN_THREADS threads; needs requirements-asgi.txt
+GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+GUNICORN_WORKERS = int(os.getenv('WEB_CONCURRENCY', '2'))
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '16'))  # gthread, uvicorn
+GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '500'))  # gevent, uvicorn
+GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', '120'))  # Extended timeout for Claude API calls
+
+# Requests one worker can hold open at once (every open chat stream, queued or not, takes one)
+WORKER_REQUEST_SLOTS = {
+    'sync': 1,
+    'gthread': GUNICORN_THREADS,
+    'gevent': GUNICORN_WORKER_CONNECTIONS,
+    'uvicorn': GUNICORN_WORKER_CONNECTIONS,
+}.get(GUNICORN_WORKER_CLASS, 1)
+# Chat streams may take all but a few of them; those stay free to answer overload with a
+# 503 and to serve the other pages
+CHAT_REQUEST_SLOTS = WORKER_REQUEST_SLOTS - (max(1, WORKER_REQUEST_SLOTS // 8) if WORKER_REQUEST_SLOTS > 1 else 0)
+
+# Upstream connection pool shared by all concurrent streams of one worker
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv('ANTHROPIC_MAX_CONNECTIONS', '500'))
+ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS', '100'))
+
+
+# ============================================================================
+# Claude Pipeline Configuration
+# ============================================================================
+
+# Auto-continuation after a transition_state tool call:
+# "rebuild"     -> re-send the history ending in the first response (the tool
+#                  call is dropped); fewest uncached input tokens
+# "tool_result" -> keep the tool call and answer it with a tool_result turn;
+#                  ~90 more uncached tokens per continuation, same latency
+#                  in benchmarks (see README)
+AUTO_CONTINUATION_MODE = os.getenv('AUTO_CONTINUATION_MODE', 'rebuild')
+
+# Per-call time budget (seconds). Retries happen only before the first token
+# reached the client, with full-jitter exponential backoff.
+CLAUDE_CONNECT_TIMEOUT = float(os.getenv('CLAUDE_CONNECT_TIMEOUT', '5'))
+CLAUDE_FIRST_TOKEN_TIMEOUT = float(os.getenv('CLAUDE_FIRST_TOKEN_TIMEOUT', '20'))  # Request start -> first content
+CLAUDE_IDLE_TIMEOUT = float(os.getenv('CLAUDE_IDLE_TIMEOUT', '30'))  # Max silence between stream events
+CLAUDE_MAX_RETRIES = int(os.getenv('CLAUDE_MAX_RETRIES', '2'))
+CLAUDE_RETRY_BASE_DELAY = float(os.getenv('CLAUDE_RETRY_BASE_DELAY', '0.5'))
+CLAUDE_RETRY_MAX_DELAY = float(os.getenv('CLAUDE_RETRY_MAX_DELAY', '4'))
+
+# Admission control per worker: at most CLAUDE_MAX_CONCURRENT_STREAMS chat responses
+# stream from Claude at once (0 = unlimited); up to CLAUDE_ADMISSION_QUEUE more wait
+# in FIFO order for CLAUDE_ADMISSION_MAX_WAIT seconds, beyond that 503 + Retry-After.
+# A queued request holds a request slot too, so both must fit into CHAT_REQUEST_SLOTS
+# (gunicorn.conf.py refuses to start otherwise). Default: a quarter of them queue.
+CLAUDE_ADMISSION_QUEUE = int(os.getenv('CLAUDE_ADMISSION_QUEUE', str(CHAT_REQUEST_SLOTS // 4)))
+CLAUDE_MAX_CONCURRENT_STREAMS = int(os.getenv(
+    'CLAUDE_MAX_CONCURRENT_STREAMS', str(max(1, CHAT_REQUEST_SLOTS - CLAUDE_ADMISSION_QUEUE))
+))
+CLAUDE_ADMISSION_MAX_WAIT = float(os.getenv('CLAUDE_ADMISSION_MAX_WAIT', '15'))
+
+
+# ============================================================================
+# Model Routing Configuration
+# ============================================================================
+
+# Model, output cap and sampling per conversation state, used for the response
+# in that state (including the auto-continuation after a transition).
+# CHAT_FAST_MODEL serves the short intake and completion turns; set it to a
+# cheaper model (e.g. claude-haiku-4-5-20251001) to route them there. Each model
+# keeps its own prompt cache, and prompts below the model's minimum cacheable
+# length are not cached at all.
+# max_tokens is capped at MAX_TOKENS_PER_MESSAGE; temperature None = API default.
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'claude-sonnet-4-5-20250929')
+CHAT_FAST_MODEL = os.getenv('CHAT_FAST_MODEL', CHAT_MODEL)
+MODEL_ROUTES = {
+    "intake": {"model": CHAT_FAST_MODEL, "max_tokens": 512, "temperature": None},  # Short questions
+    "hypotheses": {"model": CHAT_MODEL, "max_tokens": 768, "temperature": None},
+    "strategies": {"model": CHAT_MODEL, "max_tokens": 1024, "temperature": None},
+    "completion": {"model": CHAT_FAST_MODEL, "max_tokens": 768, "temperature": None},  # Recap + first step
+}
+
+
+# ============================================================================
+# SSE Streaming Configuration
+# ============================================================================
+
+# Text deltas arriving within the window are merged into one SSE frame; the
+# first delta of a response is always sent at once (0 = one frame per delta)
+SSE_COALESCE_WINDOW_MS = float(os.getenv('SSE_COALESCE_WINDOW_MS', '24'))
+SSE_COALESCE_MAX_CHARS = int(os.getenv('SSE_COALESCE_MAX_CHARS', '256'))  # Buffered text that forces a frame
+# Comment frame sent while no text flows (e.g. waiting for the context summary),
+# so a closed tab is noticed before more upstream work is started
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '2'))
+
+# Resumable streams: frames are kept in a replay buffer shared by all workers,
+# so a dropped connection can resume with Last-Event-ID on any worker
+SSE_REPLAY_DB = os.getenv('SSE_REPLAY_DB', 'data/sse_replay.db')
+SSE_REPLAY_TTL = float(os.getenv('SSE_REPLAY_TTL', '300'))  # Seconds a stream stays resumable after its last frame
+SSE_RESUME_GRACE = float(os.getenv('SSE_RESUME_GRACE', '10'))  # Generation continues this long after a disconnect
+# Frames are persisted in batches; readers on the producing worker are woken per
+# frame, readers on other workers poll SQLite
+SSE_REPLAY_FLUSH_INTERVAL = float(os.getenv('SSE_REPLAY_FLUSH_INTERVAL', '1'))  # Seconds between batched writes
+SSE_REPLAY_POLL_INTERVAL = float(os.getenv('SSE_REPLAY_POLL_INTERVAL', '0.25'))  # Live tail polling from another worker
+
+
+# ============================================================================
+# Prompt Cache Configuration
+# ============================================================================
+
+MAX_CACHE_BREAKPOINTS = 4  # API maximum per request (one is used by the system prompt)
+CACHE_CHECKPOINT_TURNS = int(os.getenv('CACHE_CHECKPOINT_TURNS', '4'))  # Stable checkpoint every N turns (user + assistant)
+
+# Optional background refresh of the cached system prompt of every routed model,
+# done by one worker while chat traffic is active (cache lifetime: 5 minutes)
+CACHE_WARMER_ENABLED = os.getenv('CACHE_WARMER_ENABLED', 'false').lower() == 'true'
+CACHE_WARMER_INTERVAL = float(os.getenv('CACHE_WARMER_INTERVAL', '240'))  # Refresh prefixes unused this long
+CACHE_WARMER_ACTIVE_WINDOW = float(os.getenv('CACHE_WARMER_ACTIVE_WINDOW', '1800'))  # Stop after this much silence
+# Daily cap in uncached input-token equivalents (cache read 0.1, cache write 1.25, output 5)
+CACHE_WARMER_DAILY_BUDGET = float(os.getenv('CACHE_WARMER_DAILY_BUDGET', '200000'))
+CACHE_WARMER_CHECK_INTERVAL = float(os.getenv('CACHE_WARMER_CHECK_INTERVAL', '15'))
+CACHE_WARMER_DB = os.getenv('CACHE_WARMER_DB', 'data/cache_warmer.db')
+
+
+# ============================================================================
+# Context Window Configuration
+# ============================================================================
+
+# Older turns are replaced by a running summary, refreshed on every phase
+# change or when more than CONTEXT_MAX_TURNS turns are sent verbatim
+CONTEXT_KEEP_TURNS = int(os.getenv('CONTEXT_KEEP_TURNS', '6'))  # Verbatim turns after a refresh
+CONTEXT_MAX_TURNS = int(os.getenv('CONTEXT_MAX_TURNS', '12'))
+CONTEXT_SUMMARY_MODEL = os.getenv('CONTEXT_SUMMARY_MODEL', 'claude-haiku-4-5-20251001')
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv('CONTEXT_SUMMARY_MAX_TOKENS', '400'))
+CONTEXT_SUMMARY_WAIT = float(os.getenv('CONTEXT_SUMMARY_WAIT', '5'))  # Seconds to wait after the response
+
+
+# ============================================================================
+# Research Data Storage Configuration
+# ============================================================================
+
+# "json"   -> one JSON file per session in data/responses (default)
+# "sqlite" -> one row per session/stage in a WAL-mode SQLite database
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+STORAGE_SQLITE_PATH = os.getenv('STORAGE_SQLITE_PATH', 'data/responses.db')
+AGGREGATES_PATH = os.getenv('AGGREGATES_PATH', 'data/aggregates.json')  # Running questionnaire statistics
+
+
+# ============================================================================
+# Metrics Configuration
+# ============================================================================
+
+# Each worker writes a metrics snapshot here; /metrics merges all of them
+METRICS_DIR = os.getenv('METRICS_DIR', 'data/metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))  # Max staleness of other workers' data
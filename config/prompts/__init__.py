@@ -2,36 +2,108 @@
 System Prompt for Prokrastinations-Agent
 =========================================
 Manages loading the unified system prompt with state injection.
+
+The prompt is split into two parts:
+- system.md: static instructions, sent as the cached system prefix
+- state.md: small dynamic block with state and interaction count, appended
+  uncached to the latest user turn (see utils/request_builder.py)
+- summary.md: instructions for the rolling summary of older turns
+  (see utils/context_window.py)
+
+Keeping the dynamic values out of the cached prefix means a state change or a
+new strategies turn no longer invalidates the cached ~7 KB prompt.
 """
 
 from pathlib import Path
+from typing import Dict, List
 
 PROMPTS_DIR = Path(__file__).parent
 
 
-def load_system_prompt() -> str:
-    """Load the unified system prompt."""
-    file_path = PROMPTS_DIR / "system.md"
+def load_prompt_file(filename: str) -> str:
+    """Load a prompt file from the prompts directory."""
+    file_path = PROMPTS_DIR / filename
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read().strip()
 
 
-# Load prompt once at module import
+def load_system_prompt() -> str:
+    """Load the unified (static) system prompt."""
+    return load_prompt_file("system.md")
+
+
+# Load prompts once at module import
 SYSTEM_PROMPT = load_system_prompt()
+STATE_PROMPT_TEMPLATE = load_prompt_file("state.md")
+SUMMARY_PROMPT = load_prompt_file("summary.md")
 
 
-def get_prompt(state: str, interaction_count: int = 0) -> str:
+def get_state_block(state: str, interaction_count: int = 0) -> str:
     """
-    Get prompt with state and interaction count injected.
+    Get the dynamic state block with state and interaction count injected.
 
     Args:
         state: Current conversation state (intake, hypotheses, strategies, completion)
         interaction_count: Number of exchanges in strategies state
 
     Returns:
-        Formatted system prompt string
+        Formatted state block string
     """
-    return SYSTEM_PROMPT.format(
+    return STATE_PROMPT_TEMPLATE.format(
         current_state=state.upper(),
         interaction_count=interaction_count
     )
+
+
+def get_transition_result(state: str) -> str:
+    """
+    Get the tool_result text that confirms a transition_state call.
+
+    Args:
+        state: The state the conversation moved to
+
+    Returns:
+        Short confirmation; the full state block follows in the same turn
+    """
+    return f"Transitioned to {state.upper()}. Continue the conversation in this phase."
+
+
+def get_summary_message(summary: str) -> str:
+    """
+    Get the conversation message that stands in for summarized older turns.
+
+    Args:
+        summary: Running summary text
+
+    Returns:
+        Summary wrapped in <conversation_summary> tags
+    """
+    return f"<conversation_summary>\n{summary}\n</conversation_summary>"
+
+
+def get_system_blocks() -> List[Dict]:
+    """
+    Get the static system prompt as API content blocks, marked for prompt caching.
+
+    Returns:
+        List of system content blocks for the Messages API
+    """
+    return [{
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"}
+    }]
+
+
+def get_prompt(state: str, interaction_count: int = 0) -> str:
+    """
+    Get prompt with state and interaction count injected.
+
+    Args:
+        state: Current conversation state (intake, hypotheses, strategies, completion)
+        interaction_count: Number of exchanges in strategies state
+
+    Returns:
+        Formatted system prompt string
+    """
+    return SYSTEM_PROMPT + "\n\n" + get_state_block(state, interaction_count)
@@ -20,7 +20,14 @@ CSRF_TIME_LIMIT = None  # No time limit for research sessions (participants may
 # ============================================================================
 
 # Global rate limits (per IP address)
-RATE_LIMIT_STORAGE_URL = "memory://"  # Use Redis in production: "redis://localhost:6379"
+# Counters live in a local SQLite file shared by all Gunicorn workers
+# ("memory://" is per worker, so each worker would allow the full limit).
+# Any `limits` storage URI works, e.g. "redis://localhost:6379" for multi-host.
+RATE_LIMIT_STORAGE_URL = os.getenv('RATE_LIMIT_STORAGE_URL', 'sqlite:///data/ratelimits.db')
+# "fixed-window" (one counter per key, cheapest) or "moving-window" (exact, one row per hit)
+RATE_LIMIT_STRATEGY = os.getenv('RATE_LIMIT_STRATEGY', 'fixed-window')
+# Per-IP limits would throttle a load test from one host; never disable in production
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
 RATE_LIMIT_GLOBAL = "100 per hour"
 
 # Endpoint-specific rate limits
@@ -28,6 +35,9 @@ RATE_LIMITS = {
     "chat": "20 per hour",  # Limit Claude API calls
     "save_questionnaire": "5 per hour",  # Prevent spam submissions
     "health_check": "60 per minute",  # Monitoring can check frequently
+    "admin": "60 per hour",  # Token-protected admin analytics
+    "metrics": "120 per minute",  # Prometheus scrapes (token-protected)
+    "resume": "120 per hour",  # Reconnects of dropped chat streams (no Claude call)
 }
 
 # Per-session API call limits
@@ -124,6 +134,7 @@ API_CIRCUIT_BREAKER_TIMEOUT = 60  # Seconds to wait before retrying
 
 # API error handling
 GENERIC_API_ERROR_MESSAGE = "Entschuldigung, es gab einen technischen Fehler. Bitte versuche es erneut."
+BUSY_API_ERROR_MESSAGE = "Gerade sind sehr viele Gespräche aktiv. Bitte versuche es in ein paar Sekunden erneut."
 
 
 # ============================================================================
@@ -0,0 +1,88 @@
+"""
+Gunicorn configuration for the Prokrastinations-Agent.
+The worker class is selected via GUNICORN_WORKER_CLASS (see config/performance.py).
+
+Usage: gunicorn app_flask:app -c gunicorn.conf.py
+       GUNICORN_WORKER_CLASS=uvicorn gunicorn asgi:app -c gunicorn.conf.py
+"""
+
+import os
+import sys
+
+from gunicorn.arbiter import Arbiter
+
+from config.performance import (
+    GUNICORN_WORKER_CLASS, GUNICORN_WORKERS, GUNICORN_THREADS,
+    GUNICORN_WORKER_CONNECTIONS, GUNICORN_TIMEOUT, WORKER_REQUEST_SLOTS, CHAT_REQUEST_SLOTS,
+    CLAUDE_MAX_CONCURRENT_STREAMS, CLAUDE_ADMISSION_QUEUE
+)
+from utils.metrics import registry as metrics_registry
+
+# Railway provides PORT env var
+bind = f"0.0.0.0:{os.getenv('PORT', '8501')}"
+
+worker_class = GUNICORN_WORKER_CLASS
+workers = GUNICORN_WORKERS
+timeout = GUNICORN_TIMEOUT
+
+if worker_class == 'gthread':
+    threads = GUNICORN_THREADS
+elif worker_class == 'gevent':
+    # gevent patches the stdlib when the worker boots; the app must therefore
+    # be imported inside each worker, never preloaded in the master
+    worker_connections = GUNICORN_WORKER_CONNECTIONS
+    preload_app = False
+elif worker_class == 'uvicorn':
+    # ASGI worker capped at WORKER_REQUEST_SLOTS open requests (see asgi.py)
+    worker_class = 'utils.asgi_worker.UvicornWorker'
+
+# Keep SSE connections from being cut by idle keep-alive handling
+keepalive = 75
+
+
+def on_starting(server):
+    """
+    Refuse to start if admission control cannot engage: unless stream slots
+    plus queue places leave a worker free request slots (CHAT_REQUEST_SLOTS),
+    overload piles up in Gunicorn's backlog instead of getting a fast 503.
+    Then fold metrics snapshots left by a previous run into the archive.
+    """
+    admitted = CLAUDE_MAX_CONCURRENT_STREAMS + CLAUDE_ADMISSION_QUEUE
+    if CLAUDE_MAX_CONCURRENT_STREAMS and admitted > CHAT_REQUEST_SLOTS:
+        server.log.error(
+            f"CLAUDE_MAX_CONCURRENT_STREAMS ({CLAUDE_MAX_CONCURRENT_STREAMS}) + CLAUDE_ADMISSION_QUEUE "
+            f"({CLAUDE_ADMISSION_QUEUE}) exceed the {CHAT_REQUEST_SLOTS} chat requests a '{GUNICORN_WORKER_CLASS}' "
+            f"worker can hold ({WORKER_REQUEST_SLOTS} in total); lower them or raise GUNICORN_THREADS"
+        )
+        sys.exit(1)
+    metrics_registry.archive()
+
+
+def post_worker_init(worker):
+    """
+    Refuse to boot a worker without a Claude client (e.g. missing API key, or an
+    HTTP stack that does not import under gevent's monkey-patching): it would
+    answer every chat request with an error while looking alive.
+    Then start the worker's purge of expired conversations.
+    """
+    app_module = sys.modules.get('app_flask')
+    if app_module is None:
+        return
+    if not app_module.model_client.available:
+        worker.log.error("Anthropic client unavailable in this worker, aborting boot (see log above)")
+        sys.exit(Arbiter.WORKER_BOOT_ERROR)  # The master shuts down instead of respawning
+    if 'asgi' in sys.modules and not app_module.model_client.async_available:
+        worker.log.error("Async Anthropic client unavailable in this ASGI worker, aborting boot (see log above)")
+        sys.exit(Arbiter.WORKER_BOOT_ERROR)
+    # Expired transcripts are deleted even while no chat traffic arrives
+    app_module.conversation_store.start_purging()
+
+
+def worker_exit(server, worker):
+    """Write the exiting worker's last metrics before its snapshot is archived."""
+    metrics_registry.flush(force=True)
+
+
+def child_exit(server, worker):
+    """Keep an exited worker's counters in the archive so totals never drop."""
+    metrics_registry.archive(worker.pid)
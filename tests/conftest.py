@@ -0,0 +1,14 @@
+"""
+Shared pytest setup: keep metrics snapshots of the code under test out of data/.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Must run before config.performance is imported by the modules under test
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="test-metrics-"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")  # app_flask warns without one
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,102 @@
+"""
+Admission control: slots up to the cap, a FIFO queue behind them and an
+immediate rejection once the queue is full.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from utils.admission import AdmissionController, AdmissionRejected
+
+
+def test_admits_up_to_the_cap_then_queues_then_rejects():
+    controller = AdmissionController(max_concurrent=2, max_queue=1)
+    first, second = controller.enter(), controller.enter()
+    queued = controller.enter()
+
+    assert first.admitted and second.admitted
+    assert not queued.admitted and queued.position() == 1
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter()
+    assert rejected.value.retry_after >= 1
+    assert controller.snapshot()["rejected"] == 1
+
+
+def test_released_slots_go_to_waiters_in_arrival_order():
+    controller = AdmissionController(max_concurrent=1, max_queue=3)
+    active = controller.enter()
+    waiters = [controller.enter() for _ in range(3)]
+    assert [ticket.position() for ticket in waiters] == [1, 2, 3]
+
+    active.release()
+    assert [ticket.admitted for ticket in waiters] == [True, False, False]
+    assert waiters[2].position() == 2
+
+    waiters[1].release()  # Gave up while queued
+    waiters[0].release()
+    assert waiters[2].admitted
+    assert controller.snapshot()["active"] == 1
+
+
+def test_new_requests_do_not_overtake_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_queue=2)
+    active = controller.enter()
+    waiting = controller.enter()
+    active.release()
+    late = controller.enter()
+
+    assert waiting.admitted
+    assert not late.admitted and late.position() == 1
+
+
+def test_release_is_idempotent():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    ticket = controller.enter()
+    ticket.release()
+    ticket.release()
+    assert controller.snapshot()["active"] == 0
+
+
+def test_waiting_ticket_is_woken_when_admitted():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    active = controller.enter()
+    waiting = controller.enter()
+
+    releaser = threading.Timer(0.05, active.release)
+    releaser.start()
+    positions = list(waiting.positions(max_wait=5, interval=1))
+    releaser.join()
+
+    assert waiting.admitted
+    assert positions == [1]
+    assert waiting.waited < 1
+
+
+def test_waiting_ticket_is_woken_on_the_event_loop():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    active = controller.enter()
+    waiting = controller.enter()
+
+    async def wait():
+        asyncio.get_running_loop().call_later(0.05, active.release)
+        return [position async for position in waiting.apositions(max_wait=5, interval=1)]
+
+    assert asyncio.run(wait()) == [1]
+    assert waiting.admitted
+    assert waiting.waited < 1
+
+
+def test_positions_end_unadmitted_after_max_wait():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    controller.enter()
+    waiting = controller.enter()
+
+    list(waiting.positions(max_wait=0.05, interval=0.01))
+    assert not waiting.admitted
+
+
+def test_disabled_controller_admits_everything():
+    controller = AdmissionController()
+    assert all(controller.enter().admitted for _ in range(100))
@@ -0,0 +1,131 @@
+"""
+ASGI bridge (asgi.py): chat streams come from AsyncAnthropic on the event
+loop, every other route is served by the Flask app as WSGI.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import app_flask
+import asgi
+from utils.admission import AdmissionController
+from utils.claude_client import ModelClient
+from utils.sse_replay import ReplayBuffer
+
+
+def text(chunk):
+    return SimpleNamespace(type="text", text=chunk)
+
+
+class FakeAsyncStream:
+    """Async context manager returned by AsyncAnthropic.messages.stream()."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+        self.response = SimpleNamespace(request=SimpleNamespace(extensions={"timeout": {}}))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.closed = True
+        return False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield text(chunk)
+
+    async def get_final_message(self):
+        usage = SimpleNamespace(input_tokens=10, output_tokens=len(self.chunks))
+        return SimpleNamespace(content=[], usage=usage, stop_reason="end_turn")
+
+
+class FakeAsyncClient:
+    def __init__(self, chunks):
+        self.streams = []
+        self.messages = SimpleNamespace(stream=lambda **params: self._stream(chunks))
+
+    def _stream(self, chunks):
+        self.streams.append(FakeAsyncStream(chunks))
+        return self.streams[-1]
+
+
+class UnusedClient:
+    """Blocking client that must not be called for chat streams."""
+
+    messages = SimpleNamespace(stream=lambda **params: pytest.fail("blocking client used"))
+
+
+@pytest.fixture
+def fake_claude(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # Conversations are stored relative to the working directory
+    monkeypatch.setitem(app_flask.app.config, "WTF_CSRF_ENABLED", False)
+    monkeypatch.setattr(app_flask.limiter, "enabled", False)
+    monkeypatch.setattr(app_flask, "replay_buffer", ReplayBuffer(str(tmp_path / "replay.db")))
+    monkeypatch.setattr(app_flask, "admission", AdmissionController(max_concurrent=2, max_queue=1))
+    async_client = FakeAsyncClient(["Was ", "hält ", "dich ", "auf?"])
+    monkeypatch.setattr(app_flask, "model_client", ModelClient(UnusedClient(), async_client=async_client))
+    return async_client
+
+
+def request(method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/")  # Session cookie
+            return await client.request(method, path, **kwargs)
+
+    return asyncio.run(send())
+
+
+def data_events(body):
+    return [json.loads(line[6:]) for line in body.splitlines()
+            if line.startswith("data: {")]
+
+
+def test_chat_streams_from_the_async_client(fake_claude):
+    response = request("POST", "/api/chat", json={"message": "Ich schiebe alles auf."})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "content-length" not in response.headers
+    events = data_events(response.text)
+    assert "".join(event.get("text", "") for event in events) == "Was hält dich auf?"
+    assert events[-1]["type"] == "metadata" and events[-1]["full_text"] == "Was hält dich auf?"
+    assert response.text.rstrip().endswith("data: [DONE]")
+    assert len(fake_claude.streams) == 1 and fake_claude.streams[0].closed
+    # The WSGI response was closed after the async body: the slot is free again
+    assert app_flask.admission.snapshot()["active"] == 0
+
+
+def test_other_routes_are_served_by_the_wsgi_app(fake_claude):
+    response = request("GET", "/chat")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert fake_claude.streams == []
+
+
+def test_environ_follows_pep_3333():
+    scope = {
+        "type": "http", "method": "GET", "path": "/über", "root_path": "", "query_string": b"a=1",
+        "http_version": "1.1", "server": ("example.org", 443), "client": ("10.0.0.1", 5000),
+        "scheme": "https",
+        "headers": [(b"content-type", b"application/json"), (b"x-forwarded-for", b"1.2.3.4"),
+                    (b"x-forwarded-for", b"5.6.7.8")],
+    }
+
+    environ = asgi.build_environ(scope, b"{}")
+
+    assert environ["PATH_INFO"] == "/über".encode("utf-8").decode("latin-1")
+    assert environ["CONTENT_TYPE"] == "application/json"
+    assert environ["HTTP_X_FORWARDED_FOR"] == "1.2.3.4,5.6.7.8"
+    assert environ["REMOTE_ADDR"] == "10.0.0.1"
+    assert environ["wsgi.url_scheme"] == "https"
+    assert environ["wsgi.input"].read() == b"{}"
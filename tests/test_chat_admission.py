@@ -0,0 +1,39 @@
+"""
+/api/chat under overload: once every Claude slot and queue place of the
+worker is taken, further requests get an immediate 503 with Retry-After.
+"""
+
+import pytest
+
+import app_flask
+from utils.admission import AdmissionController
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # Conversations are stored relative to the working directory
+    monkeypatch.setitem(app_flask.app.config, "WTF_CSRF_ENABLED", False)
+    monkeypatch.setattr(app_flask.limiter, "enabled", False)
+    return app_flask.app.test_client()
+
+
+def test_full_queue_is_rejected_with_retry_after(client, monkeypatch):
+    admission = AdmissionController(max_concurrent=2, max_queue=1)
+    held = [admission.enter() for _ in range(3)]  # Two streaming, one queued
+    monkeypatch.setattr(app_flask, "admission", admission)
+
+    response = client.post("/api/chat", json={"message": "Ich schiebe alles auf."})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json()["retry_after"] >= 1
+    assert admission.snapshot()["rejected"] == 1
+    assert [ticket.admitted for ticket in held] == [True, True, False]
+
+
+def test_default_limits_fit_into_the_worker():
+    from config.performance import (
+        CHAT_REQUEST_SLOTS, CLAUDE_ADMISSION_QUEUE, CLAUDE_MAX_CONCURRENT_STREAMS, WORKER_REQUEST_SLOTS
+    )
+
+    assert CLAUDE_MAX_CONCURRENT_STREAMS + CLAUDE_ADMISSION_QUEUE <= CHAT_REQUEST_SLOTS <= WORKER_REQUEST_SLOTS
@@ -0,0 +1,91 @@
+"""
+Circuit breaker state transitions: closed -> open after the threshold,
+fail fast while open, one half-open probe after the cool-down.
+"""
+
+import pytest
+
+from utils import circuit_breaker
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure(RuntimeError("upstream"))
+
+
+def test_opens_after_consecutive_failures_and_fails_fast(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker)
+    assert breaker.state == OPEN
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == 20
+    assert breaker.snapshot()["rejected_calls"] == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    fail(breaker)
+    breaker.before_call()
+    breaker.record_success()
+    fail(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_admits_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    fail(breaker)
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.retry_after() == 0
+
+    breaker.before_call()  # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_restarts_the_cool_down(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    fail(breaker)
+    clock.now += 30
+    fail(breaker)  # Probe fails
+
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 30
+    assert breaker.snapshot()["times_opened"] == 2
+
+
+def test_released_probe_frees_the_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    fail(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.release()  # Client went away: no verdict
+
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
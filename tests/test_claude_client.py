@@ -0,0 +1,353 @@
+"""
+ModelClient against a scripted fake of the Anthropic client: first-token
+deadline, the stream watchdog, pauses that release coalesced text, retries that only happen before the first
+token reached the caller, and how each attempt is recorded in the breaker.
+astream() runs against the same scripts through a fake AsyncAnthropic.
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from utils import claude_client
+from utils.claude_client import CallPolicy, ModelClient, StreamTimeoutError, _Watchdog
+from utils.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+from utils.sse import StreamedAnswer, TextFrameCoalescer
+
+
+def text(chunk):
+    return SimpleNamespace(type="text", text=chunk)
+
+
+def event(type, **fields):
+    return SimpleNamespace(type=type, **fields)
+
+
+def pause(seconds):
+    return ("pause", seconds)
+
+
+class FakeStream:
+    """Context manager returned by messages.stream(): replays a script of events."""
+
+    def __init__(self, script):
+        self.script = script
+        self.response = SimpleNamespace(
+            request=SimpleNamespace(extensions={"timeout": {}}), extensions={}, close=lambda: None
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        chunks = []
+        for step in self.script:
+            if isinstance(step, BaseException):
+                raise step
+            if isinstance(step, tuple):
+                time.sleep(step[1])
+                continue
+            if step.type == "text":
+                chunks.append(step.text)
+            yield step
+        self.final = SimpleNamespace(content="".join(chunks))
+
+    def get_final_message(self):
+        return self.final
+
+
+class FakeClient:
+    """anthropic.Anthropic stand-in: one script per call, in order."""
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.calls = 0
+        self.messages = SimpleNamespace(stream=self._stream, create=self._create)
+
+    def _next(self):
+        self.calls += 1
+        script = self.scripts.pop(0)
+        if isinstance(script, BaseException):
+            raise script
+        return script
+
+    def _stream(self, **params):
+        return FakeStream(self._next())
+
+    def _create(self, **params):
+        return self._next()
+
+
+@pytest.fixture
+def watchdog(monkeypatch):
+    watchdog = _Watchdog()
+    monkeypatch.setattr(claude_client, "_watchdog", watchdog)
+    return watchdog
+
+
+def test_watchdog_runs_due_callbacks_and_skips_cancelled(watchdog):
+    fired = []
+    done = threading.Event()
+    watchdog.schedule(time.monotonic() + 0.05, lambda: fired.append("due"))
+    cancel = watchdog.schedule(time.monotonic() + 0.05, lambda: fired.append("cancelled"))
+    watchdog.schedule(time.monotonic() + 0.1, done.set)
+    cancel()
+
+    assert done.wait(2)
+    assert fired == ["due"]
+    assert watchdog._pending == set()
+
+
+def test_stream_outliving_the_deadline_leaves_no_watchdog_state(watchdog):
+    client = ModelClient(FakeClient([text("a"), pause(0.15), text("b")]),
+                         policy=CallPolicy(first_token_timeout=0.05))
+
+    events = list(client.stream(model="m", max_tokens=1, messages=[]))
+
+    assert events[:2] == [("text", "a"), ("text", "b")]
+    assert events[-1][1].content == "ab"
+    assert watchdog._pending == set()
+    assert watchdog._heap == []
+
+
+def test_silent_stream_is_cut_at_the_first_token_deadline(watchdog):
+    client = ModelClient(FakeClient([pause(0.2), text("late")]),
+                         policy=CallPolicy(first_token_timeout=0.05, max_retries=0))
+
+    with pytest.raises(StreamTimeoutError):
+        list(client.stream(model="m", max_tokens=1, messages=[]))
+    assert watchdog._pending == set()
+
+
+# ============================================================================
+# Pauses
+# ============================================================================
+
+def text_delta(chunk):
+    """The raw delta followed by the derived text event, as the SDK sends them."""
+    return [event("content_block_delta", delta=SimpleNamespace(type="text_delta", text=chunk)), text(chunk)]
+
+
+def test_pause_follows_a_text_run_when_a_non_text_event_arrives():
+    script = [event("content_block_start"), *text_delta("a"), *text_delta("b"), event("content_block_stop"),
+              event("content_block_start"), event("input_json", partial_json="{"), event("message_delta")]
+    client = ModelClient(FakeClient(script))
+
+    events = [name for name, _ in client.stream(model="m", max_tokens=1, messages=[])]
+
+    assert events == ["text", "text", "pause", "message"]
+
+
+def test_buffered_text_is_released_when_a_non_text_event_follows():
+    script = [*text_delta("a"), *text_delta("b"), event("content_block_stop"), pause(0.3), event("message_delta")]
+    client = ModelClient(FakeClient(script))
+    frames = TextFrameCoalescer(window=1.0)
+    sent = []
+
+    # Consumed like the chat route: flush on pause, again after the stream
+    started = time.monotonic()
+    for name, payload in client.stream(model="m", max_tokens=1, messages=[]):
+        frame = frames.add(payload) if name == "text" else frames.flush() if name == "pause" else None
+        if frame:
+            sent.append((frame, time.monotonic() - started))
+
+    assert [frame for frame, _ in sent] == ['data: {"text": "a"}\n\n', 'data: {"text": "b"}\n\n']
+    assert sent[1][1] < 0.2  # Not held for the upstream's 0.3s pause
+
+
+# ============================================================================
+# Retries and the circuit breaker
+# ============================================================================
+
+def no_backoff(**kwargs):
+    return CallPolicy(retry_base_delay=0, **kwargs)
+
+
+def stream_all(client):
+    events = []
+    try:
+        for event in client.stream(model="m", max_tokens=1, messages=[]):
+            events.append(event)
+    except Exception as e:
+        return events, e
+    return events, None
+
+
+def test_stream_failing_before_the_first_token_is_retried():
+    fake = FakeClient(httpx.ConnectError("refused"), [httpx.ReadError("reset")], [text("ok")])
+    client = ModelClient(fake, policy=no_backoff(max_retries=2))
+
+    events, error = stream_all(client)
+
+    assert error is None
+    assert fake.calls == 3
+    assert events[0] == ("text", "ok")
+    assert client.breaker.snapshot()["consecutive_failures"] == 0
+
+
+def test_stream_is_not_retried_after_the_first_token():
+    fake = FakeClient([text("a"), httpx.ReadError("reset")], [text("never")])
+    client = ModelClient(fake, policy=no_backoff(max_retries=2))
+
+    events, error = stream_all(client)
+
+    assert events == [("text", "a")]
+    assert isinstance(error, httpx.ReadError)
+    assert fake.calls == 1
+    assert client.breaker.snapshot()["consecutive_failures"] == 1
+
+
+def test_request_errors_are_neither_retried_nor_counted():
+    fake = FakeClient(ValueError("bad request"), [text("never")])
+    client = ModelClient(fake, policy=no_backoff(max_retries=2))
+
+    events, error = stream_all(client)
+
+    assert isinstance(error, ValueError)
+    assert fake.calls == 1
+    assert client.breaker.snapshot()["consecutive_failures"] == 0
+
+
+def test_exhausted_retries_open_the_circuit_and_later_calls_fail_fast():
+    fake = FakeClient(*[httpx.ConnectError("refused")] * 2)
+    client = ModelClient(fake, breaker=CircuitBreaker(failure_threshold=2),
+                         policy=no_backoff(max_retries=1))
+
+    _, error = stream_all(client)
+    assert isinstance(error, httpx.ConnectError)
+    assert client.breaker.state == OPEN
+
+    _, error = stream_all(client)
+    assert isinstance(error, CircuitOpenError)
+    assert fake.calls == 2
+
+
+def test_stopped_consumer_releases_the_breaker_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.before_call()
+    breaker.record_failure()  # Half-open at once: the next call is the probe
+    client = ModelClient(FakeClient([text("a"), text("b")]), breaker=breaker)
+
+    stream = client.stream(model="m", max_tokens=1, messages=[])
+    assert next(stream) == ("text", "a")
+    stream.close()  # Client disconnected
+
+    breaker.before_call()  # Probe slot is free again
+
+
+def test_create_retries_upstream_failures():
+    fake = FakeClient(httpx.ConnectError("refused"), "message")
+    client = ModelClient(fake, policy=no_backoff(max_retries=1))
+
+    assert client.create(model="m", max_tokens=1, messages=[]) == "message"
+    assert fake.calls == 2
+
+
+# ============================================================================
+# astream() (AsyncAnthropic)
+# ============================================================================
+
+class FakeAsyncStream(FakeStream):
+    """Async counterpart of FakeStream: pauses sleep on the event loop."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        chunks = []
+        for step in self.script:
+            if isinstance(step, BaseException):
+                raise step
+            if isinstance(step, tuple):
+                await asyncio.sleep(step[1])
+                continue
+            if step.type == "text":
+                chunks.append(step.text)
+            yield step
+        self.final = SimpleNamespace(content="".join(chunks))
+
+    async def get_final_message(self):
+        return self.final
+
+
+class FakeAsyncClient(FakeClient):
+    def _stream(self, **params):
+        return FakeAsyncStream(self._next())
+
+
+def astream_all(client):
+    async def collect():
+        events = []
+        try:
+            async for event in client.astream(model="m", max_tokens=1, messages=[]):
+                events.append(event)
+        except Exception as e:
+            return events, e
+        return events, None
+
+    return asyncio.run(collect())
+
+
+def test_async_stream_failing_before_the_first_token_is_retried():
+    fake = FakeAsyncClient(httpx.ConnectError("refused"), [text("ok")])
+    client = ModelClient(async_client=fake, policy=no_backoff(max_retries=1))
+
+    events, error = astream_all(client)
+
+    assert error is None
+    assert fake.calls == 2
+    assert events[0] == ("text", "ok")
+    assert events[-1][1].content == "ok"
+
+
+def test_async_stream_is_not_retried_after_the_first_token():
+    fake = FakeAsyncClient([text("a"), httpx.ReadError("reset")], [text("never")])
+    client = ModelClient(async_client=fake, policy=no_backoff(max_retries=2))
+
+    events, error = astream_all(client)
+
+    assert events == [("text", "a")]
+    assert isinstance(error, httpx.ReadError)
+    assert client.breaker.snapshot()["consecutive_failures"] == 1
+
+
+def test_silent_async_stream_is_cut_at_the_first_token_deadline():
+    fake = FakeAsyncClient([pause(0.5), text("late")])
+    client = ModelClient(async_client=fake, policy=CallPolicy(first_token_timeout=0.05, max_retries=0))
+
+    started = time.monotonic()
+    _, error = astream_all(client)
+
+    assert isinstance(error, StreamTimeoutError)
+    assert time.monotonic() - started < 0.3
+
+
+def test_buffered_text_is_sent_once_its_window_passes_on_the_event_loop():
+    # No pause event follows "b": only the window deadline can release it
+    fake = FakeAsyncClient([text("a"), text("b"), pause(0.4), text("c")])
+    client = ModelClient(async_client=fake)
+    answer = StreamedAnswer(client.astream(model="m", max_tokens=1, messages=[]), TextFrameCoalescer(window=0.1))
+
+    async def relay():
+        sent = []
+        started = time.monotonic()
+        async for frame in answer:
+            sent.append((frame, time.monotonic() - started))
+        return sent
+
+    sent = asyncio.run(relay())
+
+    assert [frame for frame, _ in sent] == ['data: {"text": "a"}\n\n', 'data: {"text": "b"}\n\n',
+                                            'data: {"text": "c"}\n\n']
+    assert sent[1][1] < 0.3  # Not held for the upstream's 0.4s pause
+    assert answer.text == "abc" and answer.final_message.content == "abc"
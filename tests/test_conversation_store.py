@@ -0,0 +1,49 @@
+"""
+Conversations must not outlive their session: expired files are purged,
+fresh ones are kept.
+"""
+
+import os
+import time
+
+from utils.conversation_store import ConversationStore, new_conversation
+
+
+def age(store, session_id, seconds):
+    """Backdates a stored conversation's file by seconds."""
+    path = store.directory / f"{session_id}.json"
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_purge_removes_expired_and_keeps_fresh(tmp_path):
+    store = ConversationStore(tmp_path, ttl_seconds=60)
+    for session_id in ("old", "fresh"):
+        store.save(session_id, new_conversation())
+    age(store, "old", 120)
+
+    assert store.purge_expired() == 1
+    assert not (tmp_path / "old.json").exists()
+    assert (tmp_path / "fresh.json").exists()
+    assert store.load("old")["messages"] == []
+
+
+def test_purge_thread_runs_without_further_writes(tmp_path):
+    store = ConversationStore(tmp_path, ttl_seconds=60, purge_interval=0.05)
+    store.save("old", new_conversation())
+    age(store, "old", 120)
+    store.save("fresh", new_conversation())  # Starts the purge thread of this process
+
+    deadline = time.monotonic() + 5
+    while (tmp_path / "old.json").exists() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert not (tmp_path / "old.json").exists()
+    assert (tmp_path / "fresh.json").exists()
+
+
+def test_no_purging_without_ttl(tmp_path):
+    store = ConversationStore(tmp_path)
+    store.save("old", new_conversation())
+    age(store, "old", 10 ** 6)
+    assert store.purge_expired() == 0
+    assert (tmp_path / "old.json").exists()
@@ -0,0 +1,80 @@
+"""
+The incremental request builder must send exactly what ContextWindow selects,
+also across summary refreshes.
+"""
+
+from utils.context_window import ContextWindow
+from utils.request_builder import RequestBuilder
+
+from config.prompts import get_summary_message
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": text}
+
+
+def summary(text, through, updated_at):
+    return {"text": text, "through": through, "state": "intake", "updated_at": updated_at}
+
+
+def sent_texts(payload):
+    """First text block of every request message (the state block follows it)."""
+    return [message["content"][0]["text"] for message in payload["messages"]]
+
+
+def build(builder, conversation):
+    return builder.build(ContextWindow(model_client=None).request_messages(conversation), "intake")
+
+
+def test_appended_turns_reuse_converted_blocks():
+    builder = RequestBuilder()
+    conversation = {"messages": [user("Hallo"), assistant("A1"), user("Ja")]}
+    build(builder, conversation)
+    first = builder._blocks[0]
+
+    conversation["messages"] += [assistant("A2"), user("Nein")]
+    assert sent_texts(build(builder, conversation)) == ["Hallo", "A1", "Ja", "A2", "Nein"]
+    assert builder._blocks[0] is first
+
+
+def test_refreshed_summary_replaces_cached_blocks_despite_repeated_replies():
+    builder = RequestBuilder()
+    messages = [user("Hallo"), assistant("A1"), user("Nein"), assistant("A2"), user("Ja"), assistant("A3"), user("Ja")]
+    conversation = {"messages": messages, "summary": summary("S1", 2, 1.0)}
+    assert sent_texts(build(builder, conversation)) == [
+        get_summary_message("S1"), "Nein", "A2", "Ja", "A3", "Ja"
+    ]
+
+    # Same length and the same message at the last seen position, new summary
+    conversation["messages"] = messages + [assistant("A4"), user("Ja")]
+    conversation["summary"] = summary("S2", 4, 2.0)
+    assert sent_texts(build(builder, conversation)) == [
+        get_summary_message("S2"), "Ja", "A3", "Ja", "A4", "Ja"
+    ]
+
+
+def test_first_summary_replaces_the_first_message():
+    builder = RequestBuilder()
+    conversation = {"messages": [user("Ja"), assistant("A1"), user("Ja")]}
+    build(builder, conversation)
+
+    conversation["messages"] += [assistant("A2"), user("Ja")]
+    conversation["summary"] = summary("S1", 1, 1.0)
+    assert sent_texts(build(builder, conversation)) == [
+        get_summary_message("S1"), "A1", "Ja", "A2", "Ja"
+    ]
+
+
+def test_summary_with_identical_text_but_new_version_is_rebuilt():
+    builder = RequestBuilder()
+    messages = [user("Hallo"), assistant("A1"), user("Ja"), assistant("A2"), user("Ja")]
+    conversation = {"messages": messages, "summary": summary("S", 1, 1.0)}
+    build(builder, conversation)
+
+    conversation["messages"] = messages + [assistant("A3"), user("Ja")]
+    conversation["summary"] = summary("S", 3, 2.0)
+    assert sent_texts(build(builder, conversation)) == [get_summary_message("S"), "A2", "Ja", "A3", "Ja"]
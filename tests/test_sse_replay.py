@@ -0,0 +1,96 @@
+"""
+Replay buffer: frames are batched in memory, persisted for other workers and
+followed live without polling in the producing worker.
+"""
+
+import threading
+import time
+
+from utils.sse_replay import ABANDONED, DONE, LIVE, ReplayBuffer, parse_event_id
+
+
+def frame(text):
+    return f'data: {{"text": "{text}"}}\n\n'
+
+
+def data_frames(frames):
+    """(seq, frame) of the data frames a tail yields (heartbeats skipped)."""
+    for item in frames:
+        if item.startswith("id: "):
+            event_id, _, rest = item.partition("\n")
+            yield parse_event_id(event_id[4:])[1], rest
+
+
+def test_frames_are_persisted_in_batches(tmp_path):
+    writer = ReplayBuffer(str(tmp_path / "replay.db"), flush_interval=3600)
+    other_worker = ReplayBuffer(str(tmp_path / "replay.db"))
+    stream_id, _ = writer.open("session")
+
+    for seq in range(1, 4):
+        writer.append(stream_id, seq, frame(seq))
+    assert other_worker.read(stream_id, 0) == []
+
+    writer.flush(stream_id)
+    assert [seq for seq, _ in other_worker.read(stream_id, 0)] == [1, 2, 3]
+    assert other_worker.stream(stream_id)["last_seq"] == 3
+
+    writer.append(stream_id, 4, frame(4))
+    writer.finish(stream_id, DONE)
+    assert [seq for seq, _ in other_worker.read(stream_id, 0)] == [1, 2, 3, 4]
+    assert other_worker.stream(stream_id)["status"] == DONE
+
+
+def test_local_tail_is_woken_per_frame(tmp_path):
+    buffer = ReplayBuffer(str(tmp_path / "replay.db"), flush_interval=3600)
+    stream_id, _ = buffer.open("session")
+    buffer.append(stream_id, 1, frame("a"))
+
+    received = []
+
+    def read():
+        # A poll interval this long would fail the test if the local tail polled
+        for seq_frame in data_frames(buffer.tail(stream_id, 0, "error", poll_interval=60)):
+            received.append((seq_frame[0], time.monotonic()))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    time.sleep(0.1)
+    sent = time.monotonic()
+    buffer.append(stream_id, 2, frame("b"))
+    time.sleep(0.1)
+    buffer.finish(stream_id, DONE)
+    reader.join(timeout=5)
+
+    assert not reader.is_alive()
+    assert [seq for seq, _ in received] == [1, 2]
+    assert received[1][1] - sent < 0.05
+
+
+def test_tail_from_another_worker_reads_persisted_frames(tmp_path):
+    writer = ReplayBuffer(str(tmp_path / "replay.db"), flush_interval=0)
+    other_worker = ReplayBuffer(str(tmp_path / "replay.db"))
+    stream_id, _ = writer.open("session")
+    writer.append(stream_id, 1, frame("a"))
+
+    def produce():
+        time.sleep(0.1)
+        writer.append(stream_id, 2, frame("b"))
+        writer.finish(stream_id, ABANDONED)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    frames = list(other_worker.tail(stream_id, 0, "cancelled", poll_interval=0.02))
+    producer.join()
+
+    assert [seq for seq, _ in data_frames(frames)] == [1, 2]
+    assert '"cancelled"' in frames[-1]
+
+
+def test_live_status_until_finished(tmp_path):
+    buffer = ReplayBuffer(str(tmp_path / "replay.db"))
+    stream_id, created = buffer.open("session", "key-12345678")
+    assert created
+    assert buffer.open("session", "key-12345678") == (stream_id, False)
+    assert buffer.stream(stream_id)["status"] == LIVE
+    buffer.finish(stream_id, DONE)
+    assert buffer.stream(stream_id)["status"] == DONE
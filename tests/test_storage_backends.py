@@ -0,0 +1,317 @@
+"""
+Both storage backends must behave identically: every test here runs against
+JSONFileBackend and SQLiteBackend.
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+
+import pytest
+
+from utils import storage
+from utils.aggregates import AggregateStore, summarize
+from utils.export import iter_export
+from utils.storage_backends import JSONFileBackend, SQLiteBackend, STAGES
+
+
+BACKENDS = {
+    "json": lambda tmp_path: JSONFileBackend(tmp_path / "responses"),
+    "sqlite": lambda tmp_path: SQLiteBackend(tmp_path / "responses.db"),
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend_name(request):
+    return request.param
+
+
+@pytest.fixture
+def backend(backend_name, tmp_path):
+    return BACKENDS[backend_name](tmp_path)
+
+
+@pytest.fixture
+def configured(backend, tmp_path, monkeypatch):
+    """utils.storage wired to the backend under test, with fresh aggregates."""
+    monkeypatch.setattr(storage, "_backend", backend)
+    monkeypatch.setattr(storage, "_aggregates", None)
+    monkeypatch.setattr(storage, "AGGREGATES_PATH", str(tmp_path / "aggregates.json"))
+    return backend
+
+
+def questionnaire(values, completed_at="2026-01-01T00:00:00Z"):
+    return {
+        "completed_at": completed_at,
+        "answers": [{"question_id": q_id, "value": value} for q_id, value in sorted(values.items())],
+    }
+
+
+def complete_session(backend, session_id, pre, post):
+    backend.save_questionnaire(session_id, "pre_questionnaire", questionnaire(pre))
+    backend.mark_chat_complete(session_id, "2026-01-01T00:10:00Z")
+    backend.save_questionnaire(session_id, "post_questionnaire", questionnaire(post))
+
+
+# ============================================================================
+# Save / load
+# ============================================================================
+
+def test_load_unknown_session_returns_empty_structure(backend):
+    session_data = backend.load_session("missing")
+
+    assert session_data["session_id"] == "missing"
+    assert session_data["pre_questionnaire"] is None
+    assert session_data["chat_completed_at"] is None
+    assert session_data["post_questionnaire"] is None
+
+
+def test_save_and_load_all_stages(backend):
+    complete_session(backend, "s1", {1: 3, 2: 5}, {1: 4, 5: 7})
+
+    session_data = backend.load_session("s1")
+    assert session_data["pre_questionnaire"] == questionnaire({1: 3, 2: 5})
+    assert session_data["chat_completed_at"] == "2026-01-01T00:10:00Z"
+    assert session_data["post_questionnaire"] == questionnaire({1: 4, 5: 7})
+    assert backend.get_session_status("s1") == {
+        "has_pre_questionnaire": True,
+        "has_chat_completion": True,
+        "has_post_questionnaire": True,
+    }
+
+
+def test_save_returns_previous_session_data(backend):
+    first = backend.save_questionnaire("s1", "pre_questionnaire", questionnaire({1: 2}))
+    second = backend.save_questionnaire("s1", "pre_questionnaire", questionnaire({1: 6}))
+
+    assert first["pre_questionnaire"] is None
+    assert second["pre_questionnaire"] == questionnaire({1: 2})
+    assert backend.load_session("s1")["pre_questionnaire"] == questionnaire({1: 6})
+
+
+def test_created_at_survives_later_stages(backend):
+    backend.save_questionnaire("s1", "pre_questionnaire", questionnaire({1: 2}))
+    created_at = backend.load_session("s1")["created_at"]
+    backend.mark_chat_complete("s1", "2026-01-01T00:10:00Z")
+
+    assert backend.load_session("s1")["created_at"] == created_at
+
+
+# ============================================================================
+# Listing and export
+# ============================================================================
+
+def test_list_and_count_completed_sessions(backend):
+    complete_session(backend, "done", {1: 1}, {1: 2})
+    backend.save_questionnaire("pre-only", "pre_questionnaire", questionnaire({1: 4}))
+    backend.save_questionnaire("no-post", "pre_questionnaire", questionnaire({1: 4}))
+    backend.mark_chat_complete("no-post", "2026-01-01T00:10:00Z")
+
+    assert sorted(backend.list_sessions()) == ["done", "no-post", "pre-only"]
+    assert backend.list_sessions(completed_only=True) == ["done"]
+    assert backend.count_sessions() == 3
+    assert backend.count_sessions(completed_only=True) == 1
+    assert backend.get_session_status("pre-only") == {
+        "has_pre_questionnaire": True,
+        "has_chat_completion": False,
+        "has_post_questionnaire": False,
+    }
+
+
+def test_iter_sessions_matches_load_session(backend):
+    complete_session(backend, "a", {1: 1, 2: 2}, {1: 3})
+    backend.save_questionnaire("b", "pre_questionnaire", questionnaire({3: 5}))
+
+    sessions = {s["session_id"]: s for s in backend.iter_sessions()}
+    assert sessions == {sid: backend.load_session(sid) for sid in ("a", "b")}
+    assert [s["session_id"] for s in backend.iter_sessions(completed_only=True)] == ["a"]
+
+
+@pytest.mark.parametrize("export_format", ["json", "ndjson", "csv"])
+def test_export_contains_every_session(backend, export_format):
+    complete_session(backend, "a", {1: 1}, {1: 7})
+    backend.save_questionnaire("b", "pre_questionnaire", questionnaire({2: 4}))
+
+    text = "".join(iter_export(backend.iter_sessions(), export_format))
+
+    if export_format == "json":
+        exported = json.loads(text)
+    elif export_format == "ndjson":
+        exported = [json.loads(line) for line in text.splitlines()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+        assert {row["session_id"]: (row["pre_q1"], row["pre_q2"], row["post_q1"]) for row in rows} == {
+            "a": ("1", "", "7"), "b": ("", "4", "")
+        }
+        return
+    assert sorted(exported, key=lambda s: s["session_id"]) == [backend.load_session("a"), backend.load_session("b")]
+
+
+# ============================================================================
+# Concurrent writers (several Gunicorn workers)
+# ============================================================================
+
+def _write_stage(backend_name, tmp_path, stage, session_ids):
+    backend = BACKENDS[backend_name](tmp_path)
+    for session_id in session_ids:
+        if stage == "chat":
+            backend.mark_chat_complete(session_id, "2026-01-01T00:10:00Z")
+        else:
+            backend.save_questionnaire(session_id, stage, questionnaire({1: 4}))
+
+
+def test_concurrent_writers_lose_no_stage(backend_name, tmp_path):
+    """Each process writes a different stage of the same sessions at the same time."""
+    session_ids = [f"s{i}" for i in range(40)]
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_write_stage, args=(backend_name, tmp_path, stage, session_ids))
+        for stage in STAGES
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    backend = BACKENDS[backend_name](tmp_path)
+    assert sorted(backend.list_sessions(completed_only=True)) == sorted(session_ids)
+    for session_id in session_ids:
+        session_data = backend.load_session(session_id)
+        assert session_data["pre_questionnaire"] and session_data["post_questionnaire"]
+        assert session_data["chat_completed_at"]
+
+
+def test_writes_are_visible_to_other_instances(backend_name, tmp_path):
+    """A second worker's backend sees sessions written after it was created."""
+    reader = BACKENDS[backend_name](tmp_path)
+    assert reader.count_sessions() == 0
+
+    writer = BACKENDS[backend_name](tmp_path)
+    complete_session(writer, "s1", {1: 1}, {1: 2})
+
+    assert reader.count_sessions(completed_only=True) == 1
+    assert reader.get_session_status("s1")["has_post_questionnaire"]
+
+
+# ============================================================================
+# Session manifest (JSON backend)
+# ============================================================================
+
+def test_manifest_rebuilt_from_existing_files(tmp_path):
+    backend = JSONFileBackend(tmp_path / "responses")
+    complete_session(backend, "a", {1: 1}, {1: 2})
+    backend.save_questionnaire("b", "pre_questionnaire", questionnaire({1: 3}))
+    backend.index.path.unlink()
+
+    fresh = JSONFileBackend(tmp_path / "responses")
+    assert sorted(fresh.list_sessions()) == ["a", "b"]
+    assert fresh.list_sessions(completed_only=True) == ["a"]
+
+
+def test_manifest_compaction_keeps_latest_state(tmp_path):
+    backend = JSONFileBackend(tmp_path / "responses")
+    backend.index.compact_min_lines = 5
+    for i in range(4):
+        complete_session(backend, f"s{i}", {1: i + 1}, {1: i + 2})
+
+    lines = backend.index.path.read_text().splitlines()
+    assert len(lines) <= 2 * 4
+    assert JSONFileBackend(tmp_path / "responses").count_sessions(completed_only=True) == 4
+
+
+# ============================================================================
+# Running aggregates
+# ============================================================================
+
+def test_aggregates_follow_saves_and_overwrites(configured, tmp_path):
+    storage.save_pre_questionnaire("a", {1: 2, 2: 5})
+    storage.save_pre_questionnaire("b", {1: 4, 2: 5})
+    storage.save_post_questionnaire("a", {1: 5})
+    storage.save_pre_questionnaire("b", {1: 6, 2: 1})  # Overwrite replaces b's answers
+
+    summary = storage.get_questionnaire_aggregates()
+    assert summary["pre"]["1"]["count"] == 2
+    assert summary["pre"]["1"]["mean"] == 4.0
+    assert summary["pre"]["2"]["mean"] == 3.0
+    assert summary["post"]["1"] == {"count": 1, "mean": 5.0, "variance": 0.0, "sd": 0.0}
+    assert summary["delta"]["1"]["mean"] == 3.0
+
+    rebuilt = AggregateStore(tmp_path / "rebuilt.json")
+    assert rebuilt.rebuild(configured.iter_sessions()) == 2
+    assert summarize(rebuilt.load()) == summary
+
+
+def test_aggregates_built_from_existing_sessions_on_first_use(configured):
+    complete_session(configured, "a", {1: 1}, {1: 3})
+    complete_session(configured, "b", {1: 3}, {1: 3})
+
+    summary = storage.get_questionnaire_aggregates()
+    assert summary["pre"]["1"] == {"count": 2, "mean": 2.0, "variance": 2.0, "sd": 1.4142}
+    assert summary["delta"]["1"]["mean"] == 1.0
+
+
+def test_session_counters_follow_stage_writes(configured, tmp_path):
+    storage.save_pre_questionnaire("a", {1: 2})
+    storage.mark_chat_complete("a")
+    storage.save_pre_questionnaire("b", {1: 4})
+    assert storage.get_session_counts() == {"total": 2, "completed": 0}
+
+    storage.save_post_questionnaire("a", {1: 5})
+    storage.save_post_questionnaire("a", {1: 6})  # Overwrite counts once
+    storage.mark_chat_complete("a")
+    assert storage.get_session_counts() == {"total": 2, "completed": 1}
+    assert storage.get_session_counts() == {
+        "total": configured.count_sessions(),
+        "completed": configured.count_sessions(completed_only=True),
+    }
+
+    rebuilt = AggregateStore(tmp_path / "rebuilt.json")
+    rebuilt.rebuild(configured.iter_sessions())
+    assert rebuilt.load()["sessions"] == {"total": 2, "completed": 1}
+
+
+def test_aggregates_without_session_counters_are_rebuilt(configured, tmp_path):
+    complete_session(configured, "a", {1: 1}, {1: 3})
+    (tmp_path / "aggregates.json").write_text(json.dumps({"pre": {}, "post": {}, "delta": {}}))
+
+    assert storage.get_session_counts() == {"total": 1, "completed": 1}
+    assert storage.get_questionnaire_aggregates()["pre"]["1"]["count"] == 1
+
+
+def _save_through_storage(backend_name, tmp_path, worker, session_ids):
+    """One worker process: first use of the aggregates, then questionnaire saves."""
+    storage._backend = BACKENDS[backend_name](tmp_path)
+    storage._aggregates = None
+    storage.AGGREGATES_PATH = str(tmp_path / "aggregates.json")
+    for i, session_id in enumerate(session_ids):
+        storage.save_pre_questionnaire(session_id, {1: (worker + i) % 7 + 1, 2: worker + 1})
+        storage.save_post_questionnaire(session_id, {1: (worker * i) % 7 + 1})
+
+
+def test_concurrent_saves_and_first_use_rebuild_count_each_session_once(backend_name, tmp_path):
+    """Workers racing the first-use rebuild and overwriting the same sessions stay exact."""
+    backend = BACKENDS[backend_name](tmp_path)
+    for i in range(60):
+        complete_session(backend, f"old{i}", {1: i % 7 + 1}, {1: 4})
+
+    shared = [f"shared{i}" for i in range(15)]  # Written by every worker
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_save_through_storage,
+                        args=(backend_name, tmp_path, worker, shared + [f"w{worker}-{i}" for i in range(15)]))
+        for worker in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    running = AggregateStore(tmp_path / "aggregates.json").load()
+    rebuilt = AggregateStore(tmp_path / "rebuilt.json")
+    rebuilt.rebuild(BACKENDS[backend_name](tmp_path).iter_sessions())
+    assert summarize(running) == summarize(rebuilt.load())
+    assert summarize(running)["pre"]["2"]["count"] == len(shared) + 4 * 15
+    assert running["sessions"] == rebuilt.load()["sessions"] == {"total": 60 + len(shared) + 4 * 15, "completed": 60}
@@ -0,0 +1,191 @@
+"""
+Admission control for chat responses that call Claude.
+Caps how many chat responses stream from Claude at the same time in this
+worker process. Requests above the cap wait in a short first-come,
+first-served queue; when the queue is full they are rejected at once
+(503 with Retry-After) instead of letting every stream slow down and time
+out together under a burst.
+
+A ticket holds its slot for the whole chat response, including the
+auto-continuation, and must be released exactly once (release() is
+idempotent).
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when the wait queue is full."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Admission queue full, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """One chat response's place in the queue, then its slot."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.admitted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.settled: Future = Future()  # Resolves once admitted or released (for event loops)
+
+    @property
+    def waited(self) -> float:
+        """Seconds spent in the queue (so far, if still waiting)."""
+        return (self.admitted_at or time.monotonic()) - self.enqueued_at
+
+    def position(self) -> int:
+        """1-based place in the queue (0 once admitted)."""
+        return self.controller.position(self)
+
+    def wait(self, timeout: float) -> bool:
+        """Waits up to timeout seconds for a slot; True once admitted."""
+        return self.controller.wait(self, timeout)
+
+    def positions(self, max_wait: float, interval: float = 1.0) -> Iterator[int]:
+        """
+        Waits for a slot, yielding the queue position every interval seconds.
+        Ends once admitted or max_wait seconds after enqueueing (check .admitted).
+        """
+        deadline = self.enqueued_at + max_wait
+        while not self.admitted and not self.released:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            position = self.position()
+            if position:
+                yield position
+            self.wait(min(interval, remaining))
+
+    async def apositions(self, max_wait: float, interval: float = 1.0) -> AsyncIterator[int]:
+        """positions() on the event loop: waits without blocking a thread."""
+        settled = asyncio.wrap_future(self.settled)
+        deadline = self.enqueued_at + max_wait
+        while not self.admitted and not self.released:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            position = self.position()
+            if position:
+                yield position
+            await asyncio.wait({settled}, timeout=min(interval, remaining))
+
+    def release(self):
+        self.controller.release(self)
+
+
+class AdmissionController:
+    """Process-wide concurrency cap with a FIFO wait queue (thread-safe)."""
+
+    def __init__(self, max_concurrent: int = 0, max_queue: int = 0, name: str = "claude"):
+        """
+        Args:
+            max_concurrent: Chat responses streaming at the same time (0 = unlimited)
+            max_queue: Requests that may wait for a slot; more are rejected
+            name: Label used in logs and health output
+        """
+        self.max_concurrent = max(0, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.name = name
+
+        self._active = 0
+        self._queue: "deque[AdmissionTicket]" = deque()
+        self._mean_hold = 10.0  # Seconds a slot is held (moving average, initial guess)
+        self._admitted = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    def _retry_after(self) -> float:
+        """Rough time until a new request would get a slot (caller holds _lock)."""
+        waiting = len(self._queue) + 1
+        return max(1.0, math.ceil(self._mean_hold * waiting / max(1, self.max_concurrent)))
+
+    def _admit(self, ticket: AdmissionTicket):
+        ticket.admitted = True
+        ticket.admitted_at = time.monotonic()
+        self._active += 1
+        self._admitted += 1
+        ticket.settled.set_result(True)
+
+    def enter(self) -> AdmissionTicket:
+        """
+        Takes a free slot or a place in the queue.
+
+        Raises:
+            AdmissionRejected: All slots are busy and the queue is full
+        """
+        ticket = AdmissionTicket(self)
+        with self._lock:
+            if not self.enabled or (self._active < self.max_concurrent and not self._queue):
+                self._admit(ticket)
+            elif len(self._queue) < self.max_queue:
+                self._queue.append(ticket)
+            else:
+                self._rejected += 1
+                raise AdmissionRejected(self._retry_after())
+        return ticket
+
+    def wait(self, ticket: AdmissionTicket, timeout: float) -> bool:
+        with self._changed:
+            self._changed.wait_for(lambda: ticket.admitted or ticket.released, max(0.0, timeout))
+            return ticket.admitted
+
+    def position(self, ticket: AdmissionTicket) -> int:
+        with self._lock:
+            if ticket.admitted or ticket.released:
+                return 0
+            try:
+                return self._queue.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def release(self, ticket: AdmissionTicket):
+        """Frees the slot of an admitted ticket or leaves the queue."""
+        with self._changed:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.settled.done():
+                ticket.settled.set_result(False)
+            if ticket.admitted:
+                self._active -= 1
+                if self.enabled:
+                    held = time.monotonic() - ticket.admitted_at
+                    self._mean_hold = 0.8 * self._mean_hold + 0.2 * held
+            else:
+                try:
+                    self._queue.remove(ticket)
+                except ValueError:
+                    pass
+            # Hand free slots to the oldest waiters
+            while self._queue and self._active < self.max_concurrent:
+                self._admit(self._queue.popleft())
+            self._changed.notify_all()
+
+    def snapshot(self) -> Dict:
+        """State for health checks and metrics."""
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self._active,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "mean_hold_seconds": round(self._mean_hold, 1),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+            }
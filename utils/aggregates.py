@@ -0,0 +1,234 @@
+"""
+Running questionnaire aggregates for admin analytics.
+Per-question count, mean and variance (Welford) for the pre- and
+post-questionnaire, plus paired pre -> post deltas for the questions that
+are repeated in both, and the number of stored and completed sessions.
+Updated on every stage write and persisted, so reading them costs the same
+no matter how many sessions were collected.
+"""
+
+import json
+import math
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config.questions import get_pre_questionnaire, get_post_questionnaire
+from utils.fileio import atomic_write_text, file_lock
+
+
+def paired_question_ids() -> List[int]:
+    """Question IDs asked with identical text before and after the chat."""
+    post_texts = {q["id"]: q["text"] for q in get_post_questionnaire()}
+    return [q["id"] for q in get_pre_questionnaire() if post_texts.get(q["id"]) == q["text"]]
+
+
+PAIRED_QUESTION_IDS = paired_question_ids()  # 1-4
+
+QUESTION_GROUPS = ("pre", "post", "delta")
+
+
+def empty_aggregates() -> Dict:
+    """Returns the initial aggregate state."""
+    return {"pre": {}, "post": {}, "delta": {}, "sessions": {"total": 0, "completed": 0}}
+
+
+def _add(stats: Dict, key: str, value: float):
+    """Welford update: adds one observation."""
+    entry = stats.setdefault(key, {"count": 0, "mean": 0.0, "m2": 0.0})
+    entry["count"] += 1
+    delta = value - entry["mean"]
+    entry["mean"] += delta / entry["count"]
+    entry["m2"] += delta * (value - entry["mean"])
+
+
+def _remove(stats: Dict, key: str, value: float):
+    """Inverse Welford update: removes one previously added observation."""
+    entry = stats.get(key)
+    if not entry or entry["count"] == 0:
+        return
+    if entry["count"] == 1:
+        del stats[key]
+        return
+    old_mean = entry["mean"]
+    entry["count"] -= 1
+    entry["mean"] = (old_mean * (entry["count"] + 1) - value) / entry["count"]
+    entry["m2"] = max(0.0, entry["m2"] - (value - entry["mean"]) * (value - old_mean))
+
+
+def _answers(questionnaire: Optional[Dict]) -> Dict[int, int]:
+    if not questionnaire:
+        return {}
+    return {a["question_id"]: a["value"] for a in questionnaire.get("answers", [])}
+
+
+def contributions(session_data: Optional[Dict]) -> List[Tuple[str, str, float]]:
+    """
+    Observations a session contributes to the aggregates.
+
+    Returns:
+        list: (group, question_id, value) with group "pre", "post" or "delta"
+    """
+    if not session_data:
+        return []
+    pre = _answers(session_data.get("pre_questionnaire"))
+    post = _answers(session_data.get("post_questionnaire"))
+
+    observations = [("pre", str(q), v) for q, v in pre.items()]
+    observations += [("post", str(q), v) for q, v in post.items()]
+    observations += [
+        ("delta", str(q), post[q] - pre[q])
+        for q in PAIRED_QUESTION_IDS if q in pre and q in post
+    ]
+    return observations
+
+
+def session_flags(session_data: Optional[Dict]) -> Tuple[int, int]:
+    """
+    Session counters a session contributes to.
+
+    Returns:
+        tuple: (stored, completed), 1 if the session has at least one / all stages
+    """
+    if not session_data:
+        return 0, 0
+    stages = [
+        session_data.get("pre_questionnaire"),
+        session_data.get("chat_completed_at"),
+        session_data.get("post_questionnaire"),
+    ]
+    return int(any(s is not None for s in stages)), int(all(s is not None for s in stages))
+
+
+def apply_change(aggregates: Dict, previous: Optional[Dict], current: Optional[Dict]):
+    """Replaces a session's previous contributions with its current ones."""
+    for group, key, value in contributions(previous):
+        _remove(aggregates[group], key, value)
+    for group, key, value in contributions(current):
+        _add(aggregates[group], key, value)
+
+    (was_stored, was_completed), (stored, completed) = session_flags(previous), session_flags(current)
+    sessions = aggregates["sessions"]
+    sessions["total"] += stored - was_stored
+    sessions["completed"] += completed - was_completed
+
+
+def summarize(aggregates: Dict) -> Dict:
+    """
+    Turns the raw aggregate state into count / mean / variance / sd per question.
+
+    Returns:
+        dict: {"pre": {...}, "post": {...}, "delta": {...}} keyed by question ID
+    """
+    summary = {}
+    for group in QUESTION_GROUPS:
+        stats = aggregates[group]
+        summary[group] = {}
+        for key in sorted(stats, key=int):
+            entry = stats[key]
+            variance = entry["m2"] / (entry["count"] - 1) if entry["count"] > 1 else 0.0
+            summary[group][key] = {
+                "count": entry["count"],
+                "mean": round(entry["mean"], 4),
+                "variance": round(variance, 4),
+                "sd": round(math.sqrt(variance), 4),
+            }
+    return summary
+
+
+class AggregateStore:
+    """Aggregates persisted in one small JSON file, shared by all workers."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(f".{self.path.name}.lock")
+        self._cached: Tuple[Optional[int], Optional[Dict]] = (None, None)
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return empty_aggregates()
+
+    def _write(self, aggregates: Dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.path, json.dumps(aggregates))
+
+    def _apply_locked(self, previous: Optional[Dict], current: Optional[Dict]):
+        """Updates the aggregates file (caller holds the file lock)."""
+        if (contributions(previous) == contributions(current)
+                and session_flags(previous) == session_flags(current)):
+            return
+        aggregates = self._read()
+        apply_change(aggregates, previous, current)
+        self._write(aggregates)
+
+    def apply(self, previous: Optional[Dict], current: Optional[Dict]):
+        """
+        Updates the aggregates after a session changed.
+
+        Args:
+            previous: Session data before the write (None for new sessions)
+            current: Session data after the write
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            self._apply_locked(previous, current)
+
+    def update(self, write: Callable[[], Tuple[Optional[Dict], Dict]]):
+        """
+        Runs a session write and applies its change under the aggregate lock.
+
+        A concurrent rebuild() therefore sees the write either together with
+        its update or not at all, and two writes of the same session are
+        applied in the order they were stored.
+
+        Args:
+            write: Stores the session; returns (previous, current) session data
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            previous, current = write()
+            self._apply_locked(previous, current)
+
+    def is_current(self) -> bool:
+        """True if the aggregates file exists and already holds the session counters."""
+        return self.path.exists() and "sessions" in self._read()
+
+    def load(self) -> Dict:
+        """Returns the current aggregates (re-read only when the file changed)."""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return empty_aggregates()
+
+        with self._lock:
+            if self._cached[0] != mtime_ns:
+                self._cached = (mtime_ns, self._read())
+            return self._cached[1]
+
+    def rebuild(self, sessions: Iterable[Dict], if_missing: bool = False) -> int:
+        """
+        Recomputes the aggregates from scratch (recovery / first migration).
+        The lock is held for the whole scan, so no update() runs in between.
+
+        Args:
+            sessions: Session data, iterated under the lock (pass a lazy iterator)
+            if_missing: Only rebuild if no current aggregates file exists yet
+
+        Returns:
+            int: Number of sessions processed
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            if if_missing and self.is_current():
+                return 0  # Another worker built it while we waited for the lock
+            aggregates = empty_aggregates()
+            count = 0
+            for session_data in sessions:
+                apply_change(aggregates, None, session_data)
+                count += 1
+            self._write(aggregates)
+        return count
@@ -0,0 +1,17 @@
+"""
+Gunicorn worker for GUNICORN_WORKER_CLASS=uvicorn (see asgi.py).
+
+uvicorn's Gunicorn worker ignores worker_connections; this one caps the
+requests a worker holds open at WORKER_REQUEST_SLOTS and answers further
+ones with a 503, as gevent workers stop accepting at worker_connections.
+Kept apart from asgi.py so the Gunicorn master can load it without
+importing the app.
+"""
+
+from uvicorn_worker import UvicornWorker as _UvicornWorker
+
+from config.performance import WORKER_REQUEST_SLOTS
+
+
+class UvicornWorker(_UvicornWorker):
+    CONFIG_KWARGS = {**_UvicornWorker.CONFIG_KWARGS, 'limit_concurrency': WORKER_REQUEST_SLOTS}
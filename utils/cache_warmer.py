@@ -0,0 +1,229 @@
+"""
+Prompt-cache warmer for the chat system prompt.
+The cached prefix (tools + ~7 KB system prompt) expires five minutes after
+its last use, so the first turn after a quiet period pays cache creation and
+a slower time-to-first-token. While chat traffic is active, the warmer sends
+a minimal request (max_tokens=1) for every routed model whose prefix has not
+been used for CACHE_WARMER_INTERVAL seconds, which reads the cache and
+resets its lifetime.
+
+The state block is not part of the cached prefix (see utils/request_builder.py),
+so all states routed to the same model share one prefix and one refresh.
+
+Exactly one worker refreshes: the warmer thread of every worker tries to take
+a process-lifetime file lock and only the holder works; if it exits, another
+worker takes over. Prefix use and the token spend of the warmer are shared
+through a small SQLite file, and the daily spend is capped.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from utils.claude_client import summarize_usage
+from utils.fileio import try_lock_forever
+from utils.metrics import CACHE_WARMER_REFRESHES, CACHE_WARMER_TOKENS
+from utils.sqlite_connection import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+WARMER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prefix_usage (
+    model TEXT PRIMARY KEY,
+    used_at REAL NOT NULL DEFAULT 0,
+    warmed_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS warmer_spend (
+    day TEXT PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0,
+    cache_creation INTEGER NOT NULL DEFAULT 0,
+    cache_read INTEGER NOT NULL DEFAULT 0,
+    input INTEGER NOT NULL DEFAULT 0,
+    output INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0
+);
+"""
+
+# Price of each token type relative to an uncached input token (Anthropic
+# pricing: cache writes 1.25x, cache reads 0.1x, output 5x)
+COST_WEIGHTS = {"cache_creation": 1.25, "cache_read": 0.1, "input": 1.0, "output": 5.0}
+
+
+def token_cost(usage: Dict) -> float:
+    """Cost of one call in uncached input-token equivalents."""
+    return sum(usage[token_type] * weight for token_type, weight in COST_WEIGHTS.items())
+
+
+class CacheWarmer:
+    """Keeps the cached prompt prefix of each routed model alive during traffic."""
+
+    def __init__(self, model_client, warm_request: Callable[[str], Dict], states: Iterable[str],
+                 db_path: str, lock_path: str, interval: float = 240, active_window: float = 1800,
+                 daily_budget: float = 200000, check_interval: float = 15, enabled: bool = False):
+        """
+        Args:
+            model_client: ModelClient used for the refresh calls
+            warm_request: Returns messages.create parameters (including model) for a state
+            states: Conversation states whose prefixes are kept warm
+            db_path: SQLite file shared by all workers (prefix use, spend)
+            lock_path: Lock file that elects the refreshing worker
+            interval: Refresh a prefix unused for this many seconds (cache lifetime: 300)
+            active_window: Only refresh while a chat request happened this recently
+            daily_budget: Max warmer spend per day in uncached input-token equivalents
+            check_interval: Seconds between two checks of the refreshing worker
+            enabled: Off by default; record_use() is a no-op while disabled
+        """
+        self.model_client = model_client
+        self.warm_request = warm_request
+        self.states = list(states)
+        self.lock_path = lock_path
+        self.interval = interval
+        self.active_window = active_window
+        self.daily_budget = daily_budget
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self._connections = ThreadLocalConnection(db_path, WARMER_SCHEMA)
+        self._recorded: Dict[str, float] = {}  # model -> last used_at written by this process
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid = None
+        self._leader = False
+        self._budget_logged_day = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Request side (every worker)
+    # ------------------------------------------------------------------
+
+    def record_use(self, model: str):
+        """Notes that a chat request used (and refreshed) the prefix of a model."""
+        if not self.enabled:
+            return
+        self._ensure_thread()
+        now = time.time()
+        # At most one write per model and process every few seconds
+        if now - self._recorded.get(model, 0.0) < min(10.0, self.interval / 4):
+            return
+        self._recorded[model] = now
+        self._connections.get().execute(
+            "INSERT INTO prefix_usage (model, used_at) VALUES (?, ?) "
+            "ON CONFLICT(model) DO UPDATE SET used_at = MAX(used_at, excluded.used_at)",
+            (model, now)
+        )
+
+    def _ensure_thread(self):
+        """Starts the warmer thread in this process (again after a fork)."""
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._leader = False
+            self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Refresher (one worker)
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                if not self._leader:
+                    self._leader = try_lock_forever(self.lock_path)
+                    if self._leader:
+                        logger.info("Prompt cache warmer active in this worker")
+                if self._leader:
+                    self.tick()
+            except Exception as e:
+                logger.warning(f"Prompt cache warmer check failed: {e!r}")
+
+    def _prefixes(self) -> Dict[str, Dict]:
+        """One refresh request per model, with the states it covers."""
+        prefixes: Dict[str, Dict] = {}
+        for state in self.states:
+            request = self.warm_request(state)
+            entry = prefixes.setdefault(request["model"], {"request": request, "states": []})
+            entry["states"].append(state)
+        return prefixes
+
+    def tick(self, now: Optional[float] = None):
+        """Refreshes every prefix that is due, within the daily budget."""
+        now = time.time() if now is None else now
+        usage = {row[0]: (row[1], row[2]) for row in self._connections.get().execute(
+            "SELECT model, used_at, warmed_at FROM prefix_usage"
+        )}
+        last_traffic = max((used_at for used_at, _ in usage.values()), default=0.0)
+        if now - last_traffic > self.active_window:
+            return  # Quiet: let the cache expire
+
+        for model, prefix in self._prefixes().items():
+            used_at, warmed_at = usage.get(model, (0.0, 0.0))
+            if now - max(used_at, warmed_at) < self.interval:
+                continue
+            if self.spent_today()["cost"] >= self.daily_budget:
+                day = time.strftime("%Y-%m-%d")
+                if self._budget_logged_day != day:
+                    self._budget_logged_day = day
+                    logger.warning(f"Prompt cache warmer paused: daily budget of {self.daily_budget:g} spent")
+                CACHE_WARMER_REFRESHES.inc(model=model, outcome="over_budget")
+                return
+            self.warm(model, prefix["request"], prefix["states"])
+
+    def warm(self, model: str, request: Dict, states=()):
+        """Sends one refresh request and records its token spend."""
+        started = time.perf_counter()
+        try:
+            response = self.model_client.create(**request)
+        except Exception as e:
+            logger.warning(f"Prompt cache refresh for {model} failed: {e!r}")
+            CACHE_WARMER_REFRESHES.inc(model=model, outcome="error")
+            return
+        usage = summarize_usage(response.usage)
+        cost = token_cost(usage)
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO prefix_usage (model, warmed_at) VALUES (?, ?) "
+                "ON CONFLICT(model) DO UPDATE SET warmed_at = excluded.warmed_at",
+                (model, time.time())
+            )
+            conn.execute(
+                "INSERT INTO warmer_spend (day, requests, cache_creation, cache_read, input, output, cost) "
+                "VALUES (?, 1, ?, ?, ?, ?, ?) ON CONFLICT(day) DO UPDATE SET "
+                "requests = requests + 1, cache_creation = cache_creation + excluded.cache_creation, "
+                "cache_read = cache_read + excluded.cache_read, input = input + excluded.input, "
+                "output = output + excluded.output, cost = cost + excluded.cost",
+                (time.strftime("%Y-%m-%d"), usage["cache_creation"], usage["cache_read"],
+                 usage["input"], usage["output"], cost)
+            )
+        logger.info(
+            f"Prompt cache refreshed for {model} ({', '.join(states)}): read={usage['cache_read']}, "
+            f"created={usage['cache_creation']}, cost={cost:.0f}, {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        CACHE_WARMER_REFRESHES.inc(model=model, outcome="warmed")
+        for token_type in COST_WEIGHTS:
+            CACHE_WARMER_TOKENS.inc(usage[token_type], type=token_type)
+
+    def spent_today(self) -> Dict:
+        row = self._connections.get().execute(
+            "SELECT requests, cache_creation, cache_read, input, output, cost FROM warmer_spend WHERE day = ?",
+            (time.strftime("%Y-%m-%d"),)
+        ).fetchone() or (0, 0, 0, 0, 0, 0.0)
+        keys = ("requests", "cache_creation", "cache_read", "input", "output", "cost")
+        return dict(zip(keys, row))
+
+    def snapshot(self) -> Dict:
+        """State for health checks."""
+        if not self.enabled:
+            return {"enabled": False}
+        spent = self.spent_today()
+        return {
+            "enabled": True,
+            "refreshing_worker": self._leader,
+            "spent_today": round(spent["cost"]),
+            "refreshes_today": spent["requests"],
+            "daily_budget": self.daily_budget,
+        }
@@ -0,0 +1,135 @@
+"""
+Circuit breaker for upstream Claude API calls.
+After a run of consecutive upstream failures the circuit opens and calls fail
+immediately instead of tying up a worker until the request times out. After
+the cool-down a single probe call is let through (half-open); its outcome
+closes the circuit again or restarts the cool-down.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Process-wide closed / open / half-open breaker (thread-safe)."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60, name: str = "claude"):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe is allowed
+            name: Label used in logs and health output
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.name = name
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _current_state(self, now: float) -> str:
+        """State with the open -> half-open timeout applied (caller holds _lock)."""
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self.reset_timeout - (now - self._opened_at))
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected without a probe slot."""
+        return self.state == OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit admits a probe call (0 unless open)."""
+        with self._lock:
+            now = time.monotonic()
+            return self._retry_after(now) if self._current_state(now) == OPEN else 0.0
+
+    def before_call(self):
+        """
+        Admits one call or raises CircuitOpenError.
+
+        In half-open state only one probe call is admitted at a time; every
+        admitted call must be followed by record_success, record_failure or
+        release.
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._rejected += 1
+            raise CircuitOpenError(self._retry_after(now) if state == OPEN else 1.0)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit '{self.name}' closed after successful probe")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self._failures += 1
+            state = self._current_state(time.monotonic())
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self._times_opened += 1
+                logger.warning(
+                    f"Circuit '{self.name}' opened after {self._failures} consecutive failures "
+                    f"(last error: {error!r}); failing fast for {self.reset_timeout:.0f}s"
+                )
+
+    def release(self):
+        """Ends an admitted call without an outcome (e.g. the client went away)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        """State for health checks and metrics."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_after": round(self._retry_after(now), 1) if state == OPEN else 0.0,
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected,
+            }
@@ -0,0 +1,501 @@
+"""
+Claude API access for the chat endpoints.
+Wraps the Anthropic client so that every call runs under a CallPolicy
+(timeouts, first-token deadline, retries) and a circuit breaker.
+
+The ASGI chat route (asgi.py) streams through AsyncAnthropic instead
+(ModelClient.astream): upstream waits then run on the worker's event loop
+and hold no thread.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+
+import anthropic
+import httpx
+
+from utils.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+class StreamTimeoutError(Exception):
+    """Raised when a stream misses its first-token deadline or goes idle."""
+
+
+# Stream events that carry model output (the first one ends the first-token wait)
+CONTENT_EVENTS = ('content_block_start', 'content_block_delta', 'text', 'input_json')
+
+
+def _continues_text(event) -> bool:
+    """True for text events and the raw delta the SDK sends ahead of each of them."""
+    if event.type == 'text':
+        return True
+    return event.type == 'content_block_delta' and getattr(event.delta, 'type', None) == 'text_delta'
+
+
+class CallPolicy:
+    """Timeouts and retry budget applied to every Claude call."""
+
+    def __init__(self, connect_timeout: float = 5.0, first_token_timeout: float = 20.0,
+                 idle_timeout: float = 30.0, max_retries: int = 2,
+                 retry_base_delay: float = 0.5, retry_max_delay: float = 4.0):
+        """
+        Args:
+            connect_timeout: Seconds to establish the upstream connection
+            first_token_timeout: Seconds from request start to the first content event
+            idle_timeout: Max seconds between two stream events (HTTP read timeout)
+            max_retries: Extra attempts, only before anything reached the client
+            retry_base_delay: Backoff base in seconds (doubles per attempt)
+            retry_max_delay: Backoff cap in seconds
+        """
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max(0, int(max_retries))
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    def http_timeout(self) -> anthropic.Timeout:
+        """Per-request httpx timeout (read timeout = inter-event idle timeout)."""
+        return anthropic.Timeout(
+            connect=self.connect_timeout,
+            read=self.idle_timeout,
+            write=self.connect_timeout,
+            pool=self.connect_timeout
+        )
+
+    def stream_timeout(self) -> anthropic.Timeout:
+        """
+        httpx timeout for a stream request: waiting for the response headers
+        is bounded by the first-token deadline as well (the body is read with
+        the idle timeout, see ModelClient._stream_once).
+        """
+        return anthropic.Timeout(
+            connect=self.connect_timeout,
+            read=min(self.idle_timeout, self.first_token_timeout),
+            write=self.connect_timeout,
+            pool=self.connect_timeout
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before retry number attempt + 1."""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+
+class _Watchdog:
+    """
+    One thread per process that runs callbacks at their deadlines, unless
+    cancelled first. Used to cut streams that stay silent past the
+    first-token deadline without a timer thread per stream.
+
+    Only keys of callbacks that are still due are kept in _pending; cancelling
+    a callback that already ran (or was cancelled) leaves no state behind.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._pending = set()
+        self._changed = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+
+    def schedule(self, deadline: float, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Runs callback at deadline (time.monotonic()).
+
+        Returns:
+            Cancel function (safe to call more than once)
+        """
+        key = next(self._order)
+        with self._changed:
+            self._ensure_thread()
+            heapq.heappush(self._heap, (deadline, key, callback))
+            self._pending.add(key)
+            self._changed.notify()
+
+        def cancel():
+            with self._changed:
+                self._pending.discard(key)
+        return cancel
+
+    def _ensure_thread(self):
+        """Starts the watchdog thread in this process (again after a fork)."""
+        if self._thread is None or self._thread_pid != os.getpid():
+            self._heap, self._pending = [], set()
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='claude-watchdog', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._heap:
+                    self._changed.wait()
+                deadline, key, callback = self._heap[0]
+                if key not in self._pending:
+                    heapq.heappop(self._heap)  # Cancelled
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._changed.wait(remaining)
+                    continue
+                heapq.heappop(self._heap)
+                self._pending.discard(key)
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Stream watchdog callback failed: {e!r}")
+
+
+_watchdog = _Watchdog()
+
+
+def _set_read_timeout(response, seconds: float):
+    """Sets the read timeout used for the body of a response not yet read from."""
+    timeouts = response.request.extensions.get('timeout')
+    if isinstance(timeouts, dict):
+        timeouts['read'] = seconds
+
+
+def _abort_response(response):
+    """Wakes a read blocked on the response's socket (closing alone does not)."""
+    network_stream = response.extensions.get('network_stream')
+    sock = network_stream.get_extra_info('socket') if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    True for errors that indicate a degraded API (network, timeouts, 429, 5xx),
+    as opposed to errors caused by the request itself.
+    """
+    if isinstance(error, (anthropic.APIConnectionError, StreamTimeoutError, httpx.TransportError)):
+        return True  # httpx errors surface unwrapped while the stream body is read
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def summarize_usage(usage) -> Dict:
+    """
+    Token usage of one Claude call, including the prompt cache hit ratio.
+
+    Args:
+        usage: Usage object of a Message (may lack cache fields)
+
+    Returns:
+        dict: cache_creation, cache_read, input, output, total_input, cache_hit_ratio
+    """
+    cache_creation = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    input_tokens = getattr(usage, 'input_tokens', 0) or 0
+    output_tokens = getattr(usage, 'output_tokens', 0) or 0
+    total_input = cache_creation + cache_read + input_tokens
+
+    return {
+        "cache_creation": cache_creation,
+        "cache_read": cache_read,
+        "input": input_tokens,
+        "output": output_tokens,
+        "total_input": total_input,
+        "cache_hit_ratio": cache_read / total_input if total_input else 0.0,
+    }
+
+
+class ModelClient:
+    """
+    Runs Claude calls through the shared Anthropic client.
+
+    stream() (astream() on the event loop) yields ("text", chunk) events
+    while the answer is generated and
+    finishes with one ("message", final_message) event. A ("pause", None)
+    event follows the last chunk of a text run when the next event is not
+    text (end of the block, tool input, ping), so callers that buffer text
+    can send it before the upstream goes quiet.
+
+    Every call passes through a circuit breaker: while it is open, create()
+    and stream() raise CircuitOpenError without contacting the API. Upstream
+    failures are retried per CallPolicy, but a stream is never retried once
+    it has yielded an event.
+    """
+
+    def __init__(self, client=None, breaker: Optional[CircuitBreaker] = None,
+                 policy: Optional[CallPolicy] = None, async_client=None):
+        """
+        Args:
+            client: anthropic.Anthropic instance
+            breaker: Circuit breaker shared by all calls of this process
+            policy: Timeouts and retries (create clients with max_retries=0)
+            async_client: anthropic.AsyncAnthropic instance for astream() (ASGI workers)
+        """
+        self.client = client
+        self.async_client = async_client
+        self.breaker = breaker or CircuitBreaker()
+        self.policy = policy or CallPolicy()
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    @property
+    def async_available(self) -> bool:
+        return self.async_client is not None
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def create(self, **params):
+        """Non-streaming messages.create call."""
+        params.setdefault('timeout', self.policy.http_timeout())
+        attempt = 0
+        while True:
+            try:
+                return self._create_once(params)
+            except Exception as e:
+                if attempt >= self.policy.max_retries or not is_upstream_failure(e):
+                    raise
+                self._wait_before_retry(attempt, e)
+                attempt += 1
+
+    def stream(self, **params) -> Iterator[Tuple[str, object]]:
+        """Streaming messages.stream call as ("text", str) / ("pause", None) / ("message", Message) events."""
+        params.setdefault('timeout', self.policy.stream_timeout())
+        return self._stream_with_retries(params)
+
+    def astream(self, **params) -> AsyncIterator[Tuple[str, object]]:
+        """stream() on the running event loop, through the AsyncAnthropic client."""
+        params.setdefault('timeout', self.policy.stream_timeout())
+        return self._astream_with_retries(params)
+
+    # ------------------------------------------------------------------
+    # Retries
+    # ------------------------------------------------------------------
+
+    def _retry_delay(self, attempt: int, error: BaseException) -> float:
+        delay = self.policy.backoff(attempt)
+        logger.warning(
+            f"Claude call attempt {attempt + 1} failed before the first token ({error!r}), "
+            f"retrying in {delay:.2f}s"
+        )
+        return delay
+
+    def _wait_before_retry(self, attempt: int, error: BaseException):
+        time.sleep(self._retry_delay(attempt, error))
+
+    def _stream_with_retries(self, params: Dict) -> Iterator[Tuple[str, object]]:
+        attempt = 0
+        while True:
+            started = False
+            try:
+                for item in self._guard_stream(params):
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                if started or attempt >= self.policy.max_retries or not is_upstream_failure(e):
+                    raise
+                self._wait_before_retry(attempt, e)
+                attempt += 1
+
+    async def _astream_with_retries(self, params: Dict) -> AsyncIterator[Tuple[str, object]]:
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async for item in self._aguard_stream(params):
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                if started or attempt >= self.policy.max_retries or not is_upstream_failure(e):
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+
+    # ------------------------------------------------------------------
+    # Circuit breaker
+    # ------------------------------------------------------------------
+
+    def _record_error(self, error: BaseException):
+        if is_upstream_failure(error):
+            self.breaker.record_failure(error)
+        else:
+            self.breaker.release()
+
+    def _create_once(self, params: Dict):
+        self.breaker.before_call()
+        try:
+            response = self.client.messages.create(**params)
+        except Exception as e:
+            self._record_error(e)
+            raise
+        self.breaker.record_success()
+        return response
+
+    def _guard_stream(self, params: Dict) -> Iterator[Tuple[str, object]]:
+        """Admits one stream attempt through the breaker and records how it ended."""
+        self.breaker.before_call()
+        events = self._stream_once(params)
+
+        settled = False
+        try:
+            for event, payload in events:
+                if event == 'message':
+                    self.breaker.record_success()
+                    settled = True
+                yield event, payload
+        except Exception as e:
+            if not settled:
+                self._record_error(e)
+                settled = True
+            raise
+        finally:
+            if not settled:
+                # Consumer stopped early (client disconnect): no verdict on upstream health
+                self.breaker.release()
+
+    async def _aguard_stream(self, params: Dict) -> AsyncIterator[Tuple[str, object]]:
+        """_guard_stream() for astream()."""
+        self.breaker.before_call()
+        events = self._astream_once(params)
+
+        settled = False
+        try:
+            async for event, payload in events:
+                if event == 'message':
+                    self.breaker.record_success()
+                    settled = True
+                yield event, payload
+        except Exception as e:
+            if not settled:
+                self._record_error(e)
+                settled = True
+            raise
+        finally:
+            await events.aclose()
+            if not settled:
+                self.breaker.release()
+
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+
+    def _stream_once(self, params: Dict) -> Iterator[Tuple[str, object]]:
+        """
+        One stream attempt with an exact first-token deadline:
+        - until the response headers arrive, the HTTP read timeout is capped
+          at the deadline (CallPolicy.stream_timeout)
+        - afterwards the body is read with the idle timeout, the deadline is
+          checked on every event (the API sends pings while the model is
+          thinking), and a watchdog cuts the connection if the upstream
+          stays silent past the deadline
+        """
+        deadline = time.monotonic() + self.policy.first_token_timeout
+        started = False
+        expired = False
+        settle = threading.Lock()  # First content vs. watchdog: whichever comes first wins
+
+        def timed_out() -> StreamTimeoutError:
+            return StreamTimeoutError(
+                f"No output within {self.policy.first_token_timeout:g}s first-token deadline"
+            )
+
+        with self.client.messages.stream(**params) as stream:
+            if time.monotonic() > deadline:
+                raise timed_out()
+            _set_read_timeout(stream.response, self.policy.idle_timeout)
+
+            def expire():
+                nonlocal expired
+                with settle:
+                    if started:
+                        return
+                    expired = True
+                _abort_response(stream.response)
+            cancel_watchdog = _watchdog.schedule(deadline, expire)
+            in_text = False
+            try:
+                for event in stream:
+                    if event.type in CONTENT_EVENTS and not started:
+                        with settle:
+                            if expired:
+                                raise timed_out()
+                            started = True
+                        cancel_watchdog()
+                    elif not started and time.monotonic() > deadline:
+                        raise timed_out()
+                    if event.type == 'text':
+                        in_text = True
+                        yield 'text', event.text
+                    elif in_text and not _continues_text(event):
+                        in_text = False
+                        yield 'pause', None
+            except Exception as e:
+                if expired and not isinstance(e, StreamTimeoutError):
+                    raise timed_out() from e
+                raise
+            finally:
+                cancel_watchdog()
+            yield 'message', stream.get_final_message()
+
+    async def _astream_once(self, params: Dict) -> AsyncIterator[Tuple[str, object]]:
+        """
+        One stream attempt on the event loop. Waiting for the response headers
+        and for the first content event is bounded by the first-token deadline,
+        every later wait for an event by the idle timeout. A missed deadline
+        cancels the pending read, so no watchdog is needed.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.policy.first_token_timeout
+        started = False
+
+        async def within(awaitable, timeout: float):
+            try:
+                return await asyncio.wait_for(awaitable, max(0.0, timeout))
+            except asyncio.TimeoutError:
+                if started:
+                    message = f"No stream event within {self.policy.idle_timeout:g}s idle timeout"
+                else:
+                    message = f"No output within {self.policy.first_token_timeout:g}s first-token deadline"
+                raise StreamTimeoutError(message) from None
+
+        manager = self.async_client.messages.stream(**params)
+        stream = await within(manager.__aenter__(), deadline - loop.time())
+        try:
+            _set_read_timeout(stream.response, self.policy.idle_timeout)
+            events = stream.__aiter__()
+            in_text = False
+            while True:
+                timeout = self.policy.idle_timeout
+                if not started:
+                    timeout = min(timeout, deadline - loop.time())
+                try:
+                    event = await within(events.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                if event.type in CONTENT_EVENTS:
+                    started = True
+                if event.type == 'text':
+                    in_text = True
+                    yield 'text', event.text
+                elif in_text and not _continues_text(event):
+                    in_text = False
+                    yield 'pause', None
+            yield 'message', await stream.get_final_message()
+        finally:
+            await manager.__aexit__(None, None, None)
@@ -0,0 +1,159 @@
+"""
+Bounded context window for Claude requests.
+Older turns are replaced by a persisted running summary; only the turns since
+the last summary are sent verbatim. The summary (and with it the request
+prefix) changes only on a phase change or when the verbatim part overflows,
+so prompt caching keeps working between refreshes.
+
+The summary lives in the conversation as:
+    {"text": str, "through": int, "state": str, "updated_at": float}
+where "through" is the number of leading messages it covers.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+
+from config.prompts import SUMMARY_PROMPT, get_summary_message
+
+logger = logging.getLogger(__name__)
+
+
+def _transcript(messages: List[Dict]) -> str:
+    """Renders messages as a plain-text transcript for the summarizer."""
+    lines = []
+    for msg in messages:
+        if msg.get('content', '').strip():
+            speaker = "User" if msg['role'] == 'user' else "Assistant"
+            lines.append(f"{speaker}: {msg['content'].strip()}")
+        if msg.get('tool_use'):
+            lines.append(f"[Phase transition to {msg['tool_use']['input'].get('state', '?')}]")
+    return "\n\n".join(lines)
+
+
+class SummaryJob:
+    """A summary refresh running next to the response stream."""
+
+    def __init__(self, target):
+        self._future: Future = Future()
+        self._thread = threading.Thread(target=self._run, args=(target,), name='context-summary', daemon=True)
+        self._thread.start()
+
+    def _run(self, target):
+        result = None
+        try:
+            result = target()
+        except Exception as e:
+            logger.warning(f"Context summary refresh failed: {e}")
+        self._future.set_result(result)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: float) -> Optional[Dict]:
+        """Waits up to timeout seconds; returns the new summary or None."""
+        try:
+            return self._future.result(timeout)
+        except FutureTimeoutError:
+            return None
+
+    async def wait(self, timeout: float) -> bool:
+        """Waits up to timeout seconds on the event loop; True once done."""
+        done, _ = await asyncio.wait({asyncio.wrap_future(self._future)}, timeout=max(0.0, timeout))
+        return bool(done)
+
+
+class ContextWindow:
+    """Selects the messages sent to Claude and maintains the running summary."""
+
+    def __init__(self, model_client, keep_turns: int = 6, max_turns: int = 12,
+                 model: str = "claude-haiku-4-5-20251001", max_tokens: int = 400):
+        """
+        Args:
+            model_client: ModelClient used for summary calls
+            keep_turns: Turns (user + assistant) kept verbatim after a refresh
+            max_turns: Verbatim turns that force a refresh within a phase
+            model: Model used to write the summary
+            max_tokens: Output budget of one summary call
+        """
+        self.model_client = model_client
+        self.keep_messages = max(1, keep_turns) * 2
+        self.max_messages = max(keep_turns, max_turns) * 2
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def request_messages(self, conversation: Dict) -> List[Dict]:
+        """
+        Summary message (if any) followed by the verbatim messages.
+
+        The summary message carries the summary's version, so request builders
+        see a new first message whenever the summary is refreshed.
+        """
+        messages = conversation.get('messages', [])
+        summary = conversation.get('summary')
+        if not summary:
+            return messages
+        return [{
+            'role': 'user',
+            'content': get_summary_message(summary['text']),
+            'summary_version': (summary['through'], summary.get('updated_at'))
+        }] + messages[summary['through']:]
+
+    def _split_point(self, messages: List[Dict]) -> int:
+        """Index of the first message kept verbatim after a refresh."""
+        through = max(0, len(messages) - self.keep_messages)
+        # Never separate a tool_result from the tool call it answers
+        while through > 0 and messages[through].get('tool_result'):
+            through -= 1
+        return through
+
+    def needs_refresh(self, conversation: Dict) -> bool:
+        """True after a phase change or when the verbatim part grew too long."""
+        messages = conversation.get('messages', [])
+        summary = conversation.get('summary') or {}
+        through = summary.get('through', 0)
+        if self._split_point(messages) <= through:
+            return False  # Nothing old enough to summarize
+        # Without a summary the conversation is still in its first phase (intake)
+        if summary.get('state', 'intake') != conversation.get('current_state'):
+            return True
+        return len(messages) - through > self.max_messages
+
+    def start_refresh(self, conversation: Dict, session_id: str = "unknown") -> SummaryJob:
+        """
+        Starts summarizing the turns that leave the verbatim window.
+
+        Works on a snapshot, so the caller can keep streaming and appending.
+        Apply the result with conversation['summary'] = job.result(timeout).
+        """
+        messages = list(conversation.get('messages', []))
+        previous = conversation.get('summary') or {}
+        start = previous.get('through', 0)
+        through = self._split_point(messages)
+        state = conversation.get('current_state')
+
+        def summarize() -> Dict:
+            started = time.perf_counter()
+            prompt = ""
+            if previous.get('text'):
+                prompt += f"Current summary:\n{previous['text']}\n\n"
+            prompt += f"New turns to merge into the summary:\n\n{_transcript(messages[start:through])}"
+
+            response = self.model_client.create(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                system=SUMMARY_PROMPT,
+                messages=[{'role': 'user', 'content': prompt}]
+            )
+            text = "".join(block.text for block in response.content if getattr(block, 'type', None) == 'text')
+            logger.info(
+                f"Session {session_id} - Context summary: messages {start}-{through}, "
+                f"input={response.usage.input_tokens}, output={response.usage.output_tokens}, "
+                f"duration_ms={(time.perf_counter() - started) * 1000:.0f}, state={state}"
+            )
+            return {"text": text.strip(), "through": through, "state": state, "updated_at": time.time()}
+
+        return SummaryJob(summarize)
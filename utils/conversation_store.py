@@ -0,0 +1,202 @@
+"""
+Server-side conversation store for chat sessions.
+Keeps the chat history out of the signed session cookie: conversations are
+kept in a bounded in-memory LRU (hot tier) backed by one JSON file per
+session under data/conversations (durable tier).
+
+Conversations expire with the session cookie: a background thread per
+process deletes files idle for longer than the TTL every purge_interval
+seconds, so transcripts are not kept beyond the session lifetime.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils.fileio import atomic_write_text
+
+logger = logging.getLogger(__name__)
+
+
+def new_conversation() -> Dict:
+    """Returns an empty conversation in the initial intake state."""
+    return {
+        "messages": [],
+        "current_state": "intake",
+        "interaction_count": 0,
+        "session_completed": False,
+        "updated_at": time.time(),
+    }
+
+
+def _copy_conversation(conversation: Dict) -> Dict:
+    """Copies a conversation so callers can append without touching the cache."""
+    copied = dict(conversation)
+    copied["messages"] = list(conversation.get("messages", []))
+    return copied
+
+
+class ConversationStore:
+    """
+    Two-tier conversation store keyed by session_id.
+
+    The hot tier is a per-process LRU; every hit is validated against the
+    durable file's mtime so a conversation written by another worker is
+    never served stale.
+    """
+
+    def __init__(self, directory, max_cached: int = 512, ttl_seconds: Optional[int] = None,
+                 purge_interval: float = 600):
+        """
+        Args:
+            directory: Directory for the durable JSON files
+            max_cached: Maximum number of conversations kept in memory
+            ttl_seconds: Conversations idle for longer than this are discarded
+            purge_interval: Seconds between purges of expired files (see start_purging)
+        """
+        self.directory = Path(directory)
+        self.max_cached = max_cached
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._cache = OrderedDict()  # session_id -> (mtime_ns, conversation)
+        self._lock = threading.Lock()
+        self._purge_pid = None
+
+    def _path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.json"
+
+    def _is_expired(self, conversation: Dict) -> bool:
+        if not self.ttl_seconds:
+            return False
+        return time.time() - conversation.get("updated_at", 0) > self.ttl_seconds
+
+    def _remember(self, session_id: str, mtime_ns: int, conversation: Dict):
+        with self._lock:
+            self._cache[session_id] = (mtime_ns, conversation)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def load(self, session_id: str) -> Dict:
+        """
+        Loads a conversation, or returns a fresh one if none exists.
+
+        Args:
+            session_id: UUID session identifier
+
+        Returns:
+            dict: Conversation (safe to modify; call save() to persist)
+        """
+        file_path = self._path(session_id)
+        try:
+            mtime_ns = file_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self.discard(session_id)
+            return new_conversation()
+
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None and cached[0] == mtime_ns:
+                self._cache.move_to_end(session_id)
+                conversation = cached[1]
+            else:
+                conversation = None
+
+        if conversation is None:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    conversation = json.load(f)
+            except (OSError, ValueError):
+                return new_conversation()
+            self._remember(session_id, mtime_ns, conversation)
+
+        if self._is_expired(conversation):
+            self.delete(session_id)
+            return new_conversation()
+
+        return _copy_conversation(conversation)
+
+    def save(self, session_id: str, conversation: Dict):
+        """
+        Persists a conversation to both tiers.
+
+        Args:
+            session_id: UUID session identifier
+            conversation: Conversation dictionary
+        """
+        self.start_purging()
+        conversation = _copy_conversation(conversation)
+        conversation["updated_at"] = time.time()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        file_path = self._path(session_id)
+        # Atomic replace without fsync: conversations are short-lived working state
+        atomic_write_text(
+            file_path,
+            json.dumps(conversation, ensure_ascii=False, separators=(',', ':')),
+            durable=False
+        )
+
+        self._remember(session_id, file_path.stat().st_mtime_ns, conversation)
+
+    def discard(self, session_id: str):
+        """Drops a conversation from the hot tier only."""
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def delete(self, session_id: str):
+        """Removes a conversation from both tiers."""
+        self.discard(session_id)
+        try:
+            self._path(session_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self) -> int:
+        """
+        Deletes durable conversations idle for longer than the TTL.
+
+        Returns:
+            int: Number of conversations removed
+        """
+        if not self.ttl_seconds or not self.directory.exists():
+            return 0
+
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for file_path in self.directory.glob("*.json"):
+            try:
+                if file_path.stat().st_mtime < cutoff:
+                    self.delete(file_path.stem)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def start_purging(self):
+        """
+        Starts the purge thread of this process (once per process, again
+        after a fork). Called on every save and when a Gunicorn worker boots.
+        """
+        if not self.ttl_seconds or self._purge_pid == os.getpid():
+            return
+        with self._lock:
+            if self._purge_pid == os.getpid():
+                return
+            self._purge_pid = os.getpid()
+        threading.Thread(target=self._purge_forever, name='conversation-purge', daemon=True).start()
+
+    def _purge_forever(self):
+        while True:
+            try:
+                removed = self.purge_expired()
+                if removed:
+                    logger.info(f"Purged {removed} expired conversations")
+            except Exception as e:
+                logger.warning(f"Conversation purge failed: {e!r}")
+            time.sleep(self.purge_interval)
@@ -0,0 +1,134 @@
+"""
+Streaming export of questionnaire data for /api/download-data.
+Sessions are serialized one at a time (JSON, NDJSON or wide CSV, optionally
+gzip-compressed), so memory use and time-to-first-byte stay constant no
+matter how many sessions the study has collected.
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+from config.questions import get_pre_questionnaire, get_post_questionnaire
+
+
+EXPORT_FORMATS = {
+    # format: (mimetype, file extension)
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def iter_json(sessions: Iterable[Dict]) -> Iterator[str]:
+    """Streams sessions as one pretty-printed JSON array (the original format)."""
+    yield "["
+    first = True
+    for session_data in sessions:
+        item = json.dumps(session_data, indent=2, ensure_ascii=False)
+        yield ("\n" if first else ",\n") + "  " + item.replace("\n", "\n  ")
+        first = False
+    yield "\n]\n" if not first else "]\n"
+
+
+def iter_ndjson(sessions: Iterable[Dict]) -> Iterator[str]:
+    """Streams sessions as newline-delimited JSON, one session per line."""
+    for session_data in sessions:
+        yield json.dumps(session_data, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+
+def csv_columns() -> List[str]:
+    """
+    Returns the wide CSV header: one row per session, one column per question.
+
+    Returns:
+        list: Column names (pre_q1..pre_qN, post_q1..post_qM from config/questions.py)
+    """
+    return (
+        ["session_id", "created_at", "pre_completed_at", "chat_completed_at", "post_completed_at"]
+        + [f"pre_q{q['id']}" for q in get_pre_questionnaire()]
+        + [f"post_q{q['id']}" for q in get_post_questionnaire()]
+    )
+
+
+def session_to_row(session_data: Dict) -> Dict:
+    """Flattens one session into a wide CSV row."""
+    pre = session_data.get("pre_questionnaire") or {}
+    post = session_data.get("post_questionnaire") or {}
+
+    row = {
+        "session_id": session_data.get("session_id"),
+        "created_at": session_data.get("created_at"),
+        "pre_completed_at": pre.get("completed_at"),
+        "chat_completed_at": session_data.get("chat_completed_at"),
+        "post_completed_at": post.get("completed_at"),
+    }
+    for answer in pre.get("answers", []):
+        row[f"pre_q{answer['question_id']}"] = answer["value"]
+    for answer in post.get("answers", []):
+        row[f"post_q{answer['question_id']}"] = answer["value"]
+    return row
+
+
+def iter_csv(sessions: Iterable[Dict]) -> Iterator[str]:
+    """Streams sessions as wide CSV, one row per session."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=csv_columns(), extrasaction='ignore')
+
+    writer.writeheader()
+    for session_data in sessions:
+        writer.writerow(session_to_row(session_data))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only if there are no sessions
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_export(sessions: Iterable[Dict], export_format: str) -> Iterator[str]:
+    """
+    Streams sessions in the requested export format.
+
+    Args:
+        sessions: Iterable of session data dictionaries
+        export_format: "json", "ndjson" or "csv"
+
+    Returns:
+        iterator: Text chunks
+    """
+    if export_format == "json":
+        return iter_json(sessions)
+    if export_format == "ndjson":
+        return iter_ndjson(sessions)
+    if export_format == "csv":
+        return iter_csv(sessions)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def gzip_chunks(chunks: Iterable[str], flush_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Gzip-compresses a text stream incrementally.
+
+    Args:
+        chunks: Text chunks
+        flush_bytes: Uncompressed bytes buffered before compressed output is emitted
+
+    Returns:
+        iterator: Gzip-compressed byte chunks
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    pending = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending += len(data)
+        compressed = compressor.compress(data)
+        if pending >= flush_bytes:
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if compressed:
+            yield compressed
+    yield compressor.flush()
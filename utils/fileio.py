@@ -0,0 +1,139 @@
+"""
+Crash-safe file writes and inter-process file locks.
+Used by the JSON storage backend and the conversation store so that several
+Gunicorn workers can write the same files without lost updates or
+truncated files.
+"""
+
+import os
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+def _fsync_directory(directory: Path):
+    """Persists a rename by syncing the containing directory (POSIX only)."""
+    try:
+        dir_fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write_text(path, text: str, durable: bool = True):
+    """
+    Writes a text file atomically: temp file + fsync + rename.
+
+    Readers see either the old or the new content, never a truncated file,
+    even if the process crashes mid-write. The file gets 0o600 permissions.
+
+    Args:
+        path: Target file path
+        text: File content
+        durable: fsync file and directory before returning
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            # Set secure file permissions (owner read/write only: 0o600)
+            os.chmod(tmp_name, stat.S_IRUSR | stat.S_IWUSR)
+        except OSError:
+            # On Windows or if permissions can't be set, continue anyway
+            pass
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+    if durable:
+        _fsync_directory(path.parent)
+
+
+LOCK_POLL_INTERVAL = 0.005  # Seconds between lock attempts
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(key: str) -> threading.Lock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(key)
+        if lock is None:
+            lock = _thread_locks[key] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Exclusive lock on a lock file, held across threads and processes.
+
+    Args:
+        lock_path: Path of the lock file (created if missing)
+    """
+    lock_path = Path(lock_path)
+
+    if fcntl is None:
+        with _thread_lock(str(lock_path)):
+            yield
+        return
+
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(lock_path), os.O_RDWR | os.O_CREAT, stat.S_IRUSR | stat.S_IWUSR)
+    try:
+        # Poll instead of a blocking flock so gevent workers keep serving
+        # other greenlets while waiting (time.sleep is cooperative there)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(LOCK_POLL_INTERVAL)
+        yield
+    finally:
+        os.close(fd)  # Closing the descriptor releases the flock
+
+
+def try_lock_forever(lock_path) -> bool:
+    """
+    Takes an exclusive lock on a lock file without waiting and keeps it for
+    the rest of this process's life (the OS releases it when the process
+    exits). Used to elect one worker for a background job.
+
+    Returns:
+        True if this process holds the lock
+    """
+    if fcntl is None:
+        return True  # Single-process platforms: no other worker to defer to
+
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(lock_path), os.O_RDWR | os.O_CREAT, stat.S_IRUSR | stat.S_IWUSR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    return True  # fd intentionally left open: it holds the lock
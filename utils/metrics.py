@@ -0,0 +1,358 @@
+"""
+In-process metrics with Prometheus text exposition, aggregated across workers.
+Every worker records counters and histograms in memory and periodically
+writes a snapshot to its own file (data/metrics/worker-<pid>.json). /metrics
+merges all snapshots, so any worker can answer a scrape for the whole server.
+Snapshots of exited workers are folded into archive.json by the Gunicorn
+master, which keeps counters monotonic across worker restarts.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config.performance import METRICS_DIR, METRICS_FLUSH_INTERVAL
+from utils.fileio import atomic_write_text, file_lock
+
+
+ARCHIVE_FILE = "archive.json"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def histogram_stats(buckets: Sequence[float], value) -> Dict:
+    """
+    Count, mean and p50/p95/p99 of one histogram sample. Quantiles are the
+    upper bound of the bucket they fall into (None above the last bucket).
+    """
+    counts, total, count = value
+    stats = {"count": count, "mean": total / count if count else None}
+    for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        bound = next((b for b, c in zip(buckets, counts) if count and c >= q * count), math.inf)
+        stats[name] = None if bound == math.inf else bound
+    return stats
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str,
+                 labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def describe(self) -> Dict:
+        return {"type": self.kind, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry.update(self, self._key(labels), lambda value: (value or 0) + amount)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets: Iterable[float] = ()):
+        self.buckets = sorted(buckets)
+        super().__init__(registry, name, documentation, labelnames)
+
+    def observe(self, value: float, **labels):
+        def add(state):
+            counts, total, count = state or ([0] * len(self.buckets), 0.0, 0)
+            counts = list(counts)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            return counts, total + value, count + 1
+
+        self.registry.update(self, self._key(labels), add)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with-block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def describe(self) -> Dict:
+        return {**super().describe(), "buckets": self.buckets}
+
+
+class MetricsRegistry:
+    """Metrics of one worker process plus the cross-worker exposition."""
+
+    def __init__(self, directory, flush_interval: float = 5.0):
+        """
+        Args:
+            directory: Directory shared by all workers for snapshot files
+            flush_interval: Minimum seconds between two snapshot writes
+        """
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self._metrics: Dict[str, _Metric] = {}
+        self._values: Dict[str, Dict[Tuple[str, ...], object]] = {}
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+        self._values.setdefault(metric.name, {})
+
+    def update(self, metric: _Metric, key: Tuple[str, ...], change):
+        """Applies change(old_value) -> new_value and flushes if due."""
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Forked: values recorded before the fork belong to the parent
+                self._pid = os.getpid()
+                self._values = {name: {} for name in self._metrics}
+            values = self._values[metric.name]
+            values[key] = change(values.get(key))
+            self._dirty = True
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        """This worker's metrics in the snapshot file format."""
+        with self._lock:
+            return {
+                name: {
+                    **metric.describe(),
+                    "samples": [[list(key), value] for key, value in self._values[name].items()],
+                }
+                for name, metric in self._metrics.items()
+            }
+
+    def flush(self, force: bool = False):
+        """Writes this worker's snapshot file (at most once per flush_interval)."""
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._last_flush < self.flush_interval):
+                return
+            self._last_flush = time.monotonic()
+            self._dirty = False
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(
+                self.directory / f"worker-{os.getpid()}.json", json.dumps(self.snapshot()), durable=False
+            )
+        except OSError:
+            with self._lock:
+                self._dirty = True
+
+    @staticmethod
+    def _read(path: Path) -> Dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def merge(target: Dict, snapshot: Dict):
+        """Adds one snapshot into another (counters and histograms are summed)."""
+        for name, family in snapshot.items():
+            merged = target.setdefault(name, {**family, "samples": []})
+            samples = {tuple(labels): value for labels, value in merged["samples"]}
+            for labels, value in family["samples"]:
+                key = tuple(labels)
+                if key not in samples:
+                    samples[key] = value
+                elif family["type"] == "histogram":
+                    counts, total, count = samples[key]
+                    samples[key] = (
+                        [a + b for a, b in zip(counts, value[0])], total + value[1], count + value[2]
+                    )
+                else:
+                    samples[key] = samples[key] + value
+            merged["samples"] = [[list(key), value] for key, value in samples.items()]
+
+    def collect(self) -> Dict:
+        """Merged snapshot of all workers (current, exited and archived)."""
+        self.flush(force=True)
+        merged: Dict = {}
+        for path in sorted(self.directory.glob("*.json")):
+            self.merge(merged, self._read(path))
+        # Metrics defined but not yet observed anywhere still get HELP/TYPE lines
+        for name, metric in self._metrics.items():
+            merged.setdefault(name, {**metric.describe(), "samples": []})
+        return merged
+
+    def archive(self, pid: Optional[int] = None):
+        """
+        Folds the snapshot of an exited worker into archive.json. Without a pid,
+        all snapshots are folded; only valid while no worker is running.
+        Called by the Gunicorn master (child_exit / on_starting hooks).
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        pattern = f"worker-{pid}.json" if pid is not None else "worker-*.json"
+        with file_lock(self.directory / ".archive.lock"):
+            paths = list(self.directory.glob(pattern))
+            if not paths:
+                return
+            archive_path = self.directory / ARCHIVE_FILE
+            archived = self._read(archive_path)
+            for path in paths:
+                self.merge(archived, self._read(path))
+            atomic_write_text(archive_path, json.dumps(archived))
+            for path in paths:
+                path.unlink()
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for name, family in sorted(self.collect().items()):
+            labelnames = family["labelnames"]
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for labels, value in sorted(family["samples"], key=lambda sample: sample[0]):
+                if family["type"] == "histogram":
+                    counts, total, count = value
+                    for bound, bucket_count in zip(family["buckets"], counts):
+                        le = f'le="{_format_value(bound)}"'
+                        lines.append(f"{name}_bucket{_label_text(labelnames, labels, le)} {bucket_count}")
+                    inf = 'le="+Inf"'
+                    lines.append(f"{name}_bucket{_label_text(labelnames, labels, inf)} {count}")
+                    lines.append(f"{name}_sum{_label_text(labelnames, labels)} {_format_value(total)}")
+                    lines.append(f"{name}_count{_label_text(labelnames, labels)} {count}")
+                else:
+                    lines.append(f"{name}{_label_text(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# Application metrics
+# ============================================================================
+
+registry = MetricsRegistry(METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL)
+
+CHAT_TIME_TO_FIRST_TOKEN = Histogram(
+    registry, "chat_time_to_first_token_seconds",
+    "Seconds from the Claude request to the first streamed text",
+    ["state", "call"], buckets=(0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30)
+)
+CHAT_STREAM_DURATION = Histogram(
+    registry, "chat_stream_duration_seconds",
+    "Seconds from the Claude request to the end of the stream",
+    ["state", "call"], buckets=(0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+)
+CHAT_TOKENS_PER_SECOND = Histogram(
+    registry, "chat_output_tokens_per_second",
+    "Output tokens per second after the first token",
+    ["state"], buckets=(5, 10, 20, 30, 40, 60, 80, 100, 150, 200)
+)
+CLAUDE_TOKENS = Counter(
+    registry, "claude_tokens_total",
+    "Claude tokens by type (cache_creation, cache_read, input, output)",
+    ["type", "state"]
+)
+AUTO_CONTINUATIONS = Counter(
+    registry, "chat_auto_continuations_total",
+    "Continuation responses generated after a transition_state call",
+    ["state"]
+)
+STATE_TRANSITIONS = Counter(
+    registry, "chat_state_transitions_total",
+    "Conversation phase transitions",
+    ["from_state", "to_state"]
+)
+CLIENT_DISCONNECTS = Counter(
+    registry, "chat_client_disconnects_total",
+    "Chat streams abandoned by the client, by stage (first, continuation, finishing)",
+    ["stage"]
+)
+CHAT_DUPLICATE_REQUESTS = Counter(
+    registry, "chat_duplicate_requests_total",
+    "Repeated /api/chat requests (same idempotency key) attached to an existing stream",
+    ["status"]
+)
+CHAT_ADMISSION_WAIT = Histogram(
+    registry, "chat_admission_wait_seconds",
+    "Seconds queued chat responses waited for a Claude slot, by outcome (admitted, timed_out, left)",
+    ["outcome"], buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30)
+)
+CHAT_ADMISSION_REJECTIONS = Counter(
+    registry, "chat_admission_rejections_total",
+    "Chat requests rejected with 503 because the admission queue was full"
+)
+CHAT_MODEL_TIME_TO_FIRST_TOKEN = Histogram(
+    registry, "chat_model_time_to_first_token_seconds",
+    "Seconds from the Claude request to the first streamed text, by state and routed model",
+    ["state", "model"], buckets=(0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 8, 13, 20, 30)
+)
+CHAT_MODEL_STREAM_DURATION = Histogram(
+    registry, "chat_model_stream_duration_seconds",
+    "Seconds from the Claude request to the end of the stream, by state and routed model",
+    ["state", "model"], buckets=(0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+)
+CHAT_MAX_TOKENS_STOPS = Counter(
+    registry, "chat_max_tokens_stops_total",
+    "Claude responses cut off by the routed max_tokens, by state and model",
+    ["state", "model"]
+)
+CACHE_WARMER_REFRESHES = Counter(
+    registry, "prompt_cache_warmer_refreshes_total",
+    "Prompt cache refresh attempts by model and outcome (warmed, error, over_budget)",
+    ["model", "outcome"]
+)
+CACHE_WARMER_TOKENS = Counter(
+    registry, "prompt_cache_warmer_tokens_total",
+    "Tokens billed for prompt cache refreshes by type (cache_creation, cache_read, input, output)",
+    ["type"]
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    registry, "rate_limit_rejections_total",
+    "Requests rejected by the rate limiter",
+    ["endpoint"]
+)
+STORAGE_WRITE_SECONDS = Histogram(
+    registry, "storage_write_seconds",
+    "Latency of research data and conversation writes",
+    ["operation"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
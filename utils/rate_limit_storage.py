@@ -0,0 +1,177 @@
+"""
+SQLite storage backend for Flask-Limiter (via the `limits` library).
+Shares rate limit counters between all Gunicorn workers on one host without
+an external service, so "20 per hour" means 20 per hour regardless of the
+worker count. Expired counters are purged periodically so the storage does
+not grow without bound.
+
+Importing this module registers the "sqlite" storage scheme:
+    storage_uri="sqlite:///data/ratelimits.db"   (relative path)
+    storage_uri="sqlite:////var/lib/app/rl.db"   (absolute path)
+"""
+
+import itertools
+import sqlite3
+import time
+from typing import Tuple
+
+from limits.storage import MovingWindowSupport, Storage
+
+from utils.sqlite_connection import ThreadLocalConnection
+
+
+RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_counters (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_counters_expires ON rate_counters(expires_at);
+CREATE TABLE IF NOT EXISTS rate_window_entries (
+    key TEXT NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_window_key ON rate_window_entries(key, acquired_at);
+CREATE INDEX IF NOT EXISTS idx_rate_window_expires ON rate_window_entries(expires_at);
+"""
+
+
+def path_from_uri(uri: str) -> str:
+    """Maps sqlite:///relative.db and sqlite:////absolute.db to a file path."""
+    path = uri.split("://", 1)[1]
+    return path[1:] if path.startswith("/") else path
+
+
+class SQLiteRateLimitStorage(Storage, MovingWindowSupport):
+    """
+    Fixed-window and moving-window rate limit storage in a WAL-mode SQLite file.
+
+    Every check is one short IMMEDIATE transaction, which serializes
+    concurrent workers correctly while readers stay lock-free.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, purge_interval: int = 1000, **options):
+        """
+        Args:
+            uri: sqlite:///path/to/file.db
+            wrap_exceptions: Wrap sqlite3 errors in limits.errors.StorageError
+            purge_interval: Writes between purges of expired keys
+        """
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._connections = ThreadLocalConnection(path_from_uri(uri), RATE_LIMIT_SCHEMA)
+        self.purge_interval = max(1, int(purge_interval))
+        self._writes = itertools.count(1)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _purge_expired(self, conn: sqlite3.Connection, now: float):
+        """Deletes expired keys every purge_interval writes (caller holds a transaction)."""
+        if next(self._writes) % self.purge_interval:
+            return
+        conn.execute("DELETE FROM rate_counters WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM rate_window_entries WHERE expires_at <= ?", (now,))
+
+    # ------------------------------------------------------------------
+    # Fixed window
+    # ------------------------------------------------------------------
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT count, expires_at FROM rate_counters WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                count, expires_at = amount, now + expiry
+            else:
+                count = row[0] + amount
+                expires_at = now + expiry if elastic_expiry else row[1]
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_counters (key, count, expires_at) VALUES (?, ?, ?)",
+                (key, count, expires_at)
+            )
+            self._purge_expired(conn, now)
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connections.get().execute(
+            "SELECT count FROM rate_counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connections.get().execute(
+            "SELECT expires_at FROM rate_counters WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    # ------------------------------------------------------------------
+    # Moving window
+    # ------------------------------------------------------------------
+
+    def acquire_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+
+        now = time.time()
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM rate_window_entries WHERE key = ? AND acquired_at <= ?", (key, now - expiry)
+            )
+            count = conn.execute(
+                "SELECT COUNT(*) FROM rate_window_entries WHERE key = ?", (key,)
+            ).fetchone()[0]
+            if count + amount > limit:
+                return False
+            conn.executemany(
+                "INSERT INTO rate_window_entries (key, acquired_at, expires_at) VALUES (?, ?, ?)",
+                [(key, now, now + expiry)] * amount
+            )
+            self._purge_expired(conn, now)
+        return True
+
+    def get_moving_window(self, key: str, limit: int, expiry: int) -> Tuple[float, int]:
+        now = time.time()
+        oldest, count = self._connections.get().execute(
+            "SELECT MIN(acquired_at), COUNT(*) FROM rate_window_entries WHERE key = ? AND acquired_at > ?",
+            (key, now - expiry)
+        ).fetchone()
+        return (oldest, count) if count else (now, 0)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def check(self) -> bool:
+        try:
+            self._connections.get().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            removed = conn.execute("SELECT COUNT(*) FROM rate_counters").fetchone()[0]
+            removed += conn.execute("SELECT COUNT(DISTINCT key) FROM rate_window_entries").fetchone()[0]
+            conn.execute("DELETE FROM rate_counters")
+            conn.execute("DELETE FROM rate_window_entries")
+        return removed
+
+    def clear(self, key: str) -> None:
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM rate_counters WHERE key = ?", (key,))
+            conn.execute("DELETE FROM rate_window_entries WHERE key = ?", (key,))
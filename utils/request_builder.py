@@ -0,0 +1,166 @@
+"""
+Incremental Messages API request builder with prompt cache placement.
+One builder per conversation keeps the converted content blocks across turns
+and only appends new messages instead of rebuilding the whole payload.
+
+Cache breakpoints (the API allows at most 4 per request):
+- the static system prompt
+- the tail of the conversation history (what the next turn will reuse)
+- stable checkpoints every N turns, so long conversations keep hitting the
+  cache even beyond the API's 20-block lookback from the tail
+
+The dynamic state block is appended after the tail breakpoint, so state and
+interaction count changes never invalidate cached history.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from config.prompts import get_system_blocks, get_state_block
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def message_blocks(message: Dict) -> List[Dict]:
+    """
+    Converts a stored conversation message into API content blocks.
+
+    Besides plain text, auto-continuation turns carry a transition_state call
+    ('tool_use', assistant) or its answer ('tool_result', user).
+    """
+    blocks = []
+    if message.get('tool_result'):
+        result = message['tool_result']
+        blocks.append({
+            "type": "tool_result",
+            "tool_use_id": result['tool_use_id'],
+            "content": result['content']
+        })
+    if message.get('content', '').strip():
+        blocks.append({"type": "text", "text": message['content']})
+    if message.get('tool_use'):
+        blocks.append({"type": "tool_use", **message['tool_use']})
+    return blocks
+
+
+def _with_cache_control(message: Dict) -> Dict:
+    """Copies a converted message with cache_control on its last content block."""
+    content = list(message["content"])
+    content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+    return {"role": message["role"], "content": content}
+
+
+class RequestBuilder:
+    """Builds system + messages payloads for one conversation."""
+
+    def __init__(self, breakpoint_interval: int = 8, max_breakpoints: int = 4):
+        """
+        Args:
+            breakpoint_interval: Messages between stable cache checkpoints
+            max_breakpoints: Maximum cache breakpoints per request (API limit: 4)
+        """
+        self.breakpoint_interval = max(1, breakpoint_interval)
+        self.max_breakpoints = max_breakpoints
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._blocks: List[Dict] = []  # Converted messages, never mutated after append
+        self._source_count = 0
+        self._first_source = None
+        self._last_source = None
+
+    def _sync(self, messages: List[Dict]):
+        """
+        Converts messages not seen yet; rebuilds if the history was replaced.
+
+        A refreshed summary changes the first message (see
+        ContextWindow.request_messages); otherwise the history only grows, so
+        comparing the first and the last seen message is enough.
+        """
+        if len(messages) < self._source_count or (self._source_count and (
+            messages[0] != self._first_source or messages[self._source_count - 1] != self._last_source
+        )):
+            self._reset()
+
+        for msg in messages[self._source_count:]:
+            content = message_blocks(msg)
+            # Skip empty messages to prevent API errors
+            if not content:
+                continue
+            self._blocks.append({"role": msg['role'], "content": content})
+
+        self._source_count = len(messages)
+        self._first_source = dict(messages[0]) if messages else None
+        self._last_source = dict(messages[-1]) if messages else None
+
+    def _cache_positions(self, tail: int) -> List[int]:
+        """Message indices that get a cache breakpoint (tail + stable checkpoints)."""
+        positions = [tail]
+        message_breakpoints = self.max_breakpoints - 1  # One is used by the system prompt
+        checkpoint = (tail // self.breakpoint_interval) * self.breakpoint_interval - 1
+        while checkpoint >= 0 and len(positions) < message_breakpoints:
+            if checkpoint != tail:
+                positions.append(checkpoint)
+            checkpoint -= self.breakpoint_interval
+        return positions
+
+    def build(self, messages: List[Dict], state: str, interaction_count: int = 0) -> Dict:
+        """
+        Builds the request payload for the current turn.
+
+        Args:
+            messages: Conversation messages ({'role', 'content'} dicts, see message_blocks)
+            state: Current conversation state
+            interaction_count: Number of exchanges in strategies state
+
+        Returns:
+            dict: {"system": [...], "messages": [...]} for messages.create/stream
+        """
+        with self._lock:
+            self._sync(messages)
+            api_messages = list(self._blocks)
+
+        if not api_messages:
+            return {"system": get_system_blocks(), "messages": api_messages}
+
+        tail = len(api_messages) - 1
+        for position in self._cache_positions(tail):
+            api_messages[position] = _with_cache_control(api_messages[position])
+
+        # Dynamic state goes after the tail breakpoint, into the latest user turn
+        state_block = {"type": "text", "text": get_state_block(state, interaction_count)}
+        for index in range(tail, -1, -1):
+            if api_messages[index]["role"] == "user":
+                message = api_messages[index]
+                api_messages[index] = {
+                    "role": "user",
+                    "content": list(message["content"]) + [state_block]
+                }
+                break
+
+        return {"system": get_system_blocks(), "messages": api_messages}
+
+
+class RequestBuilderCache:
+    """Bounded per-process LRU of request builders keyed by session_id."""
+
+    def __init__(self, max_size: int = 512, breakpoint_interval: int = 8, max_breakpoints: int = 4):
+        self.max_size = max_size
+        self.breakpoint_interval = breakpoint_interval
+        self.max_breakpoints = max_breakpoints
+        self._builders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> RequestBuilder:
+        """Returns the builder for a session, creating it if needed."""
+        with self._lock:
+            builder = self._builders.get(session_id)
+            if builder is None:
+                builder = RequestBuilder(self.breakpoint_interval, self.max_breakpoints)
+                self._builders[session_id] = builder
+            self._builders.move_to_end(session_id)
+            while len(self._builders) > self.max_size:
+                self._builders.popitem(last=False)
+            return builder
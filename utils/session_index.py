@@ -0,0 +1,177 @@
+"""
+Session manifest index for the JSON file storage backend.
+An append-only NDJSON manifest (session_id -> created_at, stage flags, file
+size) is updated on every write. Status checks, listing and counting are
+answered from memory instead of globbing data/responses and parsing files.
+
+Every worker keeps its own in-memory copy and catches up by reading only the
+bytes appended since its last read; compaction rewrites the manifest
+atomically and the other workers reload it when they see the new inode.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.fileio import atomic_write_text, file_lock
+
+
+def manifest_entry(session_data: Dict, size: int) -> Dict:
+    """Builds the compact manifest entry for one session."""
+    return {
+        "id": session_data["session_id"],
+        "created_at": session_data.get("created_at"),
+        "pre": session_data.get("pre_questionnaire") is not None,
+        "chat": session_data.get("chat_completed_at") is not None,
+        "post": session_data.get("post_questionnaire") is not None,
+        "size": size,
+    }
+
+
+def is_complete(entry: Dict) -> bool:
+    """True if all three stages of a session are completed."""
+    return entry["pre"] and entry["chat"] and entry["post"]
+
+
+class SessionIndex:
+    """In-memory session manifest, kept in sync with an append-only file."""
+
+    def __init__(self, data_dir, compact_min_lines: int = 1000):
+        """
+        Args:
+            data_dir: Directory with the session JSON files
+            compact_min_lines: Manifest lines before compaction is considered
+        """
+        self.data_dir = Path(data_dir)
+        self.path = self.data_dir / ".manifest.ndjson"
+        self.lock_path = self.data_dir / ".locks" / "manifest.lock"
+        self.compact_min_lines = compact_min_lines
+
+        self._entries: Dict[str, Dict] = {}
+        self._offset = 0
+        self._inode = None
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _apply_lines(self, data: bytes):
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self._entries[entry["id"]] = entry
+            self._lines += 1
+
+    def _refresh(self):
+        """Reads manifest bytes appended since the last refresh (caller holds _lock)."""
+        try:
+            stat_result = os.stat(self.path)
+        except FileNotFoundError:
+            self._rebuild()
+            return
+
+        if stat_result.st_ino != self._inode or stat_result.st_size < self._offset:
+            # First load or manifest replaced by compaction
+            self._entries = {}
+            self._offset = 0
+            self._lines = 0
+            self._inode = stat_result.st_ino
+
+        if stat_result.st_size == self._offset:
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(stat_result.st_size - self._offset)
+
+        # Only consume complete lines; a concurrent append may be mid-write
+        end = data.rfind(b"\n") + 1
+        self._apply_lines(data[:end])
+        self._offset += end
+
+    def _rebuild(self):
+        """Creates the manifest from the existing session files (one-time migration)."""
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        with file_lock(self.lock_path):
+            if self.path.exists():
+                # Another worker created it while we waited for the lock
+                return self._refresh()
+
+            lines = []
+            for file_path in self.data_dir.glob("*.json"):
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        session_data = json.load(f)
+                    lines.append(json.dumps(manifest_entry(session_data, file_path.stat().st_size)))
+                except (OSError, ValueError, KeyError):
+                    continue
+            atomic_write_text(self.path, "".join(line + "\n" for line in lines))
+        self._refresh()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Returns the manifest entry of a session, or None if it has no data file."""
+        with self._lock:
+            self._refresh()
+            return self._entries.get(session_id)
+
+    def list_sessions(self, completed_only: bool = False) -> List[str]:
+        """Returns indexed session IDs in creation order."""
+        with self._lock:
+            self._refresh()
+            if completed_only:
+                return [sid for sid, entry in self._entries.items() if is_complete(entry)]
+            return list(self._entries)
+
+    def count(self, completed_only: bool = False) -> int:
+        """Returns the number of indexed sessions."""
+        with self._lock:
+            self._refresh()
+            if completed_only:
+                return sum(1 for entry in self._entries.values() if is_complete(entry))
+            return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def record(self, session_data: Dict, size: int):
+        """
+        Appends the current state of a session to the manifest.
+
+        Args:
+            session_data: Session data just written
+            size: Size of the session file in bytes
+        """
+        line = (json.dumps(manifest_entry(session_data, size)) + "\n").encode('utf-8')
+
+        with self._lock:
+            # Builds the manifest from existing files first if it is missing
+            self._refresh()
+            with file_lock(self.lock_path):
+                fd = os.open(str(self.path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+            self._refresh()
+
+            if self._lines > max(self.compact_min_lines, 2 * len(self._entries)):
+                self._compact()
+
+    def _compact(self):
+        """Rewrites the manifest with one line per session (caller holds _lock)."""
+        with file_lock(self.lock_path):
+            self._refresh()
+            atomic_write_text(
+                self.path,
+                "".join(json.dumps(entry) + "\n" for entry in self._entries.values())
+            )
+        self._refresh()
@@ -0,0 +1,52 @@
+"""
+Thread-local SQLite connections shared by the SQLite-backed components
+(storage backend, rate limiter). Connections use WAL mode and are reopened
+after a fork, so Gunicorn workers never share a connection.
+"""
+
+import os
+import sqlite3
+import stat
+import threading
+from pathlib import Path
+
+
+class ThreadLocalConnection:
+    """One autocommit SQLite connection per thread and process."""
+
+    def __init__(self, db_path, schema: str = "", synchronous: str = "NORMAL"):
+        """
+        Args:
+            db_path: Database file path
+            schema: SQL script run once per process (CREATE ... IF NOT EXISTS)
+            synchronous: PRAGMA synchronous level (NORMAL is crash-safe with WAL)
+        """
+        self.db_path = Path(db_path)
+        self.schema = schema
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        """Returns this thread's connection (reopened after a fork)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            conn.execute("PRAGMA foreign_keys=ON")
+            try:
+                os.chmod(self.db_path, stat.S_IRUSR | stat.S_IWUSR)  # 0o600
+            except OSError:
+                pass
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+
+        if self.schema and not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(self.schema)
+                    self._schema_ready = True
+        return conn
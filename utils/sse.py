@@ -0,0 +1,200 @@
+"""
+Server-Sent Events helpers for the chat stream.
+Claude streams text in deltas of a few characters; sending each one as its
+own SSE frame costs one JSON serialization, one WSGI write and usually one
+TCP segment per token. TextFrameCoalescer merges deltas that arrive within a
+short window into one frame. The first delta of a stream is always sent
+immediately, so time-to-first-token is unaffected, and a slow stream
+(deltas further apart than the window) is passed through unchanged.
+
+A closed browser tab shows up as a failed write: the WSGI server stops
+iterating and closes the generator (GeneratorExit at the pending yield).
+Where no text is flowing, heartbeat comment frames and client_disconnected()
+detect the disconnect before more upstream work is started. Under the ASGI
+bridge (asgi.py) the same happens with async generators and aclose().
+"""
+
+import asyncio
+import json
+import select
+import socket
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+# SSE comment line: ignored by the client, but a write that fails once the peer is gone
+HEARTBEAT_FRAME = ": heartbeat\n\n"
+
+# Environ keys of the ASGI bridge (asgi.py): a view that finds ASYNC_BODY_KEY may
+# store an async iterator of frames there to be sent instead of the WSGI body;
+# DISCONNECTED_KEY holds a callable that reports a client disconnect
+ASYNC_BODY_KEY = 'procrastination_agent.async_body'
+DISCONNECTED_KEY = 'procrastination_agent.disconnected'
+
+
+def sse_event(payload: Dict) -> str:
+    """One SSE data frame with a JSON payload."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection while its response was being generated."""
+
+
+def client_disconnected(environ: Dict) -> bool:
+    """
+    True if the client has closed the connection of this request.
+
+    Peeks at the socket Gunicorn exposes in the WSGI environ: the request body
+    has been read, so a readable socket with no data means the peer sent FIN.
+    Under the ASGI bridge the http.disconnect message is checked instead.
+    Always False under servers that expose neither.
+    """
+    disconnected = environ.get(DISCONNECTED_KEY)
+    if disconnected is not None:
+        return disconnected()
+    sock = environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+class TextFrameCoalescer:
+    """
+    Buffers text deltas and emits them as {'text': ...} frames.
+    Text is only released by the next add() or by flush(), so callers flush
+    whenever the text run pauses (ModelClient.stream's "pause" event) and
+    before anything else they send or wait for.
+    """
+
+    def __init__(self, window: float = 0.024, max_chars: int = 256):
+        """
+        Args:
+            window: Seconds since the last frame before buffered text is sent (0 = every delta)
+            max_chars: Buffered characters that force a frame regardless of the window
+        """
+        self.window = window
+        self.max_chars = max_chars
+        self._parts: List[str] = []
+        self._size = 0
+        self._last_flush: Optional[float] = None
+
+    def add(self, text: str) -> Optional[str]:
+        """Buffers a delta; returns a frame if one is due, else None."""
+        self._parts.append(text)
+        self._size += len(text)
+        now = time.monotonic()
+        if (self._last_flush is None or self._size >= self.max_chars
+                or now - self._last_flush >= self.window):
+            return self.flush(now)
+        return None
+
+    def due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until buffered text is due (None if nothing is buffered)."""
+        if not self._parts:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._last_flush + self.window - now)
+
+    def flush(self, now: Optional[float] = None) -> Optional[str]:
+        """Frame with all buffered text (None if nothing is buffered)."""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        self._last_flush = time.monotonic() if now is None else now
+        return sse_event({'text': text})
+
+
+class StreamedAnswer:
+    """
+    One model answer streamed to the client: relays the events of
+    ModelClient.stream() (iterate) or astream() (async iterate) as coalesced
+    text frames and keeps the text, the final message and the timings.
+
+    On the event loop buffered text is also sent once its window has passed
+    while the upstream is quiet; the blocking iterator can only flush when
+    the next event arrives.
+    """
+
+    def __init__(self, events, frames: TextFrameCoalescer):
+        """
+        Args:
+            events: Iterator or async iterator of (event, payload) from ModelClient
+            frames: Coalescer shared by all answers of the response
+        """
+        self.events = events
+        self.frames = frames
+        self.text = ""
+        self.final_message = None
+        self.started = time.perf_counter()
+        self.first_token_time: Optional[float] = None
+        self.duration: Optional[float] = None
+        self._relay = None
+        self._pending: Optional[asyncio.Future] = None
+
+    def feed(self, event: str, payload) -> Optional[str]:
+        """Takes one upstream event; returns a frame if one is due."""
+        if event == 'text':
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter() - self.started
+            self.text += payload
+            return self.frames.add(payload)
+        if event == 'message':
+            self.final_message = payload
+            self.duration = time.perf_counter() - self.started
+        # "pause" or the end of the answer: don't hold text while the upstream is quiet
+        return self.frames.flush()
+
+    def __iter__(self) -> Iterator[str]:
+        for event, payload in self.events:
+            frame = self.feed(event, payload)
+            if frame:
+                yield frame
+
+    def close(self):
+        """Stops the upstream stream (client gone)."""
+        self.events.close()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        self._relay = self._arelay()
+        return self._relay
+
+    async def _arelay(self) -> AsyncIterator[str]:
+        events = self.events.__aiter__()
+        try:
+            while True:
+                due_in = self.frames.due_in()
+                if due_in is None:
+                    next_event = events.__anext__()
+                else:
+                    # Wait for the next event, but not past the buffered text's window
+                    self._pending = asyncio.ensure_future(events.__anext__())
+                    done, _ = await asyncio.wait({self._pending}, timeout=due_in)
+                    if not done:
+                        frame = self.frames.flush()
+                        if frame:
+                            yield frame
+                    next_event, self._pending = self._pending, None
+                try:
+                    event, payload = await next_event
+                except StopAsyncIteration:
+                    return
+                frame = self.feed(event, payload)
+                if frame:
+                    yield frame
+        finally:
+            if self._pending is not None:
+                self._pending.cancel()
+                await asyncio.gather(self._pending, return_exceptions=True)
+                self._pending = None
+
+    async def aclose(self):
+        """Stops the upstream stream (client gone)."""
+        if self._relay is not None:
+            await self._relay.aclose()
+        await self.events.aclose()
@@ -0,0 +1,455 @@
+"""
+Resumable chat streams (SSE Last-Event-ID).
+Every /api/chat response gets a stream id and numbered events
+("id: <stream_id>:<seq>"). Data frames are kept in a short-lived replay
+buffer in a WAL-mode SQLite file shared by all Gunicorn workers, so a client
+whose connection dropped can reconnect to /api/chat/resume on any worker
+and receive the frames it missed, followed by the live tail while the
+answer is still being generated. No second Claude call is made.
+
+Frames are not written one by one: the producing worker keeps them in
+memory and persists them in batches (every flush_interval, at once when the
+client detaches, and when the stream ends), so the token path does not take
+the cross-process SQLite write lock per frame. Readers in the producing
+worker follow the in-memory stream and are woken per frame; readers in other
+workers poll SQLite.
+
+When the original connection fails, generation continues for a grace period
+(SSE_RESUME_GRACE) into the buffer only. If no reader attaches in time, the
+producer is closed, which cancels the upstream stream and keeps the partial
+answer (see chat_api).
+
+A stream can be opened under a client-generated idempotency key. A repeated
+POST with the same key (double click, client retry) finds the existing
+stream and replays it from the start instead of calling Claude again. Keys
+are scoped to the session and expire together with their stream.
+"""
+
+import asyncio
+import itertools
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from utils.sqlite_connection import ThreadLocalConnection
+from utils.sse import HEARTBEAT_FRAME, client_disconnected, sse_event
+
+logger = logging.getLogger(__name__)
+
+LIVE = "live"
+DONE = "done"
+ABANDONED = "abandoned"
+
+REPLAY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sse_streams (
+    stream_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    reader_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sse_streams_updated ON sse_streams(updated_at);
+CREATE TABLE IF NOT EXISTS sse_events (
+    stream_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    frame TEXT NOT NULL,
+    PRIMARY KEY (stream_id, seq)
+);
+CREATE TABLE IF NOT EXISTS sse_idempotency_keys (
+    session_id TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    stream_id TEXT NOT NULL,
+    PRIMARY KEY (session_id, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idx_sse_idempotency_stream ON sse_idempotency_keys(stream_id);
+"""
+
+EVENT_ID_PATTERN = re.compile(r"^([0-9a-f]{32}):(\d+)$")
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Splits a Last-Event-ID "<stream_id>:<seq>" (None if malformed)."""
+    match = EVENT_ID_PATTERN.match((value or "").strip())
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def with_event_id(stream_id: str, seq: int, frame: str) -> str:
+    return f"id: {stream_id}:{seq}\n{frame}"
+
+
+def stream_opened_frame(stream_id: str) -> str:
+    """Event 0 of every stream: tells the client its stream id (not stored)."""
+    return with_event_id(stream_id, 0, sse_event({'type': 'stream', 'stream_id': stream_id}))
+
+
+def valid_idempotency_key(value: Optional[str]) -> bool:
+    return bool(value) and IDEMPOTENCY_KEY_PATTERN.match(value) is not None
+
+
+class _LiveStream:
+    """Frames of a stream produced in this process (all of them, persisted or not)."""
+
+    def __init__(self):
+        self.frames: List[Tuple[int, str]] = []
+        self.status = LIVE
+        self.persisted = 0  # Leading frames already written to SQLite (writer thread only)
+        self.flushed_at = time.monotonic()
+        self.changed = threading.Condition()
+
+    def read(self, after_seq: int) -> Tuple[List[Tuple[int, str]], str, int]:
+        """Frames after after_seq, the status and the last seq."""
+        with self.changed:
+            rows = [row for row in self.frames if row[0] > after_seq]
+            return rows, self.status, self.frames[-1][0] if self.frames else 0
+
+    def wait(self, after_seq: int, timeout: float):
+        """Blocks until a frame after after_seq exists, the stream ends or timeout passes."""
+        with self.changed:
+            if self.status == LIVE and (not self.frames or self.frames[-1][0] <= after_seq):
+                self.changed.wait(timeout)
+
+
+class ReplayBuffer:
+    """Frames of recent chat streams, readable from every worker."""
+
+    def __init__(self, db_path: str, ttl_seconds: float = 300, purge_interval: int = 500,
+                 flush_interval: float = 1.0):
+        """
+        Args:
+            db_path: SQLite file shared by all workers
+            ttl_seconds: How long a stream stays resumable after its last frame
+            purge_interval: Streams opened between purges of expired streams
+            flush_interval: Seconds between batched writes of a live stream's frames
+        """
+        self._connections = ThreadLocalConnection(db_path, REPLAY_SCHEMA)
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = max(1, int(purge_interval))
+        self.flush_interval = flush_interval
+        self._opened = itertools.count(1)
+        self._live: Dict[str, _LiveStream] = {}
+        self._live_lock = threading.Lock()
+
+    def open(self, session_id: str, idempotency_key: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Registers a new live stream.
+
+        Args:
+            session_id: Owner of the stream
+            idempotency_key: Client key of the request; if a stream of this
+                session already holds it, that stream is returned instead
+
+        Returns:
+            (stream_id, created); created is False for a duplicate request
+        """
+        now = time.time()
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if idempotency_key:
+                existing = self._find(conn, session_id, idempotency_key, now)
+                if existing:
+                    return existing, False
+
+            stream_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO sse_streams (stream_id, session_id, status, updated_at) VALUES (?, ?, ?, ?)",
+                (stream_id, session_id, LIVE, now)
+            )
+            if idempotency_key:
+                # Replaces a key whose stream has expired
+                conn.execute(
+                    "INSERT OR REPLACE INTO sse_idempotency_keys (session_id, idempotency_key, stream_id) "
+                    "VALUES (?, ?, ?)",
+                    (session_id, idempotency_key, stream_id)
+                )
+            if next(self._opened) % self.purge_interval == 0:
+                expired = now - self.ttl_seconds
+                for table in ("sse_events", "sse_idempotency_keys"):
+                    conn.execute(
+                        f"DELETE FROM {table} WHERE stream_id IN "
+                        "(SELECT stream_id FROM sse_streams WHERE updated_at <= ?)", (expired,)
+                    )
+                conn.execute("DELETE FROM sse_streams WHERE updated_at <= ?", (expired,))
+        return stream_id, True
+
+    def _find(self, conn, session_id: str, idempotency_key: str, now: float) -> Optional[str]:
+        row = conn.execute(
+            "SELECT k.stream_id FROM sse_idempotency_keys k JOIN sse_streams s ON s.stream_id = k.stream_id "
+            "WHERE k.session_id = ? AND k.idempotency_key = ? AND s.updated_at > ?",
+            (session_id, idempotency_key, now - self.ttl_seconds)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find(self, session_id: str, idempotency_key: str) -> Optional[str]:
+        """Stream of a previous request with this key (None if unknown or expired)."""
+        return self._find(self._connections.get(), session_id, idempotency_key, time.time())
+
+    # ------------------------------------------------------------------
+    # Writer side (one producer per stream, in the worker that opened it)
+    # ------------------------------------------------------------------
+
+    def append(self, stream_id: str, seq: int, frame: str, flush: bool = True) -> bool:
+        """
+        Adds a frame in memory (waking local readers); persists a batch every flush_interval.
+
+        Args:
+            flush: Persist a due batch here (False: the caller does, e.g. off the event loop)
+
+        Returns:
+            bool: True if a batch is due and was not persisted
+        """
+        with self._live_lock:
+            live = self._live.setdefault(stream_id, _LiveStream())
+        with live.changed:
+            live.frames.append((seq, frame))
+            live.changed.notify_all()
+        if time.monotonic() - live.flushed_at < self.flush_interval:
+            return False
+        if not flush:
+            return True
+        self.flush(stream_id)
+        return False
+
+    @staticmethod
+    def _unpersisted(live: Optional[_LiveStream]) -> List[Tuple[int, str]]:
+        if live is None:
+            return []
+        live.flushed_at = time.monotonic()
+        with live.changed:
+            return live.frames[live.persisted:]
+
+    def _persist(self, conn, stream_id: str, rows: List[Tuple[int, str]], status: Optional[str] = None):
+        conn.executemany(
+            "INSERT INTO sse_events (stream_id, seq, frame) VALUES (?, ?, ?)",
+            [(stream_id, seq, frame) for seq, frame in rows]
+        )
+        if rows:
+            conn.execute(
+                "UPDATE sse_streams SET last_seq = ?, updated_at = ? WHERE stream_id = ?",
+                (rows[-1][0], time.time(), stream_id)
+            )
+        if status:
+            conn.execute(
+                "UPDATE sse_streams SET status = ?, updated_at = ? WHERE stream_id = ?",
+                (status, time.time(), stream_id)
+            )
+
+    def flush(self, stream_id: str):
+        """Writes the frames not yet persisted in one transaction."""
+        with self._live_lock:
+            live = self._live.get(stream_id)
+        rows = self._unpersisted(live)
+        if not rows:
+            return
+        conn = self._connections.get()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._persist(conn, stream_id, rows)
+        live.persisted += len(rows)
+
+    def finish(self, stream_id: str, status: str):
+        """Persists the remaining frames together with the final status."""
+        with self._live_lock:
+            live = self._live.get(stream_id)
+        rows = self._unpersisted(live)
+        conn = self._connections.get()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._persist(conn, stream_id, rows, status)
+        finally:
+            if live:
+                with live.changed:
+                    live.status = status
+                    live.changed.notify_all()
+                with self._live_lock:
+                    self._live.pop(stream_id, None)
+
+    def touch_reader(self, stream_id: str):
+        """Marks that a resumed client is reading this stream."""
+        self._connections.get().execute(
+            "UPDATE sse_streams SET reader_at = ? WHERE stream_id = ?", (time.time(), stream_id)
+        )
+
+    def stream(self, stream_id: str) -> Optional[Dict]:
+        """session_id, status, last_seq and reader_at of a stream (None if unknown or expired)."""
+        row = self._connections.get().execute(
+            "SELECT session_id, status, last_seq, reader_at FROM sse_streams "
+            "WHERE stream_id = ? AND updated_at > ?",
+            (stream_id, time.time() - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"session_id": row[0], "status": row[1], "last_seq": row[2], "reader_at": row[3]}
+
+    def read(self, stream_id: str, after_seq: int) -> List[Tuple[int, str]]:
+        return self._connections.get().execute(
+            "SELECT seq, frame FROM sse_events WHERE stream_id = ? AND seq > ? ORDER BY seq",
+            (stream_id, after_seq)
+        ).fetchall()
+
+    # ------------------------------------------------------------------
+    # Resume (reader side)
+    # ------------------------------------------------------------------
+
+    def tail(self, stream_id: str, after_seq: int, error_message: str, poll_interval: float = 0.25,
+             heartbeat_interval: float = 2.0, max_seconds: float = 120.0) -> Iterator[str]:
+        """
+        Missed frames after after_seq, then new frames until the stream ends.
+        An abandoned stream (generation was cancelled) ends with an error frame.
+        Streams produced in this worker are followed in memory; others are
+        polled from SQLite every poll_interval.
+        """
+        last_seq = after_seq
+        started = last_frame = time.monotonic()
+        last_touch = 0.0
+        while True:
+            with self._live_lock:
+                live = self._live.get(stream_id)
+            if live is not None:
+                rows, status, final_seq = live.read(last_seq)
+            else:
+                rows = self.read(stream_id, last_seq)
+                info = self.stream(stream_id)
+                if info is None:
+                    return
+                status, final_seq = info["status"], info["last_seq"]
+
+            for seq, frame in rows:
+                yield with_event_id(stream_id, seq, frame)
+                last_seq = seq
+                last_frame = time.monotonic()
+
+            if status != LIVE and final_seq <= last_seq:
+                if status == ABANDONED:
+                    yield sse_event({'type': 'error', 'message': error_message})
+                return
+
+            now = time.monotonic()
+            if now - started > max_seconds:
+                return
+            if now - last_touch >= 1.0:
+                self.touch_reader(stream_id)
+                last_touch = now
+            if now - last_frame >= heartbeat_interval:
+                yield HEARTBEAT_FRAME
+                last_frame = now
+            if live is not None:
+                live.wait(last_seq, min(1.0, max(0.0, heartbeat_interval - (now - last_frame))))
+            else:
+                time.sleep(poll_interval)
+
+
+class ReplayStream:
+    """
+    Writer side of one resumable stream: numbers and records the frames of a
+    producer generator and keeps it running briefly after a disconnect.
+    """
+
+    def __init__(self, buffer: ReplayBuffer, stream_id: str, environ: Dict, grace_seconds: float = 10.0):
+        """
+        Args:
+            buffer: Shared replay buffer
+            stream_id: Stream returned by buffer.open()
+            environ: WSGI environ of the original request (for disconnect checks)
+            grace_seconds: Generation continues this long after a disconnect while
+                no resumed reader is attached (0 = stop at once)
+        """
+        self.buffer = buffer
+        self.environ = environ
+        self.grace_seconds = grace_seconds
+        self.stream_id = stream_id
+        self.detached_at: Optional[float] = None
+        self.gave_up = False
+        self._seq = 0
+        self._last_check = 0.0
+
+    def _record(self, frame: str) -> str:
+        """Buffers a data frame and returns it with its event id (comments pass through)."""
+        if not frame.startswith("data:"):
+            return frame
+        self._seq += 1
+        self.buffer.append(self.stream_id, self._seq, frame)
+        return with_event_id(self.stream_id, self._seq, frame)
+
+    async def _arecord(self, frame: str) -> str:
+        """_record() on the event loop: SQLite writes run in a thread."""
+        if not frame.startswith("data:"):
+            return frame
+        self._seq += 1
+        if self.buffer.append(self.stream_id, self._seq, frame, flush=False):
+            await asyncio.to_thread(self.buffer.flush, self.stream_id)
+        return with_event_id(self.stream_id, self._seq, frame)
+
+    def abandoned(self) -> bool:
+        """
+        True once nobody will read the rest of the answer: the original client
+        is gone and no resumed reader was active within the grace period.
+        """
+        if self.gave_up:
+            return True
+        now = time.time()
+        if self.detached_at is None:
+            if not client_disconnected(self.environ):
+                return False
+            self.detached_at = now
+        info = self.buffer.stream(self.stream_id) or {}
+        last_seen = max(self.detached_at, info.get("reader_at") or 0.0)
+        self.gave_up = now - last_seen >= self.grace_seconds
+        return self.gave_up
+
+    def pump(self, frames: Iterator[str]) -> Iterator[str]:
+        """
+        Yields the producer's frames with event ids. If the client connection
+        fails, keeps consuming the producer into the buffer until it finishes
+        or abandoned() gives up, then closes it.
+        """
+        try:
+            yield stream_opened_frame(self.stream_id)
+            for frame in frames:
+                yield self._record(frame)
+        except GeneratorExit:
+            # Original connection gone: generate into the buffer for a resumed reader
+            if self.detached_at is None:
+                self.detached_at = time.time()
+            logger.info(f"Stream {self.stream_id} detached, waiting up to {self.grace_seconds:g}s for a resume")
+            # A resumed reader may be on another worker: persist what it missed now
+            self.buffer.flush(self.stream_id)
+            for frame in frames:
+                self._record(frame)
+                # Check and persist at most every 250 ms (one SQLite read, one batched write)
+                if time.monotonic() - self._last_check >= 0.25:
+                    self._last_check = time.monotonic()
+                    self.buffer.flush(self.stream_id)
+                    if self.abandoned():
+                        break
+            frames.close()
+        finally:
+            self.buffer.finish(self.stream_id, ABANDONED if self.gave_up else DONE)
+
+    async def apump(self, frames: AsyncIterator[str]) -> AsyncIterator[str]:
+        """pump() for an async producer (ASGI bridge); closed with aclose()."""
+        try:
+            yield stream_opened_frame(self.stream_id)
+            async for frame in frames:
+                yield await self._arecord(frame)
+        except GeneratorExit:
+            if self.detached_at is None:
+                self.detached_at = time.time()
+            logger.info(f"Stream {self.stream_id} detached, waiting up to {self.grace_seconds:g}s for a resume")
+            await asyncio.to_thread(self.buffer.flush, self.stream_id)
+            async for frame in frames:
+                await self._arecord(frame)
+                if time.monotonic() - self._last_check >= 0.25:
+                    self._last_check = time.monotonic()
+                    await asyncio.to_thread(self.buffer.flush, self.stream_id)
+                    if await asyncio.to_thread(self.abandoned):
+                        break
+            await frames.aclose()
+        finally:
+            await asyncio.to_thread(self.buffer.finish, self.stream_id, ABANDONED if self.gave_up else DONE)
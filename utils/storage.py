@@ -1,42 +1,70 @@
 """
 Data storage utilities for questionnaire responses.
-Handles saving and loading session data to/from JSON files.
+Handles saving and loading session data through a pluggable backend:
+JSON files (default) or SQLite, selected via STORAGE_BACKEND.
 """
 
-import json
-import os
-import stat
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List
+
+from config.performance import STORAGE_BACKEND, STORAGE_SQLITE_PATH, AGGREGATES_PATH
+from utils.storage_backends import (
+    StorageBackend, JSONFileBackend, SQLiteBackend, utc_timestamp
+)
+from utils.aggregates import AggregateStore, summarize
+from utils.metrics import STORAGE_WRITE_SECONDS
 
 
 # Data directory for storing JSON files
 DATA_DIR = Path("data/responses")
 
-
-def ensure_data_directory():
-    """Ensures the data directory exists."""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+_backend = None
+_aggregates = None
 
 
-def get_session_file_path(session_id: str) -> Path:
+def create_backend(name: str) -> StorageBackend:
     """
-    Returns the file path for a session's data file.
+    Creates a storage backend by name.
 
     Args:
-        session_id: UUID session identifier
+        name: "json" or "sqlite"
 
     Returns:
-        Path: Path to JSON file
+        StorageBackend: Backend instance
+    """
+    if name == "json":
+        return JSONFileBackend(DATA_DIR)
+    if name == "sqlite":
+        return SQLiteBackend(STORAGE_SQLITE_PATH)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def get_backend() -> StorageBackend:
+    """Returns the configured storage backend (created on first use)."""
+    global _backend
+    if _backend is None:
+        _backend = create_backend(STORAGE_BACKEND)
+    return _backend
+
+
+def get_aggregate_store() -> AggregateStore:
+    """
+    Returns the questionnaire aggregate store.
+    Computes the aggregates once from existing sessions if none were persisted
+    yet (or only without the session counters, written by older versions).
     """
-    ensure_data_directory()
-    return DATA_DIR / f"{session_id}.json"
+    global _aggregates
+    if _aggregates is None:
+        store = AggregateStore(AGGREGATES_PATH)
+        if not store.is_current():
+            store.rebuild(iter_all_session_data(), if_missing=True)
+        _aggregates = store
+    return _aggregates
 
 
 def load_session_data(session_id: str) -> Dict:
     """
-    Loads session data from file, or creates new empty structure.
+    Loads session data, or creates new empty structure.
 
     Args:
         session_id: UUID session identifier
@@ -44,44 +72,31 @@ def load_session_data(session_id: str) -> Dict:
     Returns:
         dict: Session data structure
     """
-    file_path = get_session_file_path(session_id)
+    return get_backend().load_session(session_id)
 
-    if file_path.exists():
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    else:
-        # Create new session structure
-        return {
-            "session_id": session_id,
-            "created_at": datetime.utcnow().isoformat() + "Z",
-            "pre_questionnaire": None,
-            "chat_completed_at": None,
-            "post_questionnaire": None
-        }
 
+def _questionnaire_data(answers: Dict[int, int]) -> Dict:
+    return {
+        "completed_at": utc_timestamp(),
+        "answers": [
+            {"question_id": q_id, "value": value}
+            for q_id, value in sorted(answers.items())
+        ]
+    }
 
-def save_session_data(session_id: str, data: Dict):
-    """
-    Saves session data to JSON file with secure permissions.
 
-    Args:
-        session_id: UUID session identifier
-        data: Session data dictionary
-    """
-    ensure_data_directory()
-    file_path = get_session_file_path(session_id)
+def _save_questionnaire(session_id: str, stage: str, answers: Dict[int, int]):
+    """Stores a questionnaire and updates the running aggregates in one step."""
+    aggregates = get_aggregate_store()
+    questionnaire_data = _questionnaire_data(answers)
 
-    # Write file
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    def write():
+        with STORAGE_WRITE_SECONDS.time(operation=stage):
+            previous = get_backend().save_questionnaire(session_id, stage, questionnaire_data)
+        return previous, {**previous, stage: questionnaire_data}
 
-    # Set secure file permissions (owner read/write only: 0o600)
-    # This prevents other users on the system from reading participant data
-    try:
-        os.chmod(file_path, stat.S_IRUSR | stat.S_IWUSR)  # 0o600
-    except OSError:
-        # On Windows or if permissions can't be set, continue anyway
-        pass
+    with STORAGE_WRITE_SECONDS.time(operation='aggregates'):
+        aggregates.update(write)
 
 
 def save_pre_questionnaire(session_id: str, answers: Dict[int, int]):
@@ -92,18 +107,7 @@ def save_pre_questionnaire(session_id: str, answers: Dict[int, int]):
         session_id: UUID session identifier
         answers: Dictionary mapping question_id to answer value (1-7)
     """
-    session_data = load_session_data(session_id)
-
-    questionnaire_data = {
-        "completed_at": datetime.utcnow().isoformat() + "Z",
-        "answers": [
-            {"question_id": q_id, "value": value}
-            for q_id, value in sorted(answers.items())
-        ]
-    }
-
-    session_data["pre_questionnaire"] = questionnaire_data
-    save_session_data(session_id, session_data)
+    _save_questionnaire(session_id, "pre_questionnaire", answers)
 
 
 def save_post_questionnaire(session_id: str, answers: Dict[int, int]):
@@ -114,18 +118,7 @@ def save_post_questionnaire(session_id: str, answers: Dict[int, int]):
         session_id: UUID session identifier
         answers: Dictionary mapping question_id to answer value (1-7)
     """
-    session_data = load_session_data(session_id)
-
-    questionnaire_data = {
-        "completed_at": datetime.utcnow().isoformat() + "Z",
-        "answers": [
-            {"question_id": q_id, "value": value}
-            for q_id, value in sorted(answers.items())
-        ]
-    }
-
-    session_data["post_questionnaire"] = questionnaire_data
-    save_session_data(session_id, session_data)
+    _save_questionnaire(session_id, "post_questionnaire", answers)
 
 
 def mark_chat_complete(session_id: str):
@@ -135,9 +128,15 @@ def mark_chat_complete(session_id: str):
     Args:
         session_id: UUID session identifier
     """
-    session_data = load_session_data(session_id)
-    session_data["chat_completed_at"] = datetime.utcnow().isoformat() + "Z"
-    save_session_data(session_id, session_data)
+    aggregates = get_aggregate_store()
+    completed_at = utc_timestamp()
+
+    def write():
+        with STORAGE_WRITE_SECONDS.time(operation='chat_complete'):
+            previous = get_backend().mark_chat_complete(session_id, completed_at)
+        return previous, {**previous, "chat_completed_at": completed_at}
+
+    aggregates.update(write)
 
 
 def get_session_status(session_id: str) -> Dict[str, bool]:
@@ -150,35 +149,75 @@ def get_session_status(session_id: str) -> Dict[str, bool]:
     Returns:
         dict: Status dictionary with boolean flags
     """
-    session_data = load_session_data(session_id)
+    return get_backend().get_session_status(session_id)
 
-    return {
-        "has_pre_questionnaire": session_data.get("pre_questionnaire") is not None,
-        "has_chat_completion": session_data.get("chat_completed_at") is not None,
-        "has_post_questionnaire": session_data.get("post_questionnaire") is not None,
-    }
 
-
-def list_all_sessions() -> List[str]:
+def list_all_sessions(completed_only: bool = False) -> List[str]:
     """
-    Returns a list of all session IDs with data files.
+    Returns a list of all stored session IDs.
+
+    Args:
+        completed_only: Only sessions with pre-questionnaire, chat and post-questionnaire
 
     Returns:
         list: List of session ID strings
     """
-    ensure_data_directory()
-    session_files = DATA_DIR.glob("*.json")
-    return [f.stem for f in session_files]  # stem = filename without extension
+    return get_backend().list_sessions(completed_only)
+
+
+def count_sessions(completed_only: bool = False) -> int:
+    """
+    Returns the number of stored sessions (index lookup, no file scan).
+
+    Args:
+        completed_only: Only count sessions with all stages completed
+
+    Returns:
+        int: Number of sessions
+    """
+    return get_backend().count_sessions(completed_only)
+
+
+def iter_all_session_data(completed_only: bool = False) -> Iterator[Dict]:
+    """
+    Yields all session data one session at a time.
+
+    Args:
+        completed_only: Only sessions with all stages completed
+
+    Returns:
+        iterator: Session data dictionaries
+    """
+    return get_backend().iter_sessions(completed_only)
 
 
 def get_all_session_data() -> List[Dict]:
     """
-    Loads all session data files for analysis.
+    Loads all session data for analysis.
 
     Returns:
         list: List of session data dictionaries
     """
-    sessions = []
-    for session_id in list_all_sessions():
-        sessions.append(load_session_data(session_id))
-    return sessions
+    return list(iter_all_session_data())
+
+
+def get_questionnaire_aggregates() -> Dict:
+    """
+    Returns running questionnaire statistics (constant time, no session scan).
+
+    Returns:
+        dict: count / mean / variance / sd per question for "pre", "post"
+              and paired pre -> post "delta" (questions repeated in both)
+    """
+    return summarize(get_aggregate_store().load())
+
+
+def get_session_counts() -> Dict[str, int]:
+    """
+    Returns the number of stored and completed sessions (constant time,
+    kept next to the aggregates and updated in the same write).
+
+    Returns:
+        dict: {"total": int, "completed": int}
+    """
+    return dict(get_aggregate_store().load()["sessions"])
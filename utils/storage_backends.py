@@ -0,0 +1,312 @@
+"""
+Storage backends for questionnaire responses.
+- JSONFileBackend: one pretty-printed JSON file per session (default)
+- SQLiteBackend: one row per session/stage in a WAL-mode SQLite database
+
+Both return the same session data structure, see utils/storage.py.
+"""
+
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from utils.fileio import atomic_write_text, file_lock
+from utils.session_index import SessionIndex
+from utils.sqlite_connection import ThreadLocalConnection
+
+
+# Session stages stored per session
+STAGES = ("pre_questionnaire", "chat", "post_questionnaire")
+
+
+def utc_timestamp() -> str:
+    """Returns the current UTC time as ISO 8601 string with Z suffix."""
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def new_session_data(session_id: str, created_at: Optional[str] = None) -> Dict:
+    """Returns an empty session data structure."""
+    return {
+        "session_id": session_id,
+        "created_at": created_at or utc_timestamp(),
+        "pre_questionnaire": None,
+        "chat_completed_at": None,
+        "post_questionnaire": None
+    }
+
+
+def status_from_session_data(session_data: Dict) -> Dict[str, bool]:
+    """Computes the stage completion flags of a session data structure."""
+    return {
+        "has_pre_questionnaire": session_data.get("pre_questionnaire") is not None,
+        "has_chat_completion": session_data.get("chat_completed_at") is not None,
+        "has_post_questionnaire": session_data.get("post_questionnaire") is not None,
+    }
+
+
+class StorageBackend:
+    """Interface implemented by all storage backends."""
+
+    def load_session(self, session_id: str) -> Dict:
+        """Loads session data, or returns a new empty structure."""
+        raise NotImplementedError
+
+    def save_questionnaire(self, session_id: str, stage: str, questionnaire_data: Dict) -> Dict:
+        """
+        Stores questionnaire data for stage "pre_questionnaire" or "post_questionnaire".
+
+        Returns:
+            dict: Session data as it was before the write (for aggregate updates)
+        """
+        raise NotImplementedError
+
+    def mark_chat_complete(self, session_id: str, completed_at: str) -> Dict:
+        """
+        Stores the chat completion timestamp.
+
+        Returns:
+            dict: Session data as it was before the write (for the session counters)
+        """
+        raise NotImplementedError
+
+    def get_session_status(self, session_id: str) -> Dict[str, bool]:
+        """Returns the stage completion flags of a session."""
+        return status_from_session_data(self.load_session(session_id))
+
+    def list_sessions(self, completed_only: bool = False) -> List[str]:
+        """Returns stored session IDs (optionally only sessions with all stages completed)."""
+        raise NotImplementedError
+
+    def count_sessions(self, completed_only: bool = False) -> int:
+        """Returns the number of stored sessions."""
+        return len(self.list_sessions(completed_only))
+
+    def iter_sessions(self, completed_only: bool = False) -> Iterator[Dict]:
+        """Yields stored sessions one at a time."""
+        for session_id in self.list_sessions(completed_only):
+            yield self.load_session(session_id)
+
+
+# ============================================================================
+# JSON files
+# ============================================================================
+
+class JSONFileBackend(StorageBackend):
+    """
+    One JSON file per session in a data directory.
+
+    Every read-modify-write runs under a per-session inter-process lock and
+    files are replaced atomically, so concurrent workers never lose an
+    update or leave a truncated file behind. Status, listing and counting
+    are served from the session manifest (utils/session_index.py).
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self.lock_dir = self.data_dir / ".locks"
+        self.index = SessionIndex(self.data_dir)
+
+    def ensure_data_directory(self):
+        """Ensures the data directory exists."""
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+    def get_session_file_path(self, session_id: str) -> Path:
+        """Returns the file path for a session's data file."""
+        self.ensure_data_directory()
+        return self.data_dir / f"{session_id}.json"
+
+    @contextmanager
+    def session_lock(self, session_id: str):
+        """Exclusive per-session lock, held across threads and worker processes."""
+        with file_lock(self.lock_dir / f"{session_id}.lock"):
+            yield
+
+    def load_session(self, session_id: str) -> Dict:
+        file_path = self.get_session_file_path(session_id)
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return new_session_data(session_id)
+
+    def save_session(self, session_id: str, data: Dict):
+        """
+        Saves session data atomically (temp file + fsync + rename).
+        The file is created with owner-only permissions (0o600) so other
+        users on the system cannot read participant data.
+        """
+        file_path = self.get_session_file_path(session_id)
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+        atomic_write_text(file_path, text)
+        self.index.record(data, len(text.encode('utf-8')))
+
+    def save_questionnaire(self, session_id: str, stage: str, questionnaire_data: Dict) -> Dict:
+        with self.session_lock(session_id):
+            previous = self.load_session(session_id)
+            self.save_session(session_id, {**previous, stage: questionnaire_data})
+        return previous
+
+    def mark_chat_complete(self, session_id: str, completed_at: str) -> Dict:
+        with self.session_lock(session_id):
+            previous = self.load_session(session_id)
+            self.save_session(session_id, {**previous, "chat_completed_at": completed_at})
+        return previous
+
+    def get_session_status(self, session_id: str) -> Dict[str, bool]:
+        entry = self.index.get(session_id) or {}
+        return {
+            "has_pre_questionnaire": entry.get("pre", False),
+            "has_chat_completion": entry.get("chat", False),
+            "has_post_questionnaire": entry.get("post", False),
+        }
+
+    def list_sessions(self, completed_only: bool = False) -> List[str]:
+        self.ensure_data_directory()
+        return self.index.list_sessions(completed_only)
+
+    def count_sessions(self, completed_only: bool = False) -> int:
+        self.ensure_data_directory()
+        return self.index.count(completed_only)
+
+
+# ============================================================================
+# SQLite
+# ============================================================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_stages (
+    session_id TEXT NOT NULL REFERENCES sessions(session_id),
+    stage TEXT NOT NULL,
+    completed_at TEXT NOT NULL,
+    answers TEXT,
+    PRIMARY KEY (session_id, stage)
+);
+CREATE INDEX IF NOT EXISTS idx_session_stages_stage ON session_stages(stage, session_id);
+"""
+
+# Sessions with a row for every stage (answered from the primary key index)
+COMPLETED_SESSIONS_QUERY = (
+    "SELECT session_id FROM session_stages GROUP BY session_id HAVING COUNT(*) = ?"
+)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    One row per session and one row per completed stage.
+
+    Writes are single-row upserts; listing and status checks are indexed
+    queries. WAL mode lets readers run concurrently with a writer, also
+    across Gunicorn worker processes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._connections = ThreadLocalConnection(self.db_path, SQLITE_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection."""
+        return self._connections.get()
+
+    def _upsert_stage(self, session_id: str, stage: str, completed_at: str, answers: Optional[List]) -> Dict:
+        """Upserts one stage row; returns the session as it was before."""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            previous = self.load_session(session_id)
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at) VALUES (?, ?)",
+                (session_id, utc_timestamp())
+            )
+            conn.execute(
+                "INSERT INTO session_stages (session_id, stage, completed_at, answers) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(session_id, stage) DO UPDATE SET "
+                "completed_at = excluded.completed_at, answers = excluded.answers",
+                (session_id, stage, completed_at, None if answers is None else json.dumps(answers))
+            )
+        return previous
+
+    @staticmethod
+    def _apply_stage(session_data: Dict, stage: str, completed_at: str, answers: Optional[str]):
+        if stage == "chat":
+            session_data["chat_completed_at"] = completed_at
+        else:
+            session_data[stage] = {
+                "completed_at": completed_at,
+                "answers": json.loads(answers) if answers else []
+            }
+
+    def load_session(self, session_id: str) -> Dict:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT created_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return new_session_data(session_id)
+
+        session_data = new_session_data(session_id, row[0])
+        for stage, completed_at, answers in conn.execute(
+            "SELECT stage, completed_at, answers FROM session_stages WHERE session_id = ?", (session_id,)
+        ):
+            self._apply_stage(session_data, stage, completed_at, answers)
+        return session_data
+
+    def save_questionnaire(self, session_id: str, stage: str, questionnaire_data: Dict) -> Dict:
+        return self._upsert_stage(session_id, stage, questionnaire_data["completed_at"], questionnaire_data["answers"])
+
+    def mark_chat_complete(self, session_id: str, completed_at: str) -> Dict:
+        return self._upsert_stage(session_id, "chat", completed_at, None)
+
+    def get_session_status(self, session_id: str) -> Dict[str, bool]:
+        stages = {
+            row[0] for row in self._connection().execute(
+                "SELECT stage FROM session_stages WHERE session_id = ?", (session_id,)
+            )
+        }
+        return {
+            "has_pre_questionnaire": "pre_questionnaire" in stages,
+            "has_chat_completion": "chat" in stages,
+            "has_post_questionnaire": "post_questionnaire" in stages,
+        }
+
+    def list_sessions(self, completed_only: bool = False) -> List[str]:
+        if completed_only:
+            query = COMPLETED_SESSIONS_QUERY
+        else:
+            query = "SELECT session_id FROM sessions"
+        return [row[0] for row in self._connection().execute(query, (len(STAGES),) if completed_only else ())]
+
+    def count_sessions(self, completed_only: bool = False) -> int:
+        if completed_only:
+            query, params = f"SELECT COUNT(*) FROM ({COMPLETED_SESSIONS_QUERY})", (len(STAGES),)
+        else:
+            query, params = "SELECT COUNT(*) FROM sessions", ()
+        return self._connection().execute(query, params).fetchone()[0]
+
+    def iter_sessions(self, completed_only: bool = False) -> Iterator[Dict]:
+        """Streams sessions with one ordered join instead of one query per session."""
+        where = f"WHERE s.session_id IN ({COMPLETED_SESSIONS_QUERY}) " if completed_only else ""
+        cursor = self._connection().execute(
+            "SELECT s.session_id, s.created_at, st.stage, st.completed_at, st.answers "
+            "FROM sessions s LEFT JOIN session_stages st ON st.session_id = s.session_id "
+            + where +
+            "ORDER BY s.session_id",
+            (len(STAGES),) if completed_only else ()
+        )
+        current = None
+        for session_id, created_at, stage, completed_at, answers in cursor:
+            if current is None or current["session_id"] != session_id:
+                if current is not None:
+                    yield current
+                current = new_session_data(session_id, created_at)
+            if stage is not None:
+                self._apply_stage(current, stage, completed_at, answers)
+        if current is not None:
+            yield current